@@ -2,30 +2,195 @@
 
 from __future__ import annotations
 
+import contextlib
 import hashlib
 import json
 import logging
 import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Iterator, NamedTuple, Optional, cast
 
 import openai
 
-from autobot.utils import cache
+from autobot.models import get_model
+from autobot.streaming import Cancellation
+from autobot.tokens import count_tokens
+from autobot.utils import cache, client, metrics, profiling, recording
 
+# A check over the text streamed so far, which returns a Cancellation if generation
+# should stop early.
+Monitor = Callable[[str], Optional[Cancellation]]
 
-def init() -> None:
-    openai.organization = os.environ["OPENAI_ORGANIZATION"]
-    openai.api_key = os.environ["OPENAI_API_KEY"]
 
+class RateLimiter:
+    """Spaces out requests to stay within a requests-per-minute limit."""
 
-def create_completion(
+    def __init__(self, requests_per_minute: float) -> None:
+        self.interval = 60.0 / requests_per_minute
+        self.lock = threading.Lock()
+        self.next_request_time = 0.0
+
+    def wait(self) -> None:
+        """Block until the next request can be sent."""
+        with self.lock:
+            now = time.monotonic()
+            request_time = max(now, self.next_request_time)
+            self.next_request_time = request_time + self.interval
+        time.sleep(request_time - now)
+
+
+class Resolution(NamedTuple):
+    """A completion resolved on behalf of a caller."""
+
+    model: str
+    # Whether the completion was served from the cache (or by a concurrent request for
+    # the same completion), rather than requested from the API.
+    cached: bool
+    # The time (in seconds) taken to resolve the completion.
+    seconds: float
+
+
+_client: client.CompletionClient | None = None
+_rate_limiter: RateLimiter | None = None
+_recorder: recording.Recorder | None = None
+
+# Map from request key to the pending response, for requests that are in flight.
+_in_flight: dict[str, Future[openai.Completion]] = {}
+_in_flight_lock = threading.Lock()
+_replayer: recording.Replayer | None = None
+# Whether to stream completions (for requests that provide a monitor).
+_stream: bool = False
+# Whether to keep the client (and its connections) open across runs.
+_keep_alive: bool = False
+# The completions resolved on each thread, while tracked (see `track`).
+_tracked = threading.local()
+# Whether each thread bypasses the cache (see `bypass_cache`).
+_bypassed = threading.local()
+
+
+def init(
+    *,
+    rate_limit: float | None = None,
+    record: str | None = None,
+    replay: str | None = None,
+    replay_latency: bool = False,
+    stream: bool = False,
+    api_base: str | None = None,
+    api_key: str | None = None,
+    organization: str | None = None,
+    pool_size: int = 8,
+) -> None:
+    """Configure the API client.
+
+    Args:
+        rate_limit: The maximum number of requests per minute.
+        record: A path to which to record every request and response.
+        replay: A path from which to serve recorded responses, in lieu of the API.
+        replay_latency: Whether to reproduce the original latency of replayed responses.
+        stream: Whether to stream completions, such that they can be cancelled early.
+        api_base: The base URL of the API. (Defaults to `OPENAI_API_BASE`, if set.)
+        api_key: The API key with which to authenticate. (Defaults to
+            `OPENAI_API_KEY`.)
+        organization: The organization to bill. (Defaults to `OPENAI_ORGANIZATION`.)
+        pool_size: The maximum number of connections to keep alive (i.e., the number
+            of threads that issue requests concurrently).
+    """
+    global _client, _rate_limiter, _recorder, _replayer, _stream
+
+    _replayer = None
+    if replay is not None:
+        # Replayed runs are served entirely from the recording.
+        _replayer = recording.Replayer(replay, latency=replay_latency)
+    else:
+        api_base = (
+            api_base or os.environ.get("OPENAI_API_BASE") or client.DEFAULT_API_BASE
+        )
+        api_key = api_key or os.environ["OPENAI_API_KEY"]
+        organization = organization or os.environ["OPENAI_ORGANIZATION"]
+        if _client is None or (_client.api_base, _client.api_key) != (
+            api_base,
+            api_key,
+        ):
+            if _client is not None:
+                _client.close()
+            _client = client.CompletionClient(
+                api_base=api_base,
+                api_key=api_key,
+                organization=organization,
+                pool_size=pool_size,
+            )
+    _rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+    _recorder = recording.Recorder(record) if record is not None else None
+    _stream = stream
+
+
+def is_initialized() -> bool:
+    """Return True if the API client has been configured (via `init`)."""
+    return _client is not None or _replayer is not None
+
+
+def keep_alive() -> None:
+    """Keep the client (and its connections) open across runs, for use in a long-lived
+    process."""
+    global _keep_alive
+
+    _keep_alive = True
+
+
+def close() -> None:
+    """Flush and close any open recording, along with any open connections."""
+    global _client, _recorder
+
+    if _recorder is not None:
+        _recorder.close()
+        _recorder = None
+    if _client is not None and not _keep_alive:
+        _client.close()
+        _client = None
+
+
+@contextlib.contextmanager
+def track() -> Iterator[list[Resolution]]:
+    """Collect the completions resolved on the current thread, within the context."""
+    previous = getattr(_tracked, "resolutions", None)
+    resolutions: list[Resolution] = []
+    _tracked.resolutions = resolutions
+    try:
+        yield resolutions
+    finally:
+        _tracked.resolutions = previous
+
+
+@contextlib.contextmanager
+def bypass_cache() -> Iterator[None]:
+    """Neither read from nor write to the cache (including its leases), for the
+    completions requested on the current thread within the context."""
+    previous = getattr(_bypassed, "active", False)
+    _bypassed.active = True
+    try:
+        yield
+    finally:
+        _bypassed.active = previous
+
+
+def _track(model: str, *, cached: bool, start: float) -> None:
+    resolutions: list[Resolution] | None = getattr(_tracked, "resolutions", None)
+    if resolutions is not None:
+        resolutions.append(Resolution(model, cached, time.perf_counter() - start))
+
+
+def request_hash(
     prompt: str,
     max_tokens: int,
     *,
-    temperature: int = 0,
+    temperature: float = 0,
     model: str = "text-davinci-002",
     stop: str | list[str] | None = None,
-) -> openai.Completion:
-    request_hash = hashlib.md5(
+) -> str:
+    """Return the key under which a completion request is cached."""
+    return hashlib.md5(
         json.dumps({
             "prompt": prompt,
             "max_tokens": max_tokens,
@@ -35,16 +200,265 @@ def create_completion(
         }).encode("utf-8")
     ).hexdigest()
 
-    if response := cache.get_from_cache(request_hash):
+
+def create_completion(
+    prompt: str,
+    max_tokens: int,
+    *,
+    temperature: float = 0,
+    model: str = "text-davinci-002",
+    stop: str | list[str] | None = None,
+    monitor: Monitor | None = None,
+) -> openai.Completion:
+    """Request a completion, via the cache.
+
+    If streaming is enabled and a monitor is provided, the completion is streamed, and
+    cancelled as soon as the monitor says so. Cancelled completions are never cached.
+    """
+    request = {
+        "model": model,
+        "prompt": prompt,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "stop": stop,
+    }
+    key = request_hash(
+        prompt, max_tokens, temperature=temperature, model=model, stop=stop
+    )
+
+    # Replayed runs bypass the cache, such that they're deterministic.
+    if _replayer is not None:
+        start = time.perf_counter()
+        metrics.increment("autobot_api_requests_total", model=model)
+        with metrics.timer("autobot_api_latency_seconds", model=model):
+            with profiling.span("replay", "api", model=model, max_tokens=max_tokens):
+                replayed = cast(openai.Completion, _replayer.replay(key))
+        _record_usage(replayed, model=model)
+        _track(model, cached=False, start=start)
+        return replayed
+
+    start = time.perf_counter()
+    use_cache = not getattr(_bypassed, "active", False)
+    if use_cache and (response := cache.get_from_cache(key)):
         logging.info("Reading response from cache...")
+        _record_exchange(key, request, response, start=start, cached=True)
+        return response
+
+    # If another thread is already requesting the same completion, wait for its
+    # response rather than issuing a duplicate request.
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        is_leader = future is None
+        if future is None:
+            future = _in_flight[key] = Future()
+    if not is_leader:
+        metrics.increment("autobot_api_coalesced_total", scope="thread")
+        response = future.result()
+        _record_exchange(key, request, response, start=start, cached=True)
         return response
 
-    response = openai.Completion.create(
+    try:
+        response = (
+            _request_with_lease(key, request, start=start, monitor=monitor)
+            if use_cache
+            else _request(key, request, monitor=monitor, store=False)
+        )
+        future.set_result(response)
+        return response
+    except BaseException as error:
+        future.set_exception(error)
+        raise
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+
+
+def _request_with_lease(
+    key: str, request: dict[str, Any], *, start: float, monitor: Monitor | None = None
+) -> openai.Completion:
+    """Request a completion, unless another process is already requesting it.
+
+    Processes that share a cache coordinate via lease files: the first to claim a key
+    sends the request, while the others wait for its response to land in the cache.
+    """
+    while not cache.acquire_lease(key):
+        metrics.increment("autobot_api_coalesced_total", scope="process")
+        with profiling.span("wait", "api", key=key):
+            cache.wait_for_lease(key)
+        if response := cache.get_from_cache(key):
+            _record_exchange(key, request, response, start=start, cached=True)
+            return response
+        # Otherwise, the lease was released without a response (e.g., the request
+        # failed), so try to claim it.
+
+    try:
+        # Check the cache once more, in case the response landed after our first check.
+        if response := cache.get_from_cache(key):
+            _record_exchange(key, request, response, start=start, cached=True)
+            return response
+        return _request(key, request, monitor=monitor)
+    finally:
+        cache.release_lease(key)
+
+
+def _request(
+    key: str,
+    request: dict[str, Any],
+    *,
+    monitor: Monitor | None = None,
+    store: bool = True,
+) -> openai.Completion:
+    """Send a completion request to the API, and cache the response (if `store` is
+    set)."""
+    model = request["model"]
+    if _rate_limiter is not None:
+        with metrics.timer("autobot_api_throttle_seconds"):
+            _rate_limiter.wait()
+
+    assert _client is not None, "The API client has not been initialized."
+    metrics.increment("autobot_api_requests_total", model=model)
+    start = time.perf_counter()
+    try:
+        with metrics.timer("autobot_api_latency_seconds", model=model):
+            with profiling.span(
+                "request", "api", model=model, max_tokens=request["max_tokens"]
+            ):
+                if _stream and monitor is not None:
+                    response, cancelled, timings = _stream_request(
+                        _client, request, monitor=monitor
+                    )
+                else:
+                    body, timings = _client.create(request)
+                    response = cast(openai.Completion, body)
+                    cancelled = False
+    except openai.error.OpenAIError as error:
+        metrics.increment(
+            "autobot_api_errors_total", model=model, error=type(error).__name__
+        )
+        raise
+    _record_timings(timings, model=model)
+    _record_usage(response, model=model)
+    _record_exchange(key, request, response, start=start, cached=False)
+    # N.B. A cancelled completion is a partial result, so never cache it.
+    if not cancelled and store:
+        cache.set_in_cache(key, response, metadata={"request": request})
+    return response
+
+
+def _stream_request(
+    completion_client: client.CompletionClient,
+    request: dict[str, Any],
+    *,
+    monitor: Monitor,
+) -> tuple[openai.Completion, bool, client.Timings]:
+    """Stream a completion, checking the text generated so far after each chunk.
+
+    Returns: a tuple of (response, whether the stream was cancelled, timings), where
+        the time to first byte is the time until the first chunk was received.
+    """
+    model = request["model"]
+    text = ""
+    finish_reason: str | None = None
+    cancellation: Cancellation | None = None
+    start = time.perf_counter()
+    ttfb: float | None = None
+    chunks = completion_client.stream(request)
+    try:
+        for chunk in chunks:
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            choice = chunk["choices"][0]
+            text += choice["text"]
+            finish_reason = choice.get("finish_reason") or finish_reason
+            if (cancellation := monitor(text)) is not None:
+                break
+    finally:
+        chunks.close()
+    total = time.perf_counter() - start
+    timings = client.Timings(
+        client.connect_seconds(), ttfb if ttfb is not None else total, total
+    )
+
+    metrics.increment(
+        "autobot_api_streams_total",
+        model=model,
+        result=cancellation.reason if cancellation is not None else "completed",
+    )
+    # N.B. Streamed responses don't report their usage, so estimate it.
+    encoding = get_model(model).encoding
+    prompt_tokens = count_tokens(request["prompt"], encoding=encoding)
+    completion_tokens = count_tokens(text, encoding=encoding)
+    response = {
+        "object": "text_completion",
+        "model": model,
+        "choices": [
+            {
+                "text": cancellation.text if cancellation is not None else text,
+                "index": 0,
+                "logprobs": None,
+                "finish_reason": "stop" if cancellation is not None else finish_reason,
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+    return cast(openai.Completion, response), cancellation is not None, timings
+
+
+def _record_timings(timings: client.Timings, *, model: str) -> None:
+    """Record the breakdown of a request's latency."""
+    metrics.increment(
+        "autobot_api_connections_total",
+        model=model,
+        reused=str(timings.connect is None).lower(),
+    )
+    if timings.connect is not None:
+        metrics.observe("autobot_api_connect_seconds", timings.connect, model=model)
+    metrics.observe("autobot_api_ttfb_seconds", timings.ttfb, model=model)
+
+
+def _record_exchange(
+    key: str,
+    request: dict[str, Any],
+    response: openai.Completion,
+    *,
+    start: float,
+    cached: bool,
+) -> None:
+    """Track a resolved request, and append it (and its response) to the recording, if
+    recording."""
+    _track(request["model"], cached=cached, start=start)
+    if _recorder is None:
+        return
+    _recorder.record(
+        recording.Exchange(
+            key=key,
+            request=request,
+            response=response,
+            latency=time.perf_counter() - start,
+            cached=cached,
+        )
+    )
+
+
+def _record_usage(response: openai.Completion, *, model: str) -> None:
+    """Record the tokens consumed by a completion, along with their cost."""
+    usage = response.get("usage") or {}
+    prompt_tokens = usage.get("prompt_tokens", 0)
+    completion_tokens = usage.get("completion_tokens", 0)
+    metrics.increment(
+        "autobot_api_tokens_total", prompt_tokens, model=model, kind="prompt"
+    )
+    metrics.increment(
+        "autobot_api_tokens_total", completion_tokens, model=model, kind="completion"
+    )
+    metrics.increment(
+        "autobot_api_cost_usd_total",
+        (prompt_tokens + completion_tokens)
+        / 1000
+        * get_model(model).cost_per_1k_tokens,
         model=model,
-        prompt=prompt,
-        temperature=temperature,
-        max_tokens=max_tokens,
-        stop=stop,
     )
-    cache.set_in_cache(request_hash, response)
-    return response
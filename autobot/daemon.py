@@ -0,0 +1,169 @@
+"""A long-lived process that serves `autobot run` requests over a Unix socket.
+
+The daemon keeps its schematics, parsed files, completion cache, and connection pool
+warm across runs. Requests are handled one at a time, since each run changes into the
+client's working directory (and re-resolves the cache directory from it) and captures
+the process's output. (`AUTOBOT_CACHE_DIR`, if set, is read from the daemon's
+environment, not the client's.)
+
+The protocol is one JSON object per line, in each direction: the client sends
+`{"argv": [...], "cwd": "..."}`, and the daemon replies with
+`{"stdout": "...", "stderr": "...", "exit_code": 0}`. The two streams are captured
+separately, such that (e.g.) the output of `run --at` isn't mixed with its logs.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import getpass
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import traceback
+from typing import Any
+
+DEFAULT_SOCKET: str = os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(),
+    f"autobot-{getpass.getuser()}.sock",
+)
+
+# The subcommands that can be run by the daemon.
+COMMANDS: tuple[str, ...] = ("run",)
+
+
+class DaemonError(Exception):
+    pass
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: Daemon
+
+    def handle(self) -> None:
+        line = self.rfile.readline()
+        # N.B. `is_running` connects and disconnects without sending a request.
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+            response = self.server.execute(request["argv"], cwd=request["cwd"])
+        except (json.JSONDecodeError, KeyError, TypeError) as error:
+            response = {
+                "stdout": "",
+                "stderr": f"error: Invalid request ({error})\n",
+                "exit_code": 2,
+            }
+        # The client may have gone away (e.g., if it was interrupted).
+        with contextlib.suppress(BrokenPipeError, ConnectionResetError):
+            self.wfile.write((json.dumps(response) + "\n").encode())
+
+
+class Daemon(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, parser: argparse.ArgumentParser) -> None:
+        if os.path.exists(path):
+            if is_running(path):
+                raise DaemonError(f"A daemon is already serving at: {path}")
+            # The socket was left behind by a daemon that didn't exit cleanly.
+            os.remove(path)
+        super().__init__(path, _Handler)
+        self.path = path
+        self.parser = parser
+        self.lock = threading.Lock()
+
+    def execute(self, argv: list[str], *, cwd: str) -> dict[str, Any]:
+        """Run a command on behalf of a client, returning its output (on each stream)
+        and exit code."""
+        from autobot.utils import cache, metrics
+
+        if not argv or argv[0] not in COMMANDS:
+            return {
+                "stdout": "",
+                "stderr": f"error: The daemon can only run: {', '.join(COMMANDS)}\n",
+                "exit_code": 2,
+            }
+
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        exit_code = 0
+        with self.lock:
+            previous = os.getcwd()
+            previous_cache_dir = cache.CACHE_DIR
+            try:
+                os.chdir(cwd)
+                cache.set_cache_dir(cache.default_cache_dir())
+                # Report the metrics for this run alone.
+                metrics.REGISTRY.reset()
+                with contextlib.redirect_stdout(stdout):
+                    with contextlib.redirect_stderr(stderr):
+                        exit_code = self._run(argv)
+            except OSError as error:
+                stderr.write(f"error: {error}\n")
+                exit_code = 1
+            finally:
+                os.chdir(previous)
+                cache.set_cache_dir(previous_cache_dir)
+        return {
+            "stdout": stdout.getvalue(),
+            "stderr": stderr.getvalue(),
+            "exit_code": exit_code,
+        }
+
+    def _run(self, argv: list[str]) -> int:
+        try:
+            options = self.parser.parse_args(argv)
+            options.func(options)
+        except SystemExit as error:
+            if isinstance(error.code, int):
+                return error.code
+            if error.code is not None:
+                print(error.code, file=sys.stderr)
+                return 1
+        except Exception:  # noqa: BLE001
+            traceback.print_exc()
+            return 1
+        return 0
+
+    def server_close(self) -> None:
+        super().server_close()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path)
+
+
+def is_running(path: str) -> bool:
+    """Return True if a daemon is listening on the given socket."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+def send(path: str, argv: list[str]) -> tuple[str, str, int]:
+    """Send a command to the daemon.
+
+    Returns: a tuple of (stdout, stderr, exit code).
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError as error:
+            raise DaemonError(
+                f"Unable to connect to a daemon at: {path} ({error.strerror}). "
+                "(Start one with `autobot serve`.)"
+            ) from None
+        request = {"argv": argv, "cwd": os.getcwd()}
+        sock.sendall((json.dumps(request) + "\n").encode())
+        with sock.makefile("r", encoding="utf-8") as fp:
+            line = fp.readline()
+    if not line:
+        raise DaemonError("The daemon closed the connection without responding.")
+    response = json.loads(line)
+    return response["stdout"], response["stderr"], response["exit_code"]
@@ -0,0 +1,94 @@
+"""Compact, line-anchored edit scripts.
+
+An edit script describes the changes to a snippet as one edit per line, anchored to the
+(1-indexed) line numbers of the original snippet:
+
+    3: text     Replace line 3 with `text`.
+    3+: text    Insert `text` after line 3 (or at the start of the snippet, for line 0).
+    3-          Delete line 3.
+
+Lines that aren't mentioned are left unchanged, so a one-line fix to a large snippet
+requires a one-line edit script.
+"""
+
+from __future__ import annotations
+
+import difflib
+import re
+
+EDIT_PATTERN = re.compile(r"^(\d+)(\+?): ?(.*)$")
+DELETE_PATTERN = re.compile(r"^(\d+)-$")
+
+
+class EditScriptError(Exception):
+    pass
+
+
+def number_lines(text: str) -> str:
+    """Prefix each line of a snippet with its line number, to anchor edits against."""
+    return "\n".join(f"{i}| {line}" for i, line in enumerate(text.splitlines(), 1))
+
+
+def make_edit_script(before: str, after: str) -> str:
+    """Return the edit script that transforms one snippet into another."""
+    before_lines = before.splitlines()
+    after_lines = after.splitlines()
+    edits: list[str] = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(
+        None, before_lines, after_lines, autojunk=False
+    ).get_opcodes():
+        if tag == "equal":
+            continue
+        for k in range(max(i2 - i1, j2 - j1)):
+            if k < i2 - i1 and k < j2 - j1:
+                edits.append(f"{i1 + k + 1}: {after_lines[j1 + k]}")
+            elif k < i2 - i1:
+                edits.append(f"{i1 + k + 1}-")
+            else:
+                edits.append(f"{i2}+: {after_lines[j1 + k]}")
+    return "\n".join(edits)
+
+
+def apply_edit_script(before: str, script: str) -> str:
+    """Apply an edit script to a snippet.
+
+    Raises an EditScriptError if the script is malformed, references lines outside the
+    snippet, or edits the same line more than once.
+    """
+    before_lines = before.splitlines()
+    replacements: dict[int, str | None] = {}
+    insertions: dict[int, list[str]] = {}
+    for line in script.splitlines():
+        if not line.strip():
+            continue
+        if match := DELETE_PATTERN.match(line):
+            lineno, content = int(match.group(1)), None
+            is_insertion = False
+        elif match := EDIT_PATTERN.match(line):
+            lineno, content = int(match.group(1)), match.group(3)
+            is_insertion = bool(match.group(2))
+        else:
+            raise EditScriptError(f"Malformed edit: {line!r}")
+
+        if is_insertion:
+            if not 0 <= lineno <= len(before_lines):
+                raise EditScriptError(f"Line out of range: {line!r}")
+            assert content is not None
+            insertions.setdefault(lineno, []).append(content)
+        else:
+            if not 1 <= lineno <= len(before_lines):
+                raise EditScriptError(f"Line out of range: {line!r}")
+            if lineno in replacements:
+                raise EditScriptError(f"Line edited more than once: {lineno}")
+            replacements[lineno] = content
+
+    after_lines: list[str] = list(insertions.get(0, []))
+    for lineno, original in enumerate(before_lines, 1):
+        if lineno in replacements:
+            replacement = replacements[lineno]
+            if replacement is not None:
+                after_lines.append(replacement)
+        else:
+            after_lines.append(original)
+        after_lines.extend(insertions.get(lineno, []))
+    return "\n".join(after_lines) + "\n"
@@ -0,0 +1,315 @@
+"""A programmatic interface to autobot, for embedding it in other tools.
+
+Unlike `autobot run`, the functions here don't print to the console, write patches to
+disk, or (unless asked to, via `cache=True`) read or write the completion cache. Instead,
+they yield a structured result for each snippet as soon as its fix has been generated:
+
+    from autobot.library import iter_refactor
+
+    for result in iter_refactor("useless_object_inheritance", ["src/"]):
+        if result.changed:
+            print(result.diff)
+
+Each result reflects a single schematic: where several schematics apply to the same
+snippet, each yields its own result (rather than a composed fix).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import threading
+from multiprocessing.pool import ThreadPool
+from typing import Any, AsyncIterator, Generator, NamedTuple, Sequence, Union
+
+from autobot import api
+from autobot.models import DEFAULT_MODEL, get_model
+from autobot.refactor import patches
+from autobot.refactor.refactor import (
+    Batch,
+    Task,
+    _fix_batch,
+    extract_for_schematics,
+    make_batches,
+    make_patch,
+    resolve_batches,
+)
+from autobot.schematic import Schematic, load_schematics
+from autobot.snippet import DecomposedClass, Snippet, stitch_class
+from autobot.utils import filesystem
+
+SchematicSpecifier = Union[str, Schematic, Sequence[Schematic]]
+
+
+class Result(NamedTuple):
+    """The fix suggested by a schematic for a single snippet."""
+
+    # The title of the schematic that suggested the fix.
+    schematic: str
+    filename: str
+    # The (1-indexed, inclusive) range of lines spanned by the snippet.
+    lineno: int
+    end_lineno: int
+    before: str
+    after: str
+    # The fix, as a patch against the file (or an empty string, if unchanged).
+    diff: str
+    # The model that generated the fix (i.e., the most capable model consulted, in a
+    # cascade).
+    model: str
+    # Whether every completion for the snippet was served from the cache.
+    cached: bool
+    # The time (in seconds) spent resolving the snippet's completions. (Snippets that
+    # shared a packed prompt share its timings.)
+    seconds: float
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.diff)
+
+    def save_patch(self) -> None:
+        """Save the fix as a patch, for review via `autobot review`."""
+        if self.diff:
+            patches.save(self.diff, target=self.filename, lineno=self.lineno)
+
+
+class _Stats(NamedTuple):
+    model: str
+    cached: bool
+    seconds: float
+
+
+def _load(schematics: SchematicSpecifier) -> list[Schematic]:
+    if isinstance(schematics, str):
+        return load_schematics(schematics)
+    if isinstance(schematics, Schematic):
+        return [schematics]
+    return list(schematics)
+
+
+def iter_refactor(
+    schematics: SchematicSpecifier,
+    paths: str | Sequence[str],
+    *,
+    model: str = DEFAULT_MODEL,
+    escalation: Sequence[str] = (),
+    nthreads: int = 8,
+    max_snippet_len: int | None = None,
+    pack_size: int = 1,
+    compress: bool = False,
+    max_retries: int = 1,
+    seed: int = 0,
+    cache: bool = False,
+) -> Generator[Result, None, None]:
+    """Apply one or more schematics to the Python files under a set of paths, yielding
+    a result for each snippet as soon as its fix has been generated.
+
+    Args:
+        schematics: A schematic, a list of schematics, or a specifier (as accepted by
+            `autobot run`).
+        paths: The files (or directories, or glob patterns) to refactor.
+        model: The model with which to generate each fix.
+        escalation: The models to which to escalate a fix that fails validation, in
+            order.
+        nthreads: The number of threads with which to generate fixes.
+        max_snippet_len: The maximum length (in characters) of a snippet. (Defaults to
+            the limit of the least capable model.)
+        pack_size: The maximum number of small snippets to pack into a single prompt.
+        compress: Whether to compress docstrings and comments in each prompt.
+        max_retries: The number of times to retry a fix that fails validation.
+        seed: The seed with which to break ties when scheduling prompts. (Cached
+            snippets are yielded first, and the rest longest first.)
+        cache: Whether to read from and write to the completion cache (as `autobot
+            run` does), in `.autobot_cache` in the working directory (or
+            `AUTOBOT_CACHE_DIR`, if set). By default, nothing is written to disk.
+
+    Configures the API client on first use (from `OPENAI_API_KEY` and friends), unless
+    it has already been configured via `autobot.api.init`.
+    """
+    loaded = _load(schematics)
+    targets = filesystem.collect_python_files(
+        [paths] if isinstance(paths, str) else list(paths)
+    )
+    tiers = (model, *escalation)
+    if max_snippet_len is None:
+        max_snippet_len = min(get_model(name).max_snippet_len for name in tiers)
+    if not api.is_initialized():
+        api.init(pool_size=nthreads)
+
+    extractions = extract_for_schematics(
+        loaded, targets=targets, max_snippet_len=max_snippet_len
+    )
+
+    # Map from (schematic title, snippet text) to the nodes that are waiting on it.
+    waiting: dict[tuple[str, str], list[tuple[Schematic, str, Snippet]]] = {}
+    # Map from node to the texts that it requires, and those it's still waiting on.
+    node_texts: dict[tuple[Schematic, str, Snippet], set[str]] = {}
+    remaining: dict[tuple[Schematic, str, Snippet], set[str]] = {}
+    decompositions: dict[str, DecomposedClass] = {}
+    batches: list[Batch] = []
+    for schematic in loaded:
+        extraction = extractions[schematic.transform_type, schematic.selection]
+        decompositions.update(extraction.snippet_text_to_decomposition)
+        for filename, snippets in extraction.filename_to_snippets.items():
+            for snippet in snippets:
+                decomposed = extraction.snippet_text_to_decomposition.get(snippet.text)
+                texts = (
+                    {
+                        text
+                        for text in decomposed.texts()
+                        if len(text) <= max_snippet_len
+                    }
+                    if decomposed is not None
+                    else {snippet.text}
+                )
+                node = (schematic, filename, snippet)
+                node_texts[node] = texts
+                remaining[node] = set(texts)
+                for text in texts:
+                    waiting.setdefault((schematic.title, text), []).append(node)
+        batches.extend(
+            make_batches(
+                extraction.texts,
+                schematic=schematic,
+                model=model,
+                pack_size=pack_size,
+                compress=compress,
+                use_cache=cache,
+            )
+        )
+
+    def resolve(batch: Batch) -> tuple[list[tuple[Task, str]], list[api.Resolution]]:
+        with api.track() as resolutions:
+            with contextlib.nullcontext() if cache else api.bypass_cache():
+                fixes = _fix_batch(
+                    batch,
+                    model=model,
+                    max_retries=max_retries,
+                    escalation=tuple(escalation),
+                )
+        return fixes, resolutions
+
+    # Map from schematic title to (map from snippet text to suggested fix).
+    completions: dict[str, dict[str, str]] = {
+        schematic.title: {} for schematic in loaded
+    }
+    stats: dict[tuple[str, str], _Stats] = {}
+    sources: dict[str, str] = {}
+    with ThreadPool(processes=nthreads) as pool:
+        for fixes, resolutions in resolve_batches(
+            pool, resolve, batches, model=model, seed=seed, use_cache=cache
+        ):
+            batch_stats = _Stats(
+                max(
+                    (resolution.model for resolution in resolutions),
+                    key=tiers.index,
+                    default=model,
+                ),
+                all(resolution.cached for resolution in resolutions),
+                sum(resolution.seconds for resolution in resolutions),
+            )
+            for task, fix in fixes:
+                completions[task.schematic][task.text] = fix
+                stats[task.schematic, task.text] = batch_stats
+                for node in waiting.pop((task.schematic, task.text), []):
+                    remaining[node].discard(task.text)
+                    if remaining[node]:
+                        continue
+                    schematic, filename, snippet = node
+                    if filename not in sources:
+                        with open(filename, "r") as fp:
+                            sources[filename] = fp.read()
+                    yield _result(
+                        node,
+                        source=sources[filename],
+                        completions=completions[schematic.title],
+                        decomposed=decompositions.get(snippet.text),
+                        stats=[
+                            stats[schematic.title, text] for text in node_texts[node]
+                        ],
+                        tiers=tiers,
+                    )
+
+
+def _result(
+    node: tuple[Schematic, str, Snippet],
+    *,
+    source: str,
+    completions: dict[str, str],
+    decomposed: DecomposedClass | None,
+    stats: list[_Stats],
+    tiers: tuple[str, ...],
+) -> Result:
+    schematic, filename, snippet = node
+    after = (
+        stitch_class(decomposed, completions)
+        if decomposed is not None
+        else completions[snippet.text]
+    )
+    return Result(
+        schematic=schematic.title,
+        filename=filename,
+        lineno=snippet.lineno,
+        end_lineno=snippet.lineno + len(snippet.text.splitlines()) - 1,
+        before=snippet.text,
+        after=after,
+        diff=make_patch(snippet, after, filename, source),
+        model=max((stat.model for stat in stats), key=tiers.index, default=tiers[0]),
+        cached=all(stat.cached for stat in stats),
+        seconds=sum(stat.seconds for stat in stats),
+    )
+
+
+async def aiter_refactor(
+    schematics: SchematicSpecifier, paths: str | Sequence[str], **kwargs: Any
+) -> AsyncIterator[Result]:
+    """An asynchronous variant of `iter_refactor`, which accepts the same arguments.
+
+    Fixes are generated on a background thread (and its pool), so as not to block the
+    event loop. If iteration is abandoned early, no further prompts are issued.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[tuple[Result | None, BaseException | None]] = asyncio.Queue()
+    cancelled = threading.Event()
+
+    def put(item: tuple[Result | None, BaseException | None]) -> None:
+        # N.B. The loop may have been closed, if the consumer has gone away.
+        with contextlib.suppress(RuntimeError):
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    def produce() -> None:
+        results = iter_refactor(schematics, paths, **kwargs)
+        try:
+            for result in results:
+                if cancelled.is_set():
+                    break
+                put((result, None))
+        except BaseException as error:  # noqa: BLE001
+            put((None, error))
+        else:
+            put((None, None))
+        finally:
+            results.close()
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            result, error = await queue.get()
+            if error is not None:
+                raise error
+            if result is None:
+                return
+            yield result
+    finally:
+        cancelled.set()
+
+
+def refactor(
+    schematics: SchematicSpecifier, paths: str | Sequence[str], **kwargs: Any
+) -> list[Result]:
+    """Apply one or more schematics to a set of paths, returning every result (sorted by
+    file and line) once all fixes have been generated."""
+    return sorted(
+        iter_refactor(schematics, paths, **kwargs),
+        key=lambda result: (result.filename, result.lineno, result.schematic),
+    )
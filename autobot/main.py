@@ -4,107 +4,793 @@ from __future__ import annotations
 
 import argparse
 import logging
+import os
+import signal
+import sys
+import time
 from typing import Any
 
 from dotenv import load_dotenv
 from rich.console import Console
 from rich.logging import RichHandler
 
+from autobot.models import DEFAULT_MODEL, MODELS
 from autobot.version import __version__
 
 
+def _start_profiling(options: Any) -> None:
+    from autobot.utils import profiling
+
+    if options.profile or options.profile_cpu:
+        profiling.enable(cpu=bool(options.profile_cpu))
+
+
+def _finish_profiling(options: Any) -> None:
+    from autobot.utils import profiling
+
+    if (profiler := profiling.get_profiler()) is None:
+        return
+
+    console = Console()
+    console.print()
+    console.print("[bold]Slowest items:")
+    for category in ("file", "snippet", "patch"):
+        for span in profiler.slowest(category):
+            details = ", ".join(f"{key}={value}" for key, value in span.args.items())
+            console.print(
+                f"  [cyan]{span.duration * 1000:8.1f}ms[/]  {category} {span.name} "
+                f"[grey46]({details})[/]"
+            )
+
+    if options.profile:
+        profiler.write_trace(options.profile)
+        console.print(f"Wrote trace to: [cyan]{options.profile}")
+    if options.profile_cpu:
+        profiler.write_cpu_profile(options.profile_cpu)
+        console.print(f"Wrote CPU profile to: [cyan]{options.profile_cpu}")
+
+
+def _add_profiling_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--profile",
+        type=str,
+        default=None,
+        help=(
+            "Record the time spent in each stage (and on each file, snippet, and "
+            "patch), and write it to this path as a Chrome trace (viewable in "
+            "chrome://tracing or https://ui.perfetto.dev)."
+        ),
+    )
+    parser.add_argument(
+        "--profile-cpu",
+        type=str,
+        default=None,
+        help=(
+            "Run cProfile over the CPU-bound stages, and write the profile to this "
+            "path in pstats format."
+        ),
+    )
+
+
+def _model_list(value: str) -> list[str]:
+    models = [model.strip() for model in value.split(",") if model.strip()]
+    for model in models:
+        if model not in MODELS:
+            raise argparse.ArgumentTypeError(
+                f"invalid model: {model!r} (choose from {', '.join(MODELS)})"
+            )
+    if len(set(models)) != len(models):
+        raise argparse.ArgumentTypeError(f"duplicate model in: {value!r}")
+    return models
+
+
+def _location(value: str) -> tuple[str, int]:
+    filename, _, lineno = value.rpartition(":")
+    if not filename or not lineno.isdigit() or int(lineno) < 1:
+        raise argparse.ArgumentTypeError(
+            f"invalid location: {value!r} (expected FILE:LINE)"
+        )
+    return filename, int(lineno)
+
+
+def _shard(value: str) -> tuple[int, int]:
+    index, _, count = value.partition("/")
+    if not (index.isdigit() and count.isdigit() and 1 <= int(index) <= int(count)):
+        raise argparse.ArgumentTypeError(
+            f"invalid shard: {value!r} (expected INDEX/COUNT, e.g., 1/4)"
+        )
+    return int(index), int(count)
+
+
+def _shard_credentials(shard: tuple[int, int]) -> tuple[str | None, str | None]:
+    """Select the API key (and organization) for a shard, from the comma-separated
+    lists in `OPENAI_API_KEYS` (and `OPENAI_ORGANIZATIONS`), if set."""
+    keys = [key.strip() for key in os.environ.get("OPENAI_API_KEYS", "").split(",")]
+    keys = [key for key in keys if key]
+    if not keys:
+        return None, None
+    i = (shard[0] - 1) % len(keys)
+    organizations = [
+        organization.strip()
+        for organization in os.environ.get("OPENAI_ORGANIZATIONS", "").split(",")
+    ]
+    return keys[i], organizations[i] if i < len(organizations) else None
+
+
 def run(options: Any) -> None:
     from autobot import api
-    from autobot.refactor import run_refactor
-    from autobot.schematic import Schematic, SchematicDefinitionException
-    from autobot.utils import filesystem
-
-    api.init()
+    from autobot.models import get_model
+    from autobot.refactor import (
+        Journal,
+        JournalError,
+        TargetError,
+        run_estimate,
+        run_refactor,
+        run_targeted,
+        run_watch,
+    )
+    from autobot.refactor.journal import JOURNAL_FILENAME, make_config
+    from autobot.schematic import (
+        Schematic,
+        SchematicDefinitionException,
+        load_schematics,
+    )
+    from autobot.utils import filesystem, metrics, recording
 
-    model: str = options.model
+    # In a cascade, every snippet is sent to the first model, and escalated to each
+    # subsequent model in turn if its fix fails validation.
+    models: list[str] = options.models or [options.model]
+    model: str = models[0]
     nthreads: int = options.nthreads
+    max_snippet_len: int = options.max_snippet_len or min(
+        get_model(name).max_snippet_len for name in models
+    )
+    rate_limit: float | None = options.rate_limit
+    pack_size: int = options.pack_size
+    compress: bool = options.compress_prompts
+    max_retries: int = options.max_retries
     verbose: bool = options.verbose
+    at: tuple[str, int] | None = options.at
+    shard: tuple[int, int] | None = options.shard
+
+    # With --at, the result is written to stdout, so everything else goes to stderr.
+    console = Console(stderr=at is not None)
 
     logging.basicConfig(
         format="%(asctime)s %(levelname)-8s %(message)s",
         datefmt="%m-%d %H:%M:%S",
         level=logging.INFO if verbose else logging.WARNING,
-        handlers=[RichHandler()],
+        handlers=[RichHandler(console=console)],
+        # N.B. In the daemon, replace the previous run's level and handler.
+        force=True,
     )
 
-    console = Console()
-
     try:
-        schematic: Schematic = Schematic.from_directory(options.schematic)
+        schematics: list[Schematic] = load_schematics(options.schematic)
     except SchematicDefinitionException as error:
         console.print(f"[bold red]error[/]  {error}")
         exit(1)
 
-    targets = filesystem.collect_python_files(options.files)
+    if at is not None:
+        if options.files:
+            console.print("[bold red]error[/]  --at can't be combined with files")
+            exit(1)
+        if options.estimate:
+            console.print("[bold red]error[/]  --at can't be combined with --estimate")
+            exit(1)
+        if options.watch:
+            console.print("[bold red]error[/]  --at can't be combined with --watch")
+            exit(1)
+    if shard is not None and (at is not None or options.watch):
+        console.print(
+            "[bold red]error[/]  --shard can't be combined with --at or --watch"
+        )
+        exit(1)
+    if at is None and options.format != "diff":
+        console.print("[bold red]error[/]  --format requires --at")
+        exit(1)
+    if options.resume and (at is not None or options.watch or options.estimate):
+        console.print(
+            "[bold red]error[/]  --resume can't be combined with --at, --watch, or "
+            "--estimate"
+        )
+        exit(1)
+    if options.resume and options.files:
+        console.print(
+            "[bold red]error[/]  --resume can't be combined with files (the files are "
+            "read from the journal)"
+        )
+        exit(1)
+
+    # The options that must match for a run to resume from another's journal.
+    config = make_config(
+        schematics,
+        models=models,
+        max_snippet_len=max_snippet_len,
+        pack_size=pack_size,
+        compress=compress,
+        max_retries=max_retries,
+        shard=shard,
+    )
+    journal: Journal | None = None
+    if options.resume:
+        try:
+            journal = Journal.resume(JOURNAL_FILENAME, config=config)
+        except JournalError as error:
+            console.print(f"[bold red]error[/]  {error}")
+            exit(1)
+        targets = [target for target in journal.targets if os.path.isfile(target)]
+    elif at is not None:
+        targets = [at[0]]
+    else:
+        targets = filesystem.collect_python_files(options.files)
     if not targets:
         console.print("[bold red]error[/]  No Python files found")
         exit(1)
 
-    run_refactor(
-        schematic=schematic,
-        targets=targets,
-        nthreads=nthreads,
-        model=model,
+    if options.estimate and options.watch:
+        console.print("[bold red]error[/]  --estimate can't be combined with --watch")
+        exit(1)
+
+    if options.estimate:
+        estimate = run_estimate(
+            schematics=schematics,
+            targets=targets,
+            nthreads=nthreads,
+            model=model,
+            max_snippet_len=max_snippet_len,
+            rate_limit=rate_limit,
+            pack_size=pack_size,
+            compress=compress,
+            shard=shard,
+            escalation=tuple(models[1:]),
+        )
+        if options.max_cost is not None and estimate.cost > options.max_cost:
+            console.print(
+                f"[bold red]error[/]  Estimated cost (${estimate.cost:,.2f}) exceeds "
+                f"--max-cost (${options.max_cost:,.2f})"
+            )
+            exit(1)
+        return
+
+    if options.record and options.replay:
+        console.print(
+            "[bold red]error[/]  --record and --replay are mutually exclusive"
+        )
+        exit(1)
+
+    # Spread shards across rate-limit buckets, if several API keys are available.
+    api_key, organization = (
+        _shard_credentials(shard) if shard is not None else (None, None)
     )
+    try:
+        api.init(
+            rate_limit=rate_limit,
+            record=options.record,
+            replay=options.replay,
+            replay_latency=options.replay_latency == "original",
+            stream=options.stream,
+            api_base=options.api_base,
+            api_key=api_key,
+            organization=organization,
+            pool_size=nthreads,
+        )
+    except (OSError, recording.ReplayError) as error:
+        console.print(f"[bold red]error[/]  {error}")
+        exit(1)
+
+    _start_profiling(options)
+    started_at = time.time()
+    try:
+        with metrics.timer("autobot_stage_seconds", stage="total"):
+            if at is not None:
+                target, lineno = at
+                try:
+                    run_targeted(
+                        schematics=schematics,
+                        target=target,
+                        lineno=lineno,
+                        model=model,
+                        max_snippet_len=max_snippet_len,
+                        max_retries=max_retries,
+                        escalation=tuple(models[1:]),
+                        output_format=options.format,
+                    )
+                except TargetError as error:
+                    console.print(f"[bold red]error[/]  {error}")
+                    exit(1)
+            elif options.watch:
+                run_watch(
+                    schematics=schematics,
+                    targets=options.files,
+                    nthreads=nthreads,
+                    model=model,
+                    max_snippet_len=max_snippet_len,
+                    pack_size=pack_size,
+                    compress=compress,
+                    max_retries=max_retries,
+                    escalation=tuple(models[1:]),
+                    polling=options.poll,
+                    seed=options.seed,
+                )
+            else:
+                if journal is None:
+                    journal = Journal.create(
+                        JOURNAL_FILENAME, config=config, targets=targets
+                    )
+                try:
+                    run_refactor(
+                        schematics=schematics,
+                        targets=targets,
+                        nthreads=nthreads,
+                        model=model,
+                        max_snippet_len=max_snippet_len,
+                        pack_size=pack_size,
+                        compress=compress,
+                        max_retries=max_retries,
+                        escalation=tuple(models[1:]),
+                        shard=shard,
+                        seed=options.seed,
+                        journal=journal,
+                    )
+                except KeyboardInterrupt:
+                    console.print()
+                    console.print(
+                        "[bold yellow]Interrupted.[/] Re-run with --resume to pick up "
+                        "where this run left off."
+                    )
+                    exit(130)
+                except recording.ReplayError:
+                    raise
+                except Exception:
+                    console.print(
+                        "[bold yellow]Run failed.[/] Re-run with --resume to pick up "
+                        "where this run left off."
+                    )
+                    raise
+                finally:
+                    journal.close()
+    except recording.ReplayError as error:
+        # N.B. The run requested a completion that isn't in the recording.
+        console.print(f"[bold red]error[/]  {error}")
+        exit(1)
+    finally:
+        api.close()
+
+    for path in options.metrics_out or []:
+        hits = metrics.value("autobot_cache_reads_total", result="hit")
+        reads = metrics.value("autobot_cache_reads_total")
+        metrics.write_report(
+            path,
+            version=__version__,
+            schematic=",".join(schematic.title for schematic in schematics),
+            model=",".join(models),
+            started_at=started_at,
+            duration_seconds=time.time() - started_at,
+            cache_hit_rate=hits / reads if reads else None,
+        )
+
+    _finish_profiling(options)
 
 
 def review(options: Any) -> None:
     from autobot.review import run_review
 
+    _start_profiling(options)
     run_review()
+    _finish_profiling(options)
 
 
-def main() -> None:
-    load_dotenv()
+def serve(options: Any) -> None:
+    from autobot import api, daemon
+
+    # Import the refactoring machinery up front, such that even the first run is warm.
+    from autobot.refactor import run_refactor  # noqa: F401
+
+    console = Console()
+    path: str = options.socket or daemon.DEFAULT_SOCKET
+
+    # Keep the connection pool open across runs.
+    api.keep_alive()
+    try:
+        server = daemon.Daemon(path, build_parser())
+    except (OSError, daemon.DaemonError) as error:
+        console.print(f"[bold red]error[/]  {error}")
+        exit(1)
+
+    console.print(f"[bold]Serving at: [cyan]{path}")
+    # Shut down cleanly (i.e., removing the socket) when terminated.
+    signal.signal(signal.SIGTERM, lambda *_: exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
 
+def _connect(argv: list[str]) -> None:
+    """Forward a command to a running daemon, as in `autobot --connect[=SOCKET] ...`."""
+    from autobot import daemon
+
+    flag, _, path = argv[0].partition("=")
+    assert flag == "--connect"
+    argv = argv[1:]
+    if not path:
+        path = daemon.DEFAULT_SOCKET
+        if argv and argv[0] not in daemon.COMMANDS:
+            path, argv = argv[0], argv[1:]
+
+    try:
+        stdout, stderr, exit_code = daemon.send(path, argv)
+    except daemon.DaemonError as error:
+        Console().print(f"[bold red]error[/]  {error}")
+        exit(1)
+    sys.stderr.write(stderr)
+    sys.stdout.write(stdout)
+    exit(exit_code)
+
+
+def merge(options: Any) -> None:
+    from autobot.refactor import patches
+    from autobot.utils import bundle, cache
+
+    console = Console()
+
+    for directory in options.shards:
+        patch_dir = os.path.join(directory, patches.PATCH_DIR)
+        cache_dir = os.path.join(directory, cache.CACHE_DIRNAME)
+        if not os.path.isdir(patch_dir) and not os.path.isdir(cache_dir):
+            console.print(
+                f"[bold red]error[/]  No patches or cache found in: {directory} "
+                f"(expected {patches.PATCH_DIR} or {cache.CACHE_DIRNAME})"
+            )
+            exit(1)
+
+    conflicts: list[str] = []
+    for directory in options.shards:
+        copied, present, shard_conflicts = patches.merge(
+            os.path.join(directory, patches.PATCH_DIR)
+        )
+        imported, skipped = bundle.import_entries(
+            bundle.read_cache_directory(os.path.join(directory, cache.CACHE_DIRNAME))
+        )
+        console.print(
+            f"Merged [cyan]{directory}[/]: {copied} patches ({present} already "
+            f"present), {imported} cache entries ({skipped} already present)"
+        )
+        conflicts.extend(
+            os.path.join(directory, patches.PATCH_DIR, path) for path in shard_conflicts
+        )
+
+    for path in conflicts:
+        console.print(f"[bold yellow]warning[/]  Skipped conflicting patch: {path}")
+    console.print(
+        "[bold white]✨ Done! Run `autobot review` to review the merged patches."
+    )
+    if conflicts:
+        exit(1)
+
+
+def cache_export(options: Any) -> None:
+    from autobot.schematic import Schematic, SchematicDefinitionException
+    from autobot.utils import bundle, cache
+
+    console = Console()
+
+    try:
+        schematics = (
+            [Schematic.from_directory(dirname) for dirname in options.schematic]
+            if options.schematic
+            else None
+        )
+    except SchematicDefinitionException as error:
+        console.print(f"[bold red]error[/]  {error}")
+        exit(1)
+
+    entries = bundle.collect_entries(models=options.model, schematics=schematics)
+    path = bundle.write_bundle(entries, path=options.output)
+    console.print(
+        f"Exported {len(entries)} entries from [cyan]{cache.CACHE_DIR}[/] to: "
+        f"[cyan]{path}"
+    )
+
+
+def cache_import(options: Any) -> None:
+    from autobot.utils import bundle, cache
+
+    console = Console()
+
+    for path in options.bundles:
+        try:
+            entries = bundle.read_bundle(path)
+        except (OSError, bundle.BundleError) as error:
+            console.print(f"[bold red]error[/]  {error}")
+            exit(1)
+        imported, skipped = bundle.import_entries(entries)
+        console.print(
+            f"Imported {imported} entries from [cyan]{path}[/] into "
+            f"[cyan]{cache.CACHE_DIR}[/] ({skipped} already present)"
+        )
+
+
+def cache_merge(options: Any) -> None:
+    from autobot.utils import bundle
+
+    console = Console()
+
+    entries: list[bundle.BundleEntry] = []
+    for path in options.bundles:
+        try:
+            entries.extend(bundle.read_bundle(path))
+        except (OSError, bundle.BundleError) as error:
+            console.print(f"[bold red]error[/]  {error}")
+            exit(1)
+    num_unique = len({entry.key for entry in entries})
+    path = bundle.write_bundle(entries, path=options.output)
+    console.print(
+        f"Merged {len(options.bundles)} bundles ({num_unique} unique entries) into: "
+        f"[cyan]{path}"
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         prog="autobot", description="An automated code refactoring tool."
     )
     parser.add_argument(
         "--version", action="version", version=f"%(prog)s {__version__}"
     )
+    parser.add_argument(
+        "--connect",
+        metavar="SOCKET",
+        nargs="?",
+        help=(
+            "Forward the command to a daemon started with `autobot serve` (listening "
+            "on the default socket, unless otherwise specified). Must be the first "
+            "argument."
+        ),
+    )
     subparsers = parser.add_subparsers()
 
     # autobot run
     parser_run = subparsers.add_parser(
         "run",
         description="An automated code refactoring tool.",
-        usage="autobot run [schematic] [files [files ...]]",
+        usage=(
+            "autobot run [schematic] [files [files ...]]\n"
+            "       autobot run [schematic] --at FILE:LINE [--format {diff,json}]"
+        ),
+    )
+    parser_run.add_argument(
+        "schematic",
+        type=str,
+        help=(
+            "Path to the autobot schematic. To apply several schematics in one pass, "
+            "provide a comma-separated list of schematics, or a directory of "
+            "schematics."
+        ),
     )
     parser_run.add_argument(
-        "schematic", type=str, help="Path to the autobot schematic."
+        "files", type=str, nargs="*", help="Path to the files to refactor."
     )
     parser_run.add_argument(
-        "files", type=str, nargs="+", help="Path to the files to refactor."
+        "--at",
+        type=_location,
+        default=None,
+        metavar="FILE:LINE",
+        help=(
+            "Refactor only the function or class that encloses the given line, and "
+            "write the result to stdout, rather than saving patches for review. "
+            "(Replaces files.)"
+        ),
+    )
+    parser_run.add_argument(
+        "--format",
+        type=str,
+        default="diff",
+        choices=("diff", "json"),
+        help="With --at, whether to write the result as a unified diff, or as JSON.",
     )
     parser_run.add_argument(
         "--model",
         type=str,
-        default="text-davinci-002",
-        choices=(
-            "text-davinci-002",
-            "text-curie-001",
-            "text-babbage-001",
-            "text-ada-001",
-            "code-davinci-002",
-            "code-cushman-001",
-        ),
+        default=DEFAULT_MODEL,
+        choices=tuple(MODELS),
         help=(
             "The OpenAI model to use when generating completions. "
             "(Note: OpenAI's Codex models are currently in private beta.)"
         ),
     )
+    parser_run.add_argument(
+        "--models",
+        type=_model_list,
+        default=None,
+        help=(
+            "A comma-separated cascade of models, from cheapest to most capable "
+            "(e.g., text-curie-001,text-davinci-002). Each snippet is sent to the "
+            "first model, and escalated to the next if its fix fails validation. "
+            "(Overrides --model.)"
+        ),
+    )
     parser_run.add_argument(
         "--nthreads",
         type=int,
         default=8,
         help="The number of threads to use when generating completions.",
     )
+    parser_run.add_argument(
+        "--max-snippet-len",
+        type=int,
+        default=None,
+        help=(
+            "The maximum length (in characters) of a snippet to send to the model. "
+            "Oversized classes are split into their methods; other oversized "
+            "snippets are skipped. (Defaults to a model-specific limit.)"
+        ),
+    )
+    parser_run.add_argument(
+        "--pack-size",
+        type=int,
+        default=1,
+        help=(
+            "The maximum number of small snippets to pack into a single prompt, to "
+            "avoid repeating the schematic's example for each snippet. (Defaults to "
+            "1, i.e., no packing.)"
+        ),
+    )
+    parser_run.add_argument(
+        "--compress-prompts",
+        action="store_true",
+        help=(
+            "Replace docstrings and comments with placeholders in each prompt, and "
+            "restore them in each fix. (Not suitable for schematics that change "
+            "docstrings or comments.)"
+        ),
+    )
+    parser_run.add_argument(
+        "--max-retries",
+        type=int,
+        default=1,
+        help=(
+            "The number of times to retry a fix that fails validation (i.e., doesn't "
+            "parse, doesn't define the same node, or fails the schematic's check) "
+            "before discarding it. (Defaults to 1.)"
+        ),
+    )
+    parser_run.add_argument(
+        "--api-base",
+        type=str,
+        default=None,
+        help=(
+            "The base URL of the OpenAI API (e.g., to use a proxy, or a local stand-in "
+            "server). (Defaults to $OPENAI_API_BASE, if set.)"
+        ),
+    )
+    parser_run.add_argument(
+        "--stream",
+        action="store_true",
+        help=(
+            "Stream each rewrite, and stop generating as soon as it's reproduced the "
+            "original snippet or run past its end. (Cancelled completions are not "
+            "cached.)"
+        ),
+    )
+    parser_run.add_argument(
+        "--watch",
+        action="store_true",
+        help=(
+            "After the initial run, watch the target files, and re-run the schematics "
+            "on each file that changes (replacing its pending patches), until "
+            "interrupted."
+        ),
+    )
+    parser_run.add_argument(
+        "--poll",
+        action="store_true",
+        help=(
+            "With --watch, poll for changes, rather than using inotify (e.g., on "
+            "network filesystems). (Polling is used regardless where inotify is "
+            "unavailable.)"
+        ),
+    )
+    parser_run.add_argument(
+        "--shard",
+        type=_shard,
+        default=None,
+        metavar="INDEX/COUNT",
+        help=(
+            "Fix only the given (1-indexed) shard of the unique snippets, e.g., 1/4, "
+            "such that a run can be split across workers (and combined with `autobot "
+            "merge`). Every worker agrees on the partition. If OPENAI_API_KEYS (and "
+            "OPENAI_ORGANIZATIONS) is set to a comma-separated list, each shard uses "
+            "one of its keys in turn."
+        ),
+    )
+    parser_run.add_argument(
+        "--resume",
+        action="store_true",
+        help=(
+            "Resume an interrupted run (with the same schematics and options) from its "
+            "journal (.autobot_journal.jsonl), re-using the files it parsed, the "
+            "completions it received, and the patches it saved. (The journal is "
+            "removed once a run finishes.)"
+        ),
+    )
+    parser_run.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help=(
+            "The seed with which to break ties when scheduling prompts (which are "
+            "otherwise sent longest first, after serving any cached completions), "
+            "such that runs are reproducible."
+        ),
+    )
+    parser_run.add_argument(
+        "--rate-limit",
+        type=float,
+        default=None,
+        help="The maximum number of requests per minute to send to the OpenAI API.",
+    )
+    parser_run.add_argument(
+        "--estimate",
+        action="store_true",
+        help=(
+            "Estimate the cost and duration of the run, without making any API "
+            "calls or generating any patches."
+        ),
+    )
+    parser_run.add_argument(
+        "--max-cost",
+        type=float,
+        default=None,
+        help=(
+            "With --estimate, exit with a non-zero status if the estimated cost (in "
+            "USD) exceeds this amount. (The cost covers the first model alone, since "
+            "escalation only follows an invalid fix.)"
+        ),
+    )
+    parser_run.add_argument(
+        "--metrics-out",
+        type=str,
+        action="append",
+        help=(
+            "Write a report of the run's metrics (stage timings, cache hit rate, API "
+            "latencies, token usage, and retries) to this path. Paths ending in "
+            "`.prom` are written in the Prometheus text format; all others as JSON. "
+            "May be repeated."
+        ),
+    )
+    parser_run.add_argument(
+        "--record",
+        type=str,
+        default=None,
+        help=(
+            "Record every completion request and response (including cache hits) to "
+            "this path, as a gzip-compressed JSON Lines archive."
+        ),
+    )
+    parser_run.add_argument(
+        "--replay",
+        type=str,
+        default=None,
+        help=(
+            "Serve completions from an archive written by --record, without "
+            "accessing the OpenAI API or the cache."
+        ),
+    )
+    parser_run.add_argument(
+        "--replay-latency",
+        type=str,
+        default="zero",
+        choices=("zero", "original"),
+        help=(
+            "With --replay, whether to serve responses immediately, or after the "
+            "latency with which they were originally received."
+        ),
+    )
+    _add_profiling_arguments(parser_run)
     parser_run.add_argument(
         "--verbose",
         action="store_true",
@@ -118,8 +804,124 @@ def main() -> None:
         description="An automated code refactoring tool.",
         usage="autobot review",
     )
+    _add_profiling_arguments(parser_review)
     parser_review.set_defaults(func=review)
 
+    # autobot merge
+    parser_merge = subparsers.add_parser(
+        "merge",
+        description=(
+            "Merge the patches and cached completions generated by several workers "
+            "(e.g., via `autobot run --shard`) into the current directory, for review."
+        ),
+        usage="autobot merge [shards [shards ...]]",
+    )
+    parser_merge.add_argument(
+        "shards",
+        type=str,
+        nargs="+",
+        help=(
+            "Path to each worker's output directory, i.e., a directory containing "
+            ".autobot_patches and/or .autobot_cache."
+        ),
+    )
+    parser_merge.set_defaults(func=merge)
+
+    # autobot cache
+    parser_cache = subparsers.add_parser(
+        "cache",
+        description=(
+            "Share cached completions across machines. The cache directory defaults "
+            "to .autobot_cache, and can be overridden via AUTOBOT_CACHE_DIR."
+        ),
+        usage="autobot cache {export,import,merge}",
+    )
+    cache_subparsers = parser_cache.add_subparsers()
+
+    parser_cache_export = cache_subparsers.add_parser(
+        "export", description="Export cached completions to a bundle."
+    )
+    parser_cache_export.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default=None,
+        help=(
+            "The path to which to write the bundle. (Defaults to a name derived from "
+            "the bundle's contents.)"
+        ),
+    )
+    parser_cache_export.add_argument(
+        "--model",
+        type=str,
+        action="append",
+        choices=tuple(MODELS),
+        help="Only export completions generated by this model. May be repeated.",
+    )
+    parser_cache_export.add_argument(
+        "--schematic",
+        type=str,
+        action="append",
+        help="Only export completions generated for this schematic. May be repeated.",
+    )
+    parser_cache_export.set_defaults(func=cache_export)
+
+    parser_cache_import = cache_subparsers.add_parser(
+        "import",
+        description="Import the completions in one or more bundles into the cache.",
+    )
+    parser_cache_import.add_argument(
+        "bundles", type=str, nargs="+", help="Path to the bundles to import."
+    )
+    parser_cache_import.set_defaults(func=cache_import)
+
+    parser_cache_merge = cache_subparsers.add_parser(
+        "merge", description="Merge several bundles into one."
+    )
+    parser_cache_merge.add_argument(
+        "bundles", type=str, nargs="+", help="Path to the bundles to merge."
+    )
+    parser_cache_merge.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default=None,
+        help=(
+            "The path to which to write the merged bundle. (Defaults to a name "
+            "derived from the bundle's contents.)"
+        ),
+    )
+    parser_cache_merge.set_defaults(func=cache_merge)
+
+    # autobot serve
+    parser_serve = subparsers.add_parser(
+        "serve",
+        description=(
+            "Run a daemon that serves `autobot run` requests (via `autobot --connect "
+            "run ...`), keeping schematics, parsed files, cached completions, and "
+            "connections warm between runs."
+        ),
+    )
+    parser_serve.add_argument(
+        "--socket",
+        type=str,
+        default=None,
+        help="The path of the Unix socket on which to listen. (Defaults to a "
+        "per-user socket in $XDG_RUNTIME_DIR, or the temporary directory.)",
+    )
+    parser_serve.set_defaults(func=serve)
+
+    return parser
+
+
+def main() -> None:
+    # Forward the command to a daemon without loading anything else.
+    if len(sys.argv) > 1 and sys.argv[1].partition("=")[0] == "--connect":
+        _connect(sys.argv[1:])
+
+    load_dotenv()
+
+    parser = build_parser()
     args = parser.parse_args()
     if hasattr(args, "func"):
         args.func(args)
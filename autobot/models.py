@@ -0,0 +1,91 @@
+"""Metadata for the OpenAI models supported by autobot."""
+
+from __future__ import annotations
+
+from typing import NamedTuple
+
+from autobot.tokens import P50K_BASE, R50K_BASE
+
+DEFAULT_MODEL: str = "text-davinci-002"
+
+# The approximate fixed overhead (in seconds) of each request, before generation.
+REQUEST_LATENCY: float = 0.5
+
+
+class Model(NamedTuple):
+    name: str
+    # The tokenizer used by the model.
+    encoding: str
+    # The maximum number of tokens (across the prompt and completion) per request.
+    context_window: int
+    # The maximum length (in characters) of a snippet to send to the model. Oversized
+    # classes are decomposed into smaller pieces; other oversized snippets are skipped.
+    max_snippet_len: int
+    # The price (in USD) per 1,000 tokens, across the prompt and completion.
+    cost_per_1k_tokens: float
+    # The approximate rate (in tokens per second) at which completions are generated.
+    tokens_per_second: float
+
+
+# N.B. The Codex models are free to use during their private beta.
+MODELS: dict[str, Model] = {
+    model.name: model
+    for model in (
+        Model(
+            "text-davinci-002",
+            P50K_BASE,
+            context_window=4097,
+            max_snippet_len=1600,
+            cost_per_1k_tokens=0.02,
+            tokens_per_second=25,
+        ),
+        Model(
+            "text-curie-001",
+            R50K_BASE,
+            context_window=2049,
+            max_snippet_len=1200,
+            cost_per_1k_tokens=0.002,
+            tokens_per_second=50,
+        ),
+        Model(
+            "text-babbage-001",
+            R50K_BASE,
+            context_window=2049,
+            max_snippet_len=1200,
+            cost_per_1k_tokens=0.0005,
+            tokens_per_second=80,
+        ),
+        Model(
+            "text-ada-001",
+            R50K_BASE,
+            context_window=2049,
+            max_snippet_len=1200,
+            cost_per_1k_tokens=0.0004,
+            tokens_per_second=100,
+        ),
+        Model(
+            "code-davinci-002",
+            P50K_BASE,
+            context_window=8001,
+            max_snippet_len=3200,
+            cost_per_1k_tokens=0.0,
+            tokens_per_second=25,
+        ),
+        Model(
+            "code-cushman-001",
+            P50K_BASE,
+            context_window=2048,
+            max_snippet_len=1200,
+            cost_per_1k_tokens=0.0,
+            tokens_per_second=60,
+        ),
+    )
+}
+
+
+def get_model(name: str) -> Model:
+    """Look up the metadata for a model by name."""
+    try:
+        return MODELS[name]
+    except KeyError:
+        raise ValueError(f"Unknown model: {name}") from None
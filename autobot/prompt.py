@@ -1,17 +1,54 @@
 from __future__ import annotations
 
+import logging
+import math
+import re
 from typing import TYPE_CHECKING, NamedTuple, cast
 
-from autobot import api
+from autobot import api, edits
+from autobot.models import DEFAULT_MODEL, get_model
+from autobot.streaming import RewriteMonitor
+from autobot.tokens import count_tokens
+from autobot.utils import cache, metrics
 
 if TYPE_CHECKING:
     from autobot.transforms import TransformType
 
+# Headroom for completions that are longer than the original snippet, as a ratio of the
+# snippet's length in tokens, plus a fixed allowance for the stop sequence.
+COMPLETION_GROWTH_RATIO: float = 1.25
+COMPLETION_STOP_ALLOWANCE: int = 16
+
+# The number of times to retry a truncated completion with a larger budget.
+MAX_TRUNCATION_RETRIES: int = 2
+
+
+class TruncatedCompletionError(Exception):
+    pass
+
 
 class Prompt(NamedTuple):
     text: str
     max_tokens: int
     stop: str | list[str] | None
+    # The estimated number of tokens in the prompt.
+    prompt_tokens: int
+    # The estimated number of tokens in the completion.
+    completion_tokens: int
+    # The snippet to rewrite, for prompts that ask for a single full rewrite (against
+    # which to check a streamed completion).
+    snippet: str | None = None
+
+
+def completion_budget(
+    *, prompt_tokens: int, completion_tokens: int, model: str = DEFAULT_MODEL
+) -> int:
+    """Return the `max_tokens` to request for a completion of the estimated size."""
+    budget = (
+        math.ceil(completion_tokens * COMPLETION_GROWTH_RATIO)
+        + COMPLETION_STOP_ALLOWANCE
+    )
+    return max(1, min(budget, get_model(model).context_window - prompt_tokens))
 
 
 def make_prompt(
@@ -22,11 +59,11 @@ def make_prompt(
     after_text: str,
     before_description: str,
     after_description: str,
+    model: str = DEFAULT_MODEL,
 ) -> Prompt:
     """Construct a Prompt object from a source snippet."""
     node_name = transform_type.plaintext_name()
-    return Prompt(
-        f"""### Python {node_name} {before_description}
+    text = f"""### Python {node_name} {before_description}
 {before_text}
 
 ### The same Python {node_name} {after_description}
@@ -37,22 +74,213 @@ def make_prompt(
 ### End of {node_name}
 
 ### Now rewrite the Python {node_name} {after_description}
-""",
-        max_tokens=len(snippet) // 2,
+"""
+    encoding = get_model(model).encoding
+    prompt_tokens = count_tokens(text, encoding=encoding)
+    completion_tokens = count_tokens(snippet, encoding=encoding)
+    return Prompt(
+        text,
+        max_tokens=completion_budget(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            model=model,
+        ),
         stop=f"### End of {node_name}",
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        snippet=snippet,
+    )
+
+
+def make_edit_prompt(
+    snippet: str,
+    *,
+    transform_type: TransformType,
+    before_text: str,
+    after_text: str,
+    before_description: str,
+    after_description: str,
+    model: str = DEFAULT_MODEL,
+) -> Prompt:
+    """Construct a Prompt that asks for an edit script, rather than a full rewrite.
+
+    The completion can be applied to the snippet via `edits.apply_edit_script`.
+    """
+    node_name = transform_type.plaintext_name()
+    example_script = edits.make_edit_script(before_text, after_text)
+    text = f"""### Python {node_name} {before_description}
+{edits.number_lines(before_text)}
+### End of {node_name}
+
+### Line edits to make the Python {node_name} {after_description}
+{example_script}
+### End of edits
+
+### Python {node_name} {before_description}
+{edits.number_lines(snippet)}
+### End of {node_name}
+
+### Line edits to make the Python {node_name} {after_description}
+"""
+    encoding = get_model(model).encoding
+    prompt_tokens = count_tokens(text, encoding=encoding)
+    snippet_tokens = count_tokens(snippet, encoding=encoding)
+    # Assume that the snippet requires about as many changes as the example, relative
+    # to its length, but budget for an edit to every line.
+    completion_tokens = math.ceil(
+        snippet_tokens
+        * count_tokens(example_script, encoding=encoding)
+        / max(1, count_tokens(before_text, encoding=encoding))
+    )
+    return Prompt(
+        text,
+        max_tokens=completion_budget(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=count_tokens(
+                edits.number_lines(snippet), encoding=encoding
+            ),
+            model=model,
+        ),
+        stop="### End of edits",
+        prompt_tokens=prompt_tokens,
+        completion_tokens=max(1, completion_tokens),
+    )
+
+
+def _packed_header(node_name: str, index: int, count: int) -> str:
+    return f"### Python {node_name} {index + 1} of {count}"
+
+
+def is_packable(snippet: str) -> bool:
+    """Return True if a snippet can be safely delimited within a packed prompt."""
+    return not any(line.startswith("###") for line in snippet.splitlines())
+
+
+def make_packed_prompt(
+    snippets: list[str],
+    *,
+    transform_type: TransformType,
+    before_text: str,
+    after_text: str,
+    before_description: str,
+    after_description: str,
+    model: str = DEFAULT_MODEL,
+) -> Prompt:
+    """Construct a single Prompt that asks for a fix to each of several snippets.
+
+    The completion can be split back into a fix per snippet via `parse_packed`.
+    """
+    node_name = transform_type.plaintext_name()
+    count = len(snippets)
+    sections = "".join(
+        f"{_packed_header(node_name, i, count)} {before_description}\n{snippet}\n"
+        for i, snippet in enumerate(snippets)
     )
+    # N.B. The prompt ends with the header of the first fix, to establish the format.
+    text = f"""### Python {node_name} {before_description}
+{before_text}
+
+### The same Python {node_name} {after_description}
+{after_text}
+
+{sections}### End of snippets
+
+### Now rewrite each Python {node_name} {after_description}
+{_packed_header(node_name, 0, count)} {after_description}
+"""
+    encoding = get_model(model).encoding
+    prompt_tokens = count_tokens(text, encoding=encoding)
+    completion_tokens = sum(
+        count_tokens(snippet, encoding=encoding)
+        + count_tokens(_packed_header(node_name, i, count), encoding=encoding)
+        for i, snippet in enumerate(snippets)
+    )
+    return Prompt(
+        text,
+        max_tokens=completion_budget(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            model=model,
+        ),
+        stop="### End of snippets",
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+    )
+
+
+def parse_packed(
+    completion: str, *, transform_type: TransformType, count: int
+) -> list[str] | None:
+    """Split the completion of a packed prompt into a fix per snippet.
+
+    Returns None if the completion doesn't contain exactly one fix per snippet, in
+    order.
+    """
+    node_name = transform_type.plaintext_name()
+    header = re.compile(
+        rf"^### Python {re.escape(node_name)} (\d+) of {count}\b.*\n", re.MULTILINE
+    )
+    # Restore the header of the first fix, which was included in the prompt.
+    completion = f"{_packed_header(node_name, 0, count)}\n{completion}"
+    matches = list(header.finditer(completion))
+    if [int(match.group(1)) for match in matches] != list(range(1, count + 1)):
+        return None
+    fixes: list[str] = []
+    for match, following in zip(matches, [*matches[1:], None]):
+        end = following.start() if following is not None else len(completion)
+        fixes.append(completion[match.end() : end])
+    return fixes
+
+
+def is_cached(prompt: Prompt, *, model: str = DEFAULT_MODEL) -> bool:
+    """Return True if a completion for the prompt is available in the cache."""
+    return cache.has_in_cache(
+        api.request_hash(
+            prompt.text,
+            prompt.max_tokens,
+            temperature=0,
+            model=model,
+            stop=prompt.stop,
+        )
+    )
+
+
+def resolve_prompt(
+    prompt: Prompt, *, model: str = DEFAULT_MODEL, temperature: float = 0
+) -> str:
+    """Generate a completion for a prompt.
+
+    If the completion is truncated, retries with a larger token budget, up to the limit
+    of the model's context window.
+    """
+    max_tokens = prompt.max_tokens
+    limit = get_model(model).context_window - prompt.prompt_tokens
+    for _ in range(MAX_TRUNCATION_RETRIES + 1):
+        response = api.create_completion(
+            prompt=prompt.text,
+            max_tokens=max_tokens,
+            stop=prompt.stop,
+            model=model,
+            temperature=temperature,
+            monitor=RewriteMonitor(prompt.snippet)
+            if prompt.snippet is not None
+            else None,
+        )
+        for choice in response["choices"]:
+            if choice.get("finish_reason") != "length":
+                return cast(str, choice["text"])
+            break
+        else:
+            raise Exception("Request failed to generate choices.")
 
+        if max_tokens >= limit:
+            break
+        logging.info(f"Completion truncated at {max_tokens} tokens; retrying...")
+        metrics.increment("autobot_completion_retries_total", reason="truncated")
+        max_tokens = min(max_tokens * 2, limit)
 
-def resolve_prompt(prompt: Prompt, *, model: str = "text-davinci-002") -> str:
-    """Generate a completion for a prompt."""
-    response = api.create_completion(
-        prompt=prompt.text,
-        max_tokens=prompt.max_tokens,
-        stop=prompt.stop,
-        model=model,
-        temperature=0,
+    metrics.increment("autobot_completions_discarded_total", reason="truncated")
+    raise TruncatedCompletionError(
+        f"Completion truncated after {MAX_TRUNCATION_RETRIES + 1} attempts "
+        f"(max_tokens={max_tokens})."
     )
-    for choice in response["choices"]:
-        return cast(str, choice["text"])
-    else:
-        raise Exception("Request failed to generate choices.")
@@ -1,3 +1,15 @@
+from .estimate import run_estimate
+from .journal import Journal, JournalError
 from .refactor import run_refactor
+from .targeted import TargetError, run_targeted
+from .watch import run_watch
 
-__all__ = ["run_refactor"]
+__all__ = [
+    "Journal",
+    "JournalError",
+    "TargetError",
+    "run_estimate",
+    "run_refactor",
+    "run_targeted",
+    "run_watch",
+]
@@ -0,0 +1,94 @@
+"""Compose the rewrites that several schematics suggest for the same snippet."""
+
+from __future__ import annotations
+
+import difflib
+from typing import NamedTuple
+
+from autobot.validation import validate_fix
+
+
+class Edit(NamedTuple):
+    # The range of lines in the original text to replace.
+    start: int
+    end: int
+    # The lines with which to replace them.
+    lines: list[str]
+
+
+class Composition(NamedTuple):
+    # The original text, with every non-conflicting rewrite applied.
+    text: str
+    # The indices of the rewrites that were applied.
+    applied: list[int]
+    # The indices of the rewrites that conflicted with an earlier rewrite.
+    conflicting: list[int]
+
+
+def _lines(text: str) -> list[str]:
+    # N.B. Patches are constructed line-by-line, so trailing newlines are irrelevant.
+    return text.rstrip("\n").splitlines()
+
+
+def diff_edits(before: str, after: str) -> list[Edit]:
+    """Return the line-level edits that transform one text into another."""
+    before_lines = _lines(before)
+    after_lines = _lines(after)
+    return [
+        Edit(i1, i2, after_lines[j1:j2])
+        for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(
+            None, before_lines, after_lines, autojunk=False
+        ).get_opcodes()
+        if tag != "equal"
+    ]
+
+
+def conflicts(a: Edit, b: Edit) -> bool:
+    """Return True if two edits touch the same lines."""
+    if a.start < b.end and b.start < a.end:
+        return True
+    # Insertions conflict with any edit at (or adjacent to) the same position, since
+    # their relative order is ambiguous.
+    return (a.start == a.end or b.start == b.end) and (
+        a.start <= b.end and b.start <= a.end
+    )
+
+
+def apply_edits(before: str, edits: list[Edit]) -> str:
+    """Apply a set of non-conflicting edits to a text."""
+    lines = _lines(before)
+    for edit in sorted(edits, key=lambda edit: (edit.start, edit.end), reverse=True):
+        lines[edit.start : edit.end] = edit.lines
+    return "\n".join(lines)
+
+
+def compose(before: str, afters: list[str]) -> Composition:
+    """Merge several rewrites of the same text into one, in order.
+
+    Rewrites that touch lines already changed by an earlier rewrite are left out, and
+    reported as conflicting (such that they can be re-applied to the composed text). So
+    are rewrites that, merged with the earlier rewrites, don't produce a valid fix (e.g.,
+    if one removes an assignment and another removes its use). If no rewrite changes
+    the text, it's returned as-is.
+    """
+    accepted: list[Edit] = []
+    applied: list[int] = []
+    conflicting: list[int] = []
+    for i, after in enumerate(afters):
+        edits = diff_edits(before, after)
+        if not edits:
+            continue
+        if any(conflicts(edit, other) for edit in edits for other in accepted):
+            conflicting.append(i)
+            continue
+        # N.B. Each rewrite was validated on its own, but rewrites of disjoint lines
+        # can still be invalid together.
+        merged = apply_edits(before, accepted + edits)
+        if accepted and validate_fix(before, merged) is not None:
+            conflicting.append(i)
+            continue
+        accepted.extend(edits)
+        applied.append(i)
+    if not accepted:
+        return Composition(before, applied, conflicting)
+    return Composition(apply_edits(before, accepted), applied, conflicting)
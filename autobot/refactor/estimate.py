@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, NamedTuple
+
+from rich.console import Console
+
+from autobot import prompt
+from autobot.models import REQUEST_LATENCY, get_model
+from autobot.refactor.refactor import (
+    extract_for_schematics,
+    make_batches,
+    make_prompts,
+)
+
+if TYPE_CHECKING:
+    from autobot.schematic import Schematic
+
+
+class Estimate(NamedTuple):
+    """The projected cost of running a set of schematics with a given model."""
+
+    model: str
+    # The number of snippets to which the schematics would be applied.
+    num_snippets: int
+    # The number of unique prompts required to fix those snippets.
+    num_prompts: int
+    # The number of prompts with a completion in the cache.
+    num_cached: int
+    # The estimated number of tokens across all uncached prompts.
+    prompt_tokens: int
+    # The estimated number of tokens across all uncached completions.
+    completion_tokens: int
+    # The estimated cost (in USD) of the uncached requests.
+    cost: float
+    # The estimated wall-clock time (in seconds) to complete the uncached requests.
+    wall_time: float
+    # The (approximate) number of tokens in nested snippets left out by the schematics'
+    # node selection.
+    tokens_saved: int = 0
+    # The models to which invalid fixes would be escalated, in order.
+    escalation: tuple[str, ...] = ()
+    # The estimated additional cost (in USD) if every snippet were escalated through
+    # every model in `escalation` (i.e., a worst case, since escalation only follows
+    # an invalid fix).
+    escalation_cost: float = 0.0
+
+    @property
+    def num_uncached(self) -> int:
+        return self.num_prompts - self.num_cached
+
+
+def estimate_wall_time(
+    latencies: list[float], *, nthreads: int, rate_limit: float | None
+) -> float:
+    """Estimate the time to complete a set of requests across a pool of threads."""
+    if not latencies:
+        return 0.0
+    wall_time = max(sum(latencies) / nthreads, max(latencies))
+    if rate_limit:
+        wall_time = max(wall_time, len(latencies) / rate_limit * 60)
+    return wall_time
+
+
+def estimate_refactor(
+    *,
+    schematics: list[Schematic],
+    targets: list[str],
+    nthreads: int,
+    model: str,
+    max_snippet_len: int,
+    rate_limit: float | None = None,
+    pack_size: int = 1,
+    compress: bool = False,
+    shard: tuple[int, int] | None = None,
+    escalation: tuple[str, ...] = (),
+) -> Estimate:
+    """Estimate the cost of a refactor (or of a single shard thereof), without making
+    any API calls.
+
+    The cost and time cover `model` alone. The cost of escalating to each model in
+    `escalation` is estimated separately, as a worst case, since it depends on how
+    many fixes turn out to be invalid.
+
+    N.B. Fixes that have to be chained (i.e., where two schematics change the same
+    lines) require additional prompts, which aren't accounted for.
+    """
+    extractions = extract_for_schematics(
+        schematics, targets=targets, max_snippet_len=max_snippet_len, shard=shard
+    )
+    prompts: list[prompt.Prompt] = []
+    for schematic in schematics:
+        prompts.extend(
+            batch.prompt
+            for batch in make_batches(
+                extractions[schematic.transform_type, schematic.selection].texts,
+                schematic=schematic,
+                model=model,
+                pack_size=pack_size,
+                compress=compress,
+            )
+        )
+    uncached = [p for p in prompts if not prompt.is_cached(p, model=model)]
+
+    # N.B. Escalated snippets are prompted individually, and in full.
+    escalation_cost = 0.0
+    for tier_model in escalation:
+        tier_prompts = [
+            p
+            for schematic in schematics
+            for p in make_prompts(
+                extractions[schematic.transform_type, schematic.selection].texts,
+                schematic=schematic,
+                model=tier_model,
+            ).values()
+            if not prompt.is_cached(p, model=tier_model)
+        ]
+        escalation_cost += (
+            sum(p.prompt_tokens + p.completion_tokens for p in tier_prompts)
+            / 1000
+            * get_model(tier_model).cost_per_1k_tokens
+        )
+
+    spec = get_model(model)
+    prompt_tokens = sum(p.prompt_tokens for p in uncached)
+    completion_tokens = sum(p.completion_tokens for p in uncached)
+    return Estimate(
+        model=model,
+        num_snippets=sum(
+            len(snippets)
+            for extraction in extractions.values()
+            for snippets in extraction.filename_to_snippets.values()
+        ),
+        num_prompts=len(prompts),
+        num_cached=len(prompts) - len(uncached),
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        cost=(prompt_tokens + completion_tokens) / 1000 * spec.cost_per_1k_tokens,
+        wall_time=estimate_wall_time(
+            [
+                REQUEST_LATENCY + p.completion_tokens / spec.tokens_per_second
+                for p in uncached
+            ],
+            nthreads=nthreads,
+            rate_limit=rate_limit,
+        ),
+        tokens_saved=sum(
+            extraction.tokens_saved for extraction in extractions.values()
+        ),
+        escalation=escalation,
+        escalation_cost=escalation_cost,
+    )
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h {minutes}m {seconds}s"
+    if minutes:
+        return f"{minutes}m {seconds}s"
+    return f"{seconds}s"
+
+
+def run_estimate(
+    *,
+    schematics: list[Schematic],
+    targets: list[str],
+    nthreads: int,
+    model: str,
+    max_snippet_len: int,
+    rate_limit: float | None = None,
+    pack_size: int = 1,
+    compress: bool = False,
+    shard: tuple[int, int] | None = None,
+    escalation: tuple[str, ...] = (),
+) -> Estimate:
+    console = Console()
+
+    titles = ", ".join(schematic.title for schematic in schematics)
+    console.print(
+        f"[bold]Estimating [bold cyan]{titles}[/] ({model})"
+        + (f" [dim](shard {shard[0]}/{shard[1]})" if shard is not None else "")
+    )
+    estimate = estimate_refactor(
+        schematics=schematics,
+        targets=targets,
+        nthreads=nthreads,
+        model=model,
+        max_snippet_len=max_snippet_len,
+        rate_limit=rate_limit,
+        pack_size=pack_size,
+        compress=compress,
+        shard=shard,
+        escalation=escalation,
+    )
+
+    console.print(
+        f"  Snippets:           {estimate.num_snippets:,} "
+        f"({estimate.num_prompts:,} unique prompts)"
+    )
+    console.print(f"  Cached:             {estimate.num_cached:,}")
+    console.print(f"  Uncached prompts:   {estimate.num_uncached:,}")
+    console.print(f"  Prompt tokens:      {estimate.prompt_tokens:,}")
+    console.print(f"  Completion tokens:  {estimate.completion_tokens:,}")
+    if estimate.tokens_saved:
+        console.print(
+            f"  Tokens saved:       {estimate.tokens_saved:,} (nested snippets)"
+        )
+    console.print(f"  Estimated cost:     ${estimate.cost:,.2f} ({model} only)")
+    if estimate.escalation:
+        console.print(
+            f"  Escalation cost:    up to ${estimate.escalation_cost:,.2f} "
+            f"(if every fix escalates to {', '.join(estimate.escalation)})"
+        )
+    console.print(
+        f"  Estimated time:     {_format_duration(estimate.wall_time)} "
+        f"({nthreads} threads"
+        + (f", {rate_limit:g} requests/min)" if rate_limit else ")")
+    )
+
+    return estimate
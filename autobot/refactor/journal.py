@@ -0,0 +1,286 @@
+"""An append-only journal of a run's progress, such that an interrupted run can resume.
+
+The journal is a JSON Lines file, with one record per event:
+
+- `start`: the run's configuration, and the files that it targets.
+- `parse`: the snippets extracted from a file (for a given transform type and node
+  selection), along with the file's modification time and size.
+- `completion`: the fix suggested by a schematic for a snippet.
+- `node`: a snippet for which a patch has been written (or wasn't needed).
+
+Each record is flushed as soon as it's written, such that the journal survives the
+process being interrupted or killed. A partially-written final record is ignored. Once
+the run finishes, the journal is removed.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from typing import IO, TYPE_CHECKING, Any
+
+from autobot.refactor import patches
+from autobot.snippet import Snippet
+
+if TYPE_CHECKING:
+    from autobot.schematic import Schematic
+    from autobot.transforms import NodeSelection, TransformType
+
+JOURNAL_FILENAME = ".autobot_journal.jsonl"
+JOURNAL_VERSION: int = 1
+
+# A file's modification time (in nanoseconds) and size.
+Signature = tuple[int, int]
+
+
+class JournalError(Exception):
+    pass
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def signature(filename: str) -> Signature | None:
+    """Return the signature of a file, or None if it no longer exists."""
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def make_config(schematics: list[Schematic], **options: Any) -> dict[str, Any]:
+    """Describe a run, such that a journal is only resumed by an equivalent run."""
+    return {
+        "schematics": [
+            {
+                "title": schematic.title,
+                "transform_type": schematic.transform_type.value,
+                "protocol": schematic.protocol.value,
+                "selection": schematic.selection.value,
+                "digest": _digest(
+                    json.dumps([
+                        schematic.before_text,
+                        schematic.after_text,
+                        schematic.before_description,
+                        schematic.after_description,
+                    ])
+                ),
+            }
+            for schematic in schematics
+        ],
+        **options,
+    }
+
+
+class Journal:
+    """Records (and, when resuming, replays) the progress of a run.
+
+    N.B. Not thread-safe: records are expected to be written from the main thread.
+    """
+
+    def __init__(self, path: str, fp: IO[str], *, targets: list[str]) -> None:
+        self.path = path
+        self.fp = fp
+        self.targets = targets
+        # Map from (filename, transform type, node selection, max snippet length) to
+        # the file's signature, and the (selected, omitted) snippets extracted from it.
+        self.parsed: dict[
+            tuple[str, str, str, int],
+            tuple[Signature, tuple[tuple[Snippet, ...], frozenset[str]]],
+        ] = {}
+        # Map from (schematic title, snippet digest) to the suggested fix.
+        self.completions: dict[tuple[str, str], str] = {}
+        # Map from (filename, line number, snippet digest) to the file's signature, for
+        # each snippet that's been handled.
+        self.nodes: dict[tuple[str, int, str], Signature] = {}
+
+    @classmethod
+    def create(
+        cls, path: str, *, config: dict[str, Any], targets: list[str]
+    ) -> Journal:
+        """Start a new journal, replacing any existing journal at the given path."""
+        journal = cls(path, open(path, "w"), targets=targets)
+        journal._write({
+            "event": "start",
+            "version": JOURNAL_VERSION,
+            "config": config,
+            "targets": targets,
+        })
+        return journal
+
+    @classmethod
+    def resume(cls, path: str, *, config: dict[str, Any]) -> Journal:
+        """Resume the journal at the given path.
+
+        Raises a JournalError if the journal doesn't exist, or if it was written by a
+        run with a different configuration.
+
+        The pending patches for any file that has changed since it was journaled are
+        removed, since they may no longer apply.
+        """
+        try:
+            with open(path, "r") as fp:
+                lines = fp.read().splitlines()
+        except FileNotFoundError:
+            raise JournalError(f"No journal to resume at: {path}") from None
+
+        records: list[dict[str, Any]] = []
+        for i, line in enumerate(lines):
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                if i == len(lines) - 1:
+                    # The run was interrupted mid-write.
+                    break
+                raise JournalError(
+                    f"Corrupt journal at: {path} (line {i + 1})"
+                ) from None
+
+        if not records or records[0].get("event") != "start":
+            raise JournalError(f"Corrupt journal at: {path} (no start record)")
+        start = records[0]
+        if start.get("version") != JOURNAL_VERSION:
+            raise JournalError(
+                f"Unsupported journal version: {start.get('version')} "
+                f"(expected: {JOURNAL_VERSION})"
+            )
+        # N.B. Round-trip through JSON, to compare like with like (e.g., lists, not
+        # tuples).
+        if start["config"] != json.loads(json.dumps(config)):
+            raise JournalError(
+                "The journal was written by a run with different options (or "
+                "schematics); re-run without --resume to start over."
+            )
+
+        # N.B. Rewrite the journal without any trailing partial record, then append.
+        with open(path, "w") as fp:
+            fp.writelines(json.dumps(record) + "\n" for record in records)
+        journal = cls(path, open(path, "a"), targets=start["targets"])
+        for record in records[1:]:
+            journal._replay(record)
+
+        # Discard the progress recorded against any file that has since changed.
+        stale = {
+            filename
+            for (filename, _, _), recorded in journal.nodes.items()
+            if signature(filename) != recorded
+        } | {
+            filename
+            for (filename, *_), (recorded, _) in journal.parsed.items()
+            if signature(filename) != recorded
+        }
+        for filename in stale:
+            patches.clear(filename)
+        journal.nodes = {
+            key: value for key, value in journal.nodes.items() if key[0] not in stale
+        }
+        journal.parsed = {
+            key: value for key, value in journal.parsed.items() if key[0] not in stale
+        }
+        return journal
+
+    def _replay(self, record: dict[str, Any]) -> None:
+        event = record.get("event")
+        if event == "parse":
+            self.parsed[(record["filename"], *record["key"])] = (
+                tuple(record["signature"]),
+                (
+                    tuple(Snippet(*snippet) for snippet in record["snippets"]),
+                    frozenset(record["omitted"]),
+                ),
+            )
+        elif event == "completion":
+            self.completions[(record["schematic"], record["digest"])] = record["fix"]
+        elif event == "node":
+            self.nodes[(record["filename"], record["lineno"], record["digest"])] = (
+                tuple(record["signature"])
+            )
+
+    def _write(self, record: dict[str, Any]) -> None:
+        self.fp.write(json.dumps(record) + "\n")
+        self.fp.flush()
+
+    def get_snippets(
+        self,
+        filename: str,
+        *,
+        signature: Signature,
+        transform_type: TransformType,
+        selection: NodeSelection,
+        max_snippet_len: int,
+    ) -> tuple[tuple[Snippet, ...], frozenset[str]] | None:
+        """Return the snippets journaled for a file, if it hasn't changed since."""
+        key = (filename, transform_type.value, selection.value, max_snippet_len)
+        if (entry := self.parsed.get(key)) is None or entry[0] != signature:
+            return None
+        return entry[1]
+
+    def record_snippets(
+        self,
+        filename: str,
+        *,
+        signature: Signature,
+        transform_type: TransformType,
+        selection: NodeSelection,
+        max_snippet_len: int,
+        snippets: tuple[Snippet, ...],
+        omitted: frozenset[str],
+    ) -> None:
+        key = (transform_type.value, selection.value, max_snippet_len)
+        self.parsed[(filename, *key)] = (signature, (snippets, omitted))
+        self._write({
+            "event": "parse",
+            "filename": filename,
+            "signature": signature,
+            "key": key,
+            "snippets": snippets,
+            "omitted": sorted(omitted),
+        })
+
+    def get_completion(self, schematic: str, text: str) -> str | None:
+        return self.completions.get((schematic, _digest(text)))
+
+    def record_completion(self, schematic: str, text: str, fix: str) -> None:
+        digest = _digest(text)
+        if self.completions.get((schematic, digest)) == fix:
+            return
+        self.completions[(schematic, digest)] = fix
+        self._write({
+            "event": "completion",
+            "schematic": schematic,
+            "digest": digest,
+            "fix": fix,
+        })
+
+    def is_done(self, filename: str, snippet: Snippet) -> bool:
+        """Return True if a snippet was handled (i.e., its patch written, if any)."""
+        return (filename, snippet.lineno, _digest(snippet.text)) in self.nodes
+
+    def record_node(self, filename: str, snippet: Snippet, *, patched: bool) -> None:
+        if (recorded := signature(filename)) is None:
+            return
+        key = (filename, snippet.lineno, _digest(snippet.text))
+        self.nodes[key] = recorded
+        self._write({
+            "event": "node",
+            "filename": filename,
+            "lineno": snippet.lineno,
+            "digest": key[2],
+            "signature": recorded,
+            "patched": patched,
+        })
+
+    def finish(self) -> None:
+        """Remove the journal, since a finished run has nothing left to resume."""
+        self.fp.close()
+        os.remove(self.path)
+
+    def close(self) -> None:
+        if self.fp.closed:
+            return
+        self.fp.flush()
+        os.fsync(self.fp.fileno())
+        self.fp.close()
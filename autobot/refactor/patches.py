@@ -1,21 +1,79 @@
 from __future__ import annotations
 
+import filecmp
 import os
+import re
+import shutil
 import subprocess
 
-PATCH_DIR = os.path.join(os.getcwd(), ".autobot_patches")
+# N.B. Relative to the working directory at the time of use, which may change over the
+# lifetime of a long-lived process.
+PATCH_DIR = ".autobot_patches"
 
 
 def save(patch: str, *, target: str, lineno: int) -> None:
-    """Save a patch to disk."""
+    """Save a patch to disk.
+
+    The patch is written to a temporary file and then moved into place, such that an
+    interrupted run never leaves a partial patch behind.
+    """
     (target_filename, _) = os.path.splitext(target)
     patch_filename = os.path.join(
         PATCH_DIR,
         f"{target_filename}-{lineno}.patch",
     )
     os.makedirs(os.path.dirname(patch_filename), exist_ok=True)
-    with open(patch_filename, "w") as fp:
+    with open(f"{patch_filename}.tmp", "w") as fp:
         fp.write(patch)
+    os.replace(f"{patch_filename}.tmp", patch_filename)
+
+
+def clear(target: str) -> int:
+    """Remove any pending patches for a target.
+
+    Returns: the number of patches removed.
+    """
+    (target_filename, _) = os.path.splitext(target)
+    directory, basename = os.path.split(os.path.join(PATCH_DIR, target_filename))
+    pattern = re.compile(rf"^{re.escape(basename)}-\d+\.patch$")
+    try:
+        filenames = os.listdir(directory)
+    except FileNotFoundError:
+        return 0
+    count = 0
+    for filename in filenames:
+        if pattern.match(filename):
+            os.remove(os.path.join(directory, filename))
+            count += 1
+    return count
+
+
+def merge(patch_dir: str) -> tuple[int, int, list[str]]:
+    """Copy the patches from another patch store (e.g., that of another worker) into
+    this one.
+
+    Returns: a tuple of (number copied, number already present, paths of any patches
+        that conflict with an existing patch, which are left in place).
+    """
+    copied = 0
+    present = 0
+    conflicts: list[str] = []
+    for root, _, filenames in os.walk(patch_dir):
+        for filename in sorted(filenames):
+            if not filename.endswith(".patch"):
+                continue
+            source = os.path.join(root, filename)
+            destination = os.path.join(PATCH_DIR, os.path.relpath(source, patch_dir))
+            if os.path.exists(destination):
+                if filecmp.cmp(source, destination, shallow=False):
+                    present += 1
+                else:
+                    conflicts.append(os.path.relpath(source, patch_dir))
+                continue
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            shutil.copyfile(source, destination)
+            copied += 1
+    return copied, present, conflicts
 
 
 def can_apply(patch_file: str) -> bool:
@@ -1,139 +1,1083 @@
 from __future__ import annotations
 
+import ast
+import contextlib
 import difflib
 import functools
+import hashlib
 import logging
 import os.path
 from multiprocessing.pool import ThreadPool
-from typing import TYPE_CHECKING
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Iterable,
+    Iterator,
+    Mapping,
+    NamedTuple,
+    TypeVar,
+)
 
 from rich.console import Console
 from rich.progress import Progress
 
-from autobot import prompt
+from autobot import edits, prompt
+from autobot.models import get_model
 from autobot.refactor import patches
-from autobot.snippet import Snippet, iter_snippets, recontextualize
+from autobot.refactor.compose import compose
+from autobot.snippet import (
+    CompressedSnippet,
+    DecomposedClass,
+    Snippet,
+    compress_snippet,
+    decompose_class,
+    iter_snippets,
+    recontextualize,
+    restore_snippet,
+    stitch_class,
+)
+from autobot.tokens import count_tokens
+from autobot.transforms import CompletionProtocol, NodeSelection
+from autobot.utils import metrics, profiling
+from autobot.validation import validate_fix
 
 if TYPE_CHECKING:
+    from autobot.refactor.journal import Journal
     from autobot.schematic import Schematic
+    from autobot.transforms import TransformType
 
 
-def _fix_text(
-    text: str,
+# The maximum size (in tokens) of a snippet to consider for packing.
+PACKABLE_SNIPPET_TOKENS: int = 256
+
+# The increase in temperature with each retry of an invalid fix.
+RETRY_TEMPERATURE_STEP: float = 0.4
+
+T = TypeVar("T")
+
+
+class Extraction(NamedTuple):
+    """The snippets extracted from a set of target files."""
+
+    # Map from filename to the snippets to fix within that file.
+    filename_to_snippets: dict[str, list[Snippet]]
+    # Map from snippet text to its decomposition, for any oversized classes.
+    snippet_text_to_decomposition: dict[str, DecomposedClass]
+    # The deduplicated texts for which to generate completions.
+    texts: set[str]
+    # The (approximate) number of tokens in the nested snippets that were left out
+    # by the node selection.
+    tokens_saved: int = 0
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_snippets(
+    filename: str,
     *,
-    schematic: Schematic,
-    model: str,
-) -> tuple[str, str]:
-    """Generate a fix for a piece of source code.
+    mtime_ns: int,
+    size: int,
+    transform_type: TransformType,
+    selection: NodeSelection,
+    max_snippet_len: int,
+) -> tuple[tuple[Snippet, ...], frozenset[str]]:
+    """Parse the snippets in a file, memoized on its modification time and size (such
+    that a long-lived process only re-parses files that have changed).
+
+    Returns: a tuple of (selected snippets, texts of any snippets omitted by the node
+        selection).
+    """
+    with open(filename, "r") as fp:
+        source_code = fp.read()
+    snippets = tuple(
+        iter_snippets(
+            source_code,
+            transform_type.ast_node_type(),
+            selection=selection,
+            max_snippet_len=max_snippet_len,
+        )
+    )
+    if selection == NodeSelection.ALL:
+        return snippets, frozenset()
+    selected = {snippet.text for snippet in snippets}
+    return snippets, frozenset(
+        snippet.text
+        for snippet in iter_snippets(source_code, transform_type.ast_node_type())
+        if snippet.text not in selected and len(snippet.text) <= max_snippet_len
+    )
+
+
+def extract_snippets(
+    *,
+    transform_type: TransformType,
+    targets: list[str],
+    max_snippet_len: int,
+    selection: NodeSelection = NodeSelection.ALL,
+    journal: Journal | None = None,
+) -> Extraction:
+    """Extract the snippets to which schematics of a given type should be applied.
+
+    If a journal is provided, files that were parsed by an interrupted run (and haven't
+    changed since) aren't parsed again.
+    """
+    filename_to_snippets: dict[str, list[Snippet]] = {}
+    snippet_text_to_decomposition: dict[str, DecomposedClass] = {}
+    texts: set[str] = set()
+    omitted: set[str] = set()
+    for filename in targets:
+        with profiling.span("parse", "file", filename=filename):
+            stat = os.stat(filename)
+            signature = (stat.st_mtime_ns, stat.st_size)
+            parsed = (
+                journal.get_snippets(
+                    filename,
+                    signature=signature,
+                    transform_type=transform_type,
+                    selection=selection,
+                    max_snippet_len=max_snippet_len,
+                )
+                if journal is not None
+                else None
+            )
+            if parsed is None:
+                parsed = _parse_snippets(
+                    os.path.abspath(filename),
+                    mtime_ns=stat.st_mtime_ns,
+                    size=stat.st_size,
+                    transform_type=transform_type,
+                    selection=selection,
+                    max_snippet_len=max_snippet_len,
+                )
+                if journal is not None:
+                    journal.record_snippets(
+                        filename,
+                        signature=signature,
+                        transform_type=transform_type,
+                        selection=selection,
+                        max_snippet_len=max_snippet_len,
+                        snippets=parsed[0],
+                        omitted=parsed[1],
+                    )
+            else:
+                metrics.increment("autobot_journal_files_resumed_total")
+            snippets, omitted_texts = parsed
+            omitted.update(omitted_texts)
+
+        filename_to_snippets[filename] = []
+        for snippet in snippets:
+            metrics.increment("autobot_snippets_total")
+            if len(snippet.text) <= max_snippet_len:
+                filename_to_snippets[filename].append(snippet)
+                texts.add(snippet.text)
+                continue
+
+            # If the snippet is an oversized class, break it into its header and
+            # methods, and refactor each piece separately.
+            decomposed = decompose_class(snippet.text)
+            if decomposed is None or len(decomposed.header) > max_snippet_len:
+                logging.warning(
+                    f"Snippet at {filename}:{snippet.lineno} is too long "
+                    f"({len(snippet.text)} > {max_snippet_len}); skipping..."
+                )
+                metrics.increment("autobot_snippets_skipped_total", reason="too_long")
+                continue
+            filename_to_snippets[filename].append(snippet)
+            snippet_text_to_decomposition[snippet.text] = decomposed
+            for part in decomposed.parts:
+                if len(part.text) > max_snippet_len:
+                    logging.warning(
+                        f"Method {part.name} in snippet at {filename}:{snippet.lineno} "
+                        f"is too long ({len(part.text)} > {max_snippet_len}); "
+                        "skipping..."
+                    )
+            texts.update(
+                text for text in decomposed.texts() if len(text) <= max_snippet_len
+            )
+
+    # N.B. Snippets that were omitted in one place may still be selected in another.
+    tokens_saved = sum(count_tokens(text) for text in omitted - texts)
+    metrics.increment("autobot_selection_tokens_saved_total", tokens_saved)
+    return Extraction(
+        filename_to_snippets, snippet_text_to_decomposition, texts, tokens_saved
+    )
+
+
+def in_shard(text: str, shard: tuple[int, int]) -> bool:
+    """Return True if a snippet belongs to the given shard (as a 1-indexed tuple of
+    (index, count)).
+
+    Snippets are assigned by a digest of their text, such that every worker agrees on
+    the partition, and identical snippets (across files) land in the same shard.
+    """
+    index, count = shard
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count == index - 1
+
+
+def shard_extraction(
+    extraction: Extraction, *, shard: tuple[int, int], max_snippet_len: int
+) -> Extraction:
+    """Restrict an extraction to the snippets in a given shard.
+
+    An oversized class is assigned as a whole (along with each of its methods), such
+    that every shard can compose and save the patches for the snippets that it owns.
+    """
+    filename_to_snippets = {
+        filename: [snippet for snippet in snippets if in_shard(snippet.text, shard)]
+        for filename, snippets in extraction.filename_to_snippets.items()
+    }
+    snippet_text_to_decomposition = {
+        text: decomposed
+        for text, decomposed in extraction.snippet_text_to_decomposition.items()
+        if in_shard(text, shard)
+    }
+    texts: set[str] = set()
+    for snippets in filename_to_snippets.values():
+        for snippet in snippets:
+            if (decomposed := snippet_text_to_decomposition.get(snippet.text)) is None:
+                texts.add(snippet.text)
+                continue
+            texts.update(
+                text for text in decomposed.texts() if len(text) <= max_snippet_len
+            )
+    return extraction._replace(
+        filename_to_snippets=filename_to_snippets,
+        snippet_text_to_decomposition=snippet_text_to_decomposition,
+        texts=texts,
+    )
+
+
+def extract_for_schematics(
+    schematics: list[Schematic],
+    *,
+    targets: list[str],
+    max_snippet_len: int,
+    shard: tuple[int, int] | None = None,
+    journal: Journal | None = None,
+) -> dict[tuple[TransformType, NodeSelection], Extraction]:
+    """Extract the snippets for a set of schematics, once per transform type and node
+    selection (regardless of the number of schematics).
 
-    Returns: a tuple of (input, suggested fix), to play nicely with multiprocessing.
+    If `shard` is set, only the snippets in that shard are retained.
     """
-    return text, prompt.resolve_prompt(
-        prompt.make_prompt(
+    extractions: dict[tuple[TransformType, NodeSelection], Extraction] = {}
+    for schematic in schematics:
+        key = (schematic.transform_type, schematic.selection)
+        if key not in extractions:
+            extractions[key] = extract_snippets(
+                transform_type=schematic.transform_type,
+                targets=targets,
+                max_snippet_len=max_snippet_len,
+                selection=schematic.selection,
+                journal=journal,
+            )
+            if shard is not None:
+                extractions[key] = shard_extraction(
+                    extractions[key], shard=shard, max_snippet_len=max_snippet_len
+                )
+    return extractions
+
+
+def make_prompts(
+    texts: Iterable[str],
+    *,
+    schematic: Schematic,
+    model: str,
+    protocol: CompletionProtocol = CompletionProtocol.REWRITE,
+) -> dict[str, prompt.Prompt]:
+    """Construct the prompt to fix each piece of source code."""
+    make_prompt = (
+        prompt.make_edit_prompt
+        if protocol == CompletionProtocol.EDITS
+        else prompt.make_prompt
+    )
+    return {
+        text: make_prompt(
             text,
             transform_type=schematic.transform_type,
             before_text=schematic.before_text,
             after_text=schematic.after_text,
             before_description=schematic.before_description,
             after_description=schematic.after_description,
-        ),
+            model=model,
+        )
+        for text in texts
+    }
+
+
+class Task(NamedTuple):
+    """A snippet to fix with a particular schematic."""
+
+    # The title of the schematic to apply.
+    schematic: str
+    text: str
+
+
+class Batch(NamedTuple):
+    """One or more tasks to resolve with a single prompt."""
+
+    # The schematic to apply to every task in the batch.
+    schematic: Schematic
+    tasks: tuple[Task, ...]
+    prompt: prompt.Prompt
+    # The prompt for each individual task, to fall back to if the completion of a
+    # packed (or compressed) prompt can't be used.
+    fallbacks: tuple[prompt.Prompt, ...]
+    # The compressed form of each task's snippet, if its prompt was compressed.
+    compressions: tuple[CompressedSnippet | None, ...] = ()
+
+
+def make_batches(
+    texts: Iterable[str],
+    *,
+    schematic: Schematic,
+    model: str,
+    pack_size: int = 1,
+    compress: bool = False,
+    use_cache: bool = True,
+) -> list[Batch]:
+    """Group the prompts to fix each piece of source code into batches.
+
+    If `pack_size` is greater than one, small snippets are packed (up to `pack_size` at
+    a time) into shared prompts, such that the few-shot example is sent once per pack
+    rather than once per snippet. Packs are limited by the model's context window.
+    (Snippets that are already cached are left unpacked, unless `use_cache` is unset.)
+
+    If `compress` is set, docstrings and comments are replaced with placeholders in
+    each prompt, and restored in each fix.
+
+    Schematics that request edit scripts are never packed, and fall back to a full
+    rewrite if the edit script can't be applied.
+    """
+    texts = sorted(texts)
+    text_to_compressed = {
+        text: compress_snippet(text) if compress else None for text in texts
+    }
+    # Map from snippet text to the text to send in its place.
+    text_to_sent = {
+        text: compressed.text if compressed is not None else text
+        for text, compressed in text_to_compressed.items()
+    }
+    text_to_prompt = make_prompts(texts, schematic=schematic, model=model)
+    sent_to_prompt = make_prompts(
+        set(text_to_sent.values()),
+        schematic=schematic,
         model=model,
+        protocol=schematic.protocol,
     )
 
+    def batch(texts: list[str]) -> Batch:
+        return Batch(
+            schematic,
+            tuple(Task(schematic.title, text) for text in texts),
+            prompt.make_packed_prompt(
+                [text_to_sent[text] for text in texts],
+                transform_type=schematic.transform_type,
+                before_text=schematic.before_text,
+                after_text=schematic.after_text,
+                before_description=schematic.before_description,
+                after_description=schematic.after_description,
+                model=model,
+            )
+            if len(texts) > 1
+            else sent_to_prompt[text_to_sent[texts[0]]],
+            tuple(text_to_prompt[text] for text in texts),
+            tuple(text_to_compressed[text] for text in texts),
+        )
 
-def run_refactor(
+    if schematic.protocol == CompletionProtocol.EDITS:
+        return [batch([text]) for text in texts]
+
+    batches: list[Batch] = []
+    packable: list[str] = []
+    for text in texts:
+        sent = text_to_sent[text]
+        if (
+            pack_size > 1
+            and sent_to_prompt[sent].completion_tokens <= PACKABLE_SNIPPET_TOKENS
+            and prompt.is_packable(sent)
+            and not (use_cache and prompt.is_cached(sent_to_prompt[sent], model=model))
+        ):
+            packable.append(text)
+        else:
+            batches.append(batch([text]))
+
+    # Pack snippets of similar length together, to keep the packs balanced.
+    context_window = get_model(model).context_window
+    group: list[str] = []
+    for text in sorted(packable, key=lambda text: (len(text_to_sent[text]), text)):
+        if group and len(group) < pack_size:
+            candidate = batch([*group, text])
+            if (
+                candidate.prompt.prompt_tokens + candidate.prompt.max_tokens
+                <= context_window
+            ):
+                group.append(text)
+                continue
+        if group:
+            batches.append(batch(group))
+        group = [text]
+    if group:
+        batches.append(batch(group))
+    return batches
+
+
+def _fix_text(
+    item: tuple[Task, prompt.Prompt],
+    *,
+    model: str,
+    temperature: float = 0,
+) -> tuple[Task, str]:
+    """Generate a fix for a piece of source code.
+
+    Returns: a tuple of (task, suggested fix), to play nicely with multiprocessing.
+    """
+    task, snippet_prompt = item
+    with profiling.span(
+        "complete",
+        "snippet",
+        schematic=task.schematic,
+        snippet=task.text.splitlines()[0],
+        prompt_tokens=snippet_prompt.prompt_tokens,
+        completion_tokens=snippet_prompt.completion_tokens,
+        temperature=temperature,
+    ):
+        try:
+            return task, prompt.resolve_prompt(
+                snippet_prompt, model=model, temperature=temperature
+            )
+        except prompt.TruncatedCompletionError as error:
+            logging.warning(f"Unable to generate a complete fix; skipping... ({error})")
+            return task, task.text
+
+
+def _restore(fix: str, compressed: CompressedSnippet | None) -> str | None:
+    """Restore the docstrings and comments in a fix for a compressed snippet.
+
+    Returns None if the placeholders don't round-trip.
+    """
+    if compressed is None:
+        return fix
+    restored = restore_snippet(fix, compressed)
+    metrics.increment(
+        "autobot_compressed_snippets_total",
+        result="restored" if restored is not None else "fallback",
+    )
+    return restored
+
+
+def _apply_edits(task: Task, script: str, compressed: CompressedSnippet | None) -> str:
+    """Apply an edit script to a (possibly) compressed snippet."""
+    after_text = edits.apply_edit_script(
+        compressed.text if compressed is not None else task.text, script
+    )
+    ast.parse(after_text)
+    return after_text
+
+
+def _validate(
+    item: tuple[Task, str],
     *,
+    fallback: prompt.Prompt,
     schematic: Schematic,
-    targets: list[str],
-    nthreads: int,
     model: str,
-) -> None:
-    console = Console()
+    max_retries: int,
+    escalation: tuple[str, ...] = (),
+) -> tuple[Task, str]:
+    """Validate a suggested fix, retrying (at increasing temperatures) if it's invalid.
+
+    If the fix is still invalid after `max_retries` retries, the snippet is escalated
+    to the next model in `escalation` (if any), and otherwise discarded, leaving the
+    snippet unchanged.
+    """
+    task, fix = item
+    snippet = task.text.splitlines()[0]
+    for tier, tier_model in enumerate((model, *escalation)):
+        if tier > 0:
+            logging.info(f"Escalating {snippet!r} to {tier_model}...")
+            metrics.increment("autobot_escalations_total", model=tier_model)
+            fallback = make_prompts(
+                [task.text],
+                schematic=schematic,
+                model=tier_model,
+            )[task.text]
+            _, fix = _fix_text((task, fallback), model=tier_model)
+
+        attempt = 0
+        while (
+            failure := validate_fix(task.text, fix, check=schematic.check)
+        ) is not None:
+            metrics.increment(
+                "autobot_validation_failures_total", reason=failure.reason
+            )
+            if attempt >= max_retries:
+                break
+
+            attempt += 1
+            logging.info(
+                f"Invalid fix for {snippet!r}; retrying... ({failure.message})"
+            )
+            metrics.increment("autobot_completion_retries_total", reason="invalid")
+            _, fix = _fix_text(
+                (task, fallback),
+                model=tier_model,
+                temperature=min(1.0, RETRY_TEMPERATURE_STEP * attempt),
+            )
+        else:
+            metrics.increment("autobot_snippets_resolved_total", model=tier_model)
+            return task, fix
+
+    assert failure is not None
+    logging.warning(f"Discarding invalid fix for {snippet!r} ({failure.message})")
+    metrics.increment("autobot_fixes_discarded_total", reason=failure.reason)
+    return task, task.text
+
+
+def _fix_batch(
+    batch: Batch,
+    *,
+    model: str,
+    max_retries: int = 0,
+    escalation: tuple[str, ...] = (),
+) -> list[tuple[Task, str]]:
+    """Generate a fix for every task in a batch.
+
+    If the completion of a packed prompt can't be split into a fix per task (or an
+    edit script can't be applied, or a compressed snippet can't be restored), falls
+    back to prompting for each affected task individually, in full.
 
-    console.print(
-        f"[bold]Running [bold cyan]{schematic.title}[/] based on user-provided example"
+    Each fix is then validated, and retried (up to `max_retries` times), escalated to
+    a more capable model, or discarded if invalid.
+    """
+    validate = functools.partial(
+        _validate,
+        schematic=batch.schematic,
+        model=model,
+        max_retries=max_retries,
+        escalation=escalation,
     )
+    if (
+        len(batch.tasks) == 1
+        and batch.schematic.protocol == CompletionProtocol.REWRITE
+        and not any(batch.compressions)
+    ):
+        return [
+            validate(
+                _fix_text((batch.tasks[0], batch.prompt), model=model),
+                fallback=batch.fallbacks[0],
+            )
+        ]
+
+    fixes: list[str | None] = [None] * len(batch.tasks)
+    with profiling.span(
+        "complete",
+        "pack" if len(batch.tasks) > 1 else "snippet",
+        schematic=batch.tasks[0].schematic,
+        size=len(batch.tasks),
+        protocol=batch.schematic.protocol.value,
+        prompt_tokens=batch.prompt.prompt_tokens,
+        completion_tokens=batch.prompt.completion_tokens,
+    ):
+        try:
+            completion = prompt.resolve_prompt(batch.prompt, model=model)
+        except prompt.TruncatedCompletionError as error:
+            logging.info(f"Unable to generate a complete fix; retrying... ({error})")
+        else:
+            if batch.schematic.protocol == CompletionProtocol.EDITS:
+                (task,) = batch.tasks
+                try:
+                    fixes = [_apply_edits(task, completion, batch.compressions[0])]
+                    metrics.increment("autobot_edit_scripts_total", result="applied")
+                except (edits.EditScriptError, SyntaxError) as error:
+                    logging.info(
+                        f"Unable to apply edit script; rewriting instead... ({error})"
+                    )
+                    metrics.increment("autobot_edit_scripts_total", result="fallback")
+            elif len(batch.tasks) > 1:
+                if (
+                    parsed := prompt.parse_packed(
+                        completion,
+                        transform_type=batch.schematic.transform_type,
+                        count=len(batch.tasks),
+                    )
+                ) is not None:
+                    fixes = list(parsed)
+                    metrics.increment("autobot_packed_prompts_total", result="parsed")
+                else:
+                    logging.info(
+                        f"Unable to parse packed completion ({len(batch.tasks)} "
+                        "snippets); falling back to individual prompts..."
+                    )
+                    metrics.increment("autobot_packed_prompts_total", result="fallback")
+            else:
+                fixes = [completion]
+
+    results: list[tuple[Task, str]] = []
+    for task, fix, compressed, fallback in zip(
+        batch.tasks, fixes, batch.compressions, batch.fallbacks
+    ):
+        if fix is not None and (restored := _restore(fix, compressed)) is not None:
+            item = (task, restored)
+        else:
+            item = _fix_text((task, fallback), model=model)
+        results.append(validate(item, fallback=fallback))
+    return results
+
+
+def schedule(
+    batches: Iterable[Batch],
+    *,
+    model: str,
+    seed: int = 0,
+    text_to_rank: Mapping[str, int] | None = None,
+    use_cache: bool = True,
+) -> tuple[list[Batch], list[Batch]]:
+    """Order a set of batches for completion.
+
+    Uncached batches are ordered by their estimated completion tokens, longest first,
+    such that the longest requests don't start last (and leave a long tail after the
+    other workers have gone idle). Ties are broken by `text_to_rank` (e.g., the order in
+    which the snippets will be reviewed), and then by a digest of each batch's prompt
+    and `seed`, such that the order is deterministic.
+
+    If `use_cache` is unset, every batch is treated as uncached.
+
+    Returns: a tuple of (cached batches, uncached batches).
+    """
+    cached: list[Batch] = []
+    uncached: list[Batch] = []
+    for batch in batches:
+        if use_cache and prompt.is_cached(batch.prompt, model=model):
+            cached.append(batch)
+        else:
+            uncached.append(batch)
 
-    console.print(
-        "-" * len(f"Running {schematic.title} based on user-provided example")
+    def rank(batch: Batch) -> int:
+        if text_to_rank is None:
+            return 0
+        return min(
+            text_to_rank.get(task.text, len(text_to_rank)) for task in batch.tasks
+        )
+
+    def tiebreak(batch: Batch) -> str:
+        return hashlib.sha256(f"{seed}:{batch.prompt.text}".encode("utf-8")).hexdigest()
+
+    cached.sort(key=lambda batch: (rank(batch), tiebreak(batch)))
+    uncached.sort(
+        key=lambda batch: (
+            -batch.prompt.completion_tokens,
+            rank(batch),
+            tiebreak(batch),
+        )
     )
-    schematic.print_diff()
-    console.print(
-        "-" * len(f"Running {schematic.title} based on user-provided example")
+    return cached, uncached
+
+
+def resolve_batches(
+    pool: ThreadPool,
+    func: Callable[[Batch], T],
+    batches: Iterable[Batch],
+    *,
+    model: str,
+    seed: int = 0,
+    text_to_rank: Mapping[str, int] | None = None,
+    use_cache: bool = True,
+) -> Iterator[T]:
+    """Apply a function to each batch, in the order given by `schedule`, yielding the
+    results as they complete.
+
+    Uncached batches are dispatched to the pool up front; cached batches are resolved on
+    the calling thread in the meantime, such that they don't occupy a worker.
+    """
+    cached, uncached = schedule(
+        batches,
+        model=model,
+        seed=seed,
+        text_to_rank=text_to_rank,
+        use_cache=use_cache,
     )
-    console.print()
+    metrics.increment("autobot_scheduled_prompts_total", len(cached), slot="inline")
+    metrics.increment("autobot_scheduled_prompts_total", len(uncached), slot="pool")
+    # N.B. The pool's task queue is first-in, first-out, so tasks start in order.
+    results = pool.imap_unordered(func, uncached)
+    for batch in cached:
+        yield func(batch)
+    yield from results
 
-    # Deduplicate targets, such that if we need to apply the same fix to a bunch of
-    # snippets, we only make a single API call.
-    console.print("[bold]1. Extracting AST nodes...")
-    filename_to_snippets: dict[str, list[Snippet]] = {}
-    all_snippet_texts: set[str] = set()
-    for filename in targets:
-        with open(filename, "r") as fp:
-            source_code = fp.read()
 
-        filename_to_snippets[filename] = []
-        for snippet in iter_snippets(
-            source_code, schematic.transform_type.ast_node_type()
-        ):
-            max_snippet_len = 1600
-            if len(snippet.text) > max_snippet_len:
-                logging.warning(
-                    f"Snippet at {filename}:{snippet.lineno} is too long "
-                    f"({len(snippet.text)} > {max_snippet_len}); skipping..."
-                )
-                continue
-            filename_to_snippets[filename].append(snippet)
-            all_snippet_texts.add(snippet.text)
+def _complete(
+    batches: list[Batch],
+    *,
+    nthreads: int,
+    model: str,
+    console: Console,
+    max_retries: int = 0,
+    escalation: tuple[str, ...] = (),
+    seed: int = 0,
+    text_to_rank: Mapping[str, int] | None = None,
+    on_fix: Callable[[Task, str], None] | None = None,
+) -> dict[Task, str]:
+    """Generate a completion for each task, across a pool of threads.
 
-    # Map from snippet text to suggested fix.
-    console.print("[bold]2. Generating completions...")
-    snippet_text_to_completion: dict[str, str] = {}
+    If `on_fix` is provided, it's called (on the calling thread) with each completion as
+    soon as it's generated.
+    """
+    metrics.increment("autobot_prompts_total", len(batches))
+    prompt_tokens = sum(batch.prompt.prompt_tokens for batch in batches)
+    completion_tokens = sum(batch.prompt.completion_tokens for batch in batches)
+    logging.info(
+        f"Estimated usage: {prompt_tokens} prompt tokens, "
+        f"{completion_tokens} completion tokens"
+    )
+
+    task_to_completion: dict[Task, str] = {}
     with Progress(transient=True, console=console) as progress:
-        task = progress.add_task("", total=len(all_snippet_texts))
+        progress_task = progress.add_task(
+            "", total=sum(len(batch.tasks) for batch in batches)
+        )
         with ThreadPool(processes=nthreads) as pool:
-            for text, completion in pool.imap_unordered(
+            for fixes in resolve_batches(
+                pool,
                 functools.partial(
-                    _fix_text,
-                    schematic=schematic,
+                    _fix_batch,
                     model=model,
+                    max_retries=max_retries,
+                    escalation=escalation,
                 ),
-                all_snippet_texts,
+                batches,
+                model=model,
+                seed=seed,
+                text_to_rank=text_to_rank,
             ):
-                progress.update(task, advance=1)
-                snippet_text_to_completion[text] = completion
+                progress.update(progress_task, advance=len(fixes))
+                task_to_completion.update(fixes)
+                if on_fix is not None:
+                    for task, fix in fixes:
+                        on_fix(task, fix)
+    return task_to_completion
 
-    # Format each suggestion as a patch.
-    console.print("[bold]3. Constructing patches...")
+
+@contextlib.contextmanager
+def _stage(name: str, *, cpu_bound: bool = False) -> Iterator[None]:
+    """Record the duration of a stage, along with a CPU profile if it's CPU-bound."""
+    with metrics.timer("autobot_stage_seconds", stage=name), profiling.span(name):
+        if cpu_bound:
+            with profiling.profile_cpu():
+                yield
+        else:
+            yield
+
+
+def make_patch(snippet: Snippet, after_text: str, target: str, source: str) -> str:
+    """Format the suggested fix for a snippet as a patch against its target file."""
+    patch: str = ""
+    for line in difflib.unified_diff(
+        recontextualize(snippet, source),
+        recontextualize(snippet._replace(text=after_text), source),
+        lineterm="",
+        fromfile=os.path.join("a", target),
+        tofile=os.path.join("b", target),
+    ):
+        # TODO(charlie): Why is this necessary? Without it, blank lines contain
+        # a single space.
+        stripped = line.strip()
+        if len(stripped) == 0:
+            line = stripped
+
+        patch += line
+        patch += "\n"
+    return patch
+
+
+def run_refactor(
+    *,
+    schematics: list[Schematic],
+    targets: list[str],
+    nthreads: int,
+    model: str,
+    max_snippet_len: int,
+    pack_size: int = 1,
+    compress: bool = False,
+    max_retries: int = 1,
+    escalation: tuple[str, ...] = (),
+    print_schematics: bool = True,
+    shard: tuple[int, int] | None = None,
+    seed: int = 0,
+    journal: Journal | None = None,
+) -> None:
+    """Generate patches by applying each schematic to the target files.
+
+    If `escalation` is non-empty, snippets whose fixes fail validation with `model` are
+    escalated through each of the listed models in turn.
+
+    If `shard` is set (as a 1-indexed tuple of (index, count)), only the snippets in
+    that shard are fixed, such that a run can be split across several workers.
+
+    Prompts are scheduled longest first, with ties broken deterministically by `seed`.
+
+    Each snippet's patch is saved as soon as its completions are in. If `journal` is
+    set, the run's progress is recorded to it, and any progress it already records (from
+    an interrupted run) is picked up rather than repeated.
+    """
+    console = Console()
+
+    for schematic in schematics if print_schematics else []:
+        console.print(
+            f"[bold]Running [bold cyan]{schematic.title}[/] based on user-provided "
+            "example"
+        )
+
+        console.print(
+            "-" * len(f"Running {schematic.title} based on user-provided example")
+        )
+        schematic.print_diff()
+        console.print(
+            "-" * len(f"Running {schematic.title} based on user-provided example")
+        )
+        console.print()
+
+    # Extract the snippets once per transform type and node selection, regardless of
+    # the number of schematics. Deduplicate targets, such that if we need to apply the
+    # same fix to a bunch of snippets, we only make a single API call.
+    console.print("[bold]1. Extracting AST nodes...")
+    with _stage("extract", cpu_bound=True):
+        extractions = extract_for_schematics(
+            schematics,
+            targets=targets,
+            max_snippet_len=max_snippet_len,
+            shard=shard,
+            journal=journal,
+        )
+        if shard is not None:
+            num_texts = len(
+                set().union(*(extraction.texts for extraction in extractions.values()))
+            )
+            metrics.increment("autobot_shard_snippets_total", num_texts)
+            console.print(
+                f"[dim]Shard {shard[0]}/{shard[1]}: fixing {num_texts:,} unique "
+                f"{'snippet' if num_texts == 1 else 'snippets'}."
+            )
+        tokens_saved = sum(
+            extraction.tokens_saved for extraction in extractions.values()
+        )
+        if tokens_saved:
+            console.print(
+                f"[dim]Skipped ~{tokens_saved:,} tokens of nested snippets "
+                "covered by another snippet."
+            )
+
+    # Map from snippet text to its position in review order (i.e., by file and line),
+    # to break ties when scheduling. Snippets that appear in several places take the
+    # earliest.
+    ranks: dict[str, tuple[str, int]] = {}
+    for extraction in extractions.values():
+        for target, snippets in sorted(extraction.filename_to_snippets.items()):
+            for snippet in sorted(snippets, key=lambda snippet: snippet.lineno):
+                decomposed = extraction.snippet_text_to_decomposition.get(snippet.text)
+                rank = (target, snippet.lineno)
+                for text in (
+                    decomposed.texts() if decomposed is not None else [snippet.text]
+                ):
+                    ranks[text] = min(ranks.get(text, rank), rank)
+    text_to_rank = {
+        text: i for i, text in enumerate(sorted(ranks, key=lambda text: ranks[text]))
+    }
+
+    # Map from (filename, snippet) to the schematics that selected it.
+    node_to_schematics: dict[tuple[str, Snippet], list[Schematic]] = {}
+    snippet_text_to_decomposition: dict[str, DecomposedClass] = {}
+    for schematic in schematics:
+        extraction = extractions[schematic.transform_type, schematic.selection]
+        snippet_text_to_decomposition.update(extraction.snippet_text_to_decomposition)
+        for target, snippets in extraction.filename_to_snippets.items():
+            for snippet in snippets:
+                node_to_schematics.setdefault((target, snippet), []).append(schematic)
+
+    # Skip any snippets that were patched by an interrupted run.
+    resumed: int = 0
+    if journal is not None:
+        for target, snippet in list(node_to_schematics):
+            if journal.is_done(target, snippet):
+                del node_to_schematics[target, snippet]
+                resumed += 1
+        metrics.increment("autobot_journal_snippets_resumed_total", resumed)
+
+    # Map from task to the snippets waiting on its completion, and from each snippet to
+    # the tasks that it's still waiting on.
+    waiting: dict[Task, list[tuple[str, Snippet]]] = {}
+    remaining: dict[tuple[str, Snippet], set[Task]] = {}
+    for node, applicable in node_to_schematics.items():
+        _, snippet = node
+        decomposed = snippet_text_to_decomposition.get(snippet.text)
+        texts = (
+            [text for text in decomposed.texts() if len(text) <= max_snippet_len]
+            if decomposed is not None
+            else [snippet.text]
+        )
+        remaining[node] = {
+            Task(schematic.title, text) for schematic in applicable for text in texts
+        }
+        for task in remaining[node]:
+            waiting.setdefault(task, []).append(node)
+
+    # Map from schematic title to (map from snippet text to suggested fix).
+    schematic_to_completions: dict[str, dict[str, str]] = {
+        schematic.title: {} for schematic in schematics
+    }
+    # Map from (filename, snippet) to the composed fix, for each snippet whose fixes
+    # conflicted.
+    node_to_text: dict[tuple[str, Snippet], str] = {}
+    # Map from (filename, snippet) to the schematics whose fixes conflicted with those
+    # of an earlier schematic.
+    node_to_pending: dict[tuple[str, Snippet], list[Schematic]] = {}
     count: int = 0
-    for target in filename_to_snippets:
-        with open(target, "r") as fp:
-            source = fp.read()
-
-        for text, padding, lineno in filename_to_snippets[target]:
-            before_text = text
-            after_text = snippet_text_to_completion[text]
-            patch: str = ""
-            for line in difflib.unified_diff(
-                recontextualize(Snippet(before_text, padding, lineno), source),
-                recontextualize(Snippet(after_text, padding, lineno), source),
-                lineterm="",
-                fromfile=os.path.join("a", target),
-                tofile=os.path.join("b", target),
-            ):
-                # TODO(charlie): Why is this necessary? Without it, blank lines contain
-                # a single space.
-                stripped = line.strip()
-                if len(stripped) == 0:
-                    line = stripped
+    sources: dict[str, str] = {}
+
+    def save(node: tuple[str, Snippet], after_text: str) -> None:
+        """Format the suggested fix for a snippet as a patch, and save it."""
+        nonlocal count
+        target, snippet = node
+        if target not in sources:
+            with open(target, "r") as fp:
+                sources[target] = fp.read()
+
+        with profiling.span("diff", "snippet", filename=target, lineno=snippet.lineno):
+            patch = make_patch(snippet, after_text, target, sources[target])
 
-                patch += line
-                patch += "\n"
+        if patch:
+            patches.save(patch, target=target, lineno=snippet.lineno)
+            metrics.increment("autobot_patches_total")
+            count += 1
+        if journal is not None:
+            journal.record_node(target, snippet, patched=bool(patch))
 
-            # Save the patch.
-            if patch:
-                patches.save(patch, target=target, lineno=lineno)
-                count += 1
+    def settle(node: tuple[str, Snippet]) -> None:
+        """Compose the fixes suggested by each schematic into a single fix for a
+        snippet, and save it (unless the fixes conflict)."""
+        _, snippet = node
+        applicable = node_to_schematics[node]
+        afters: list[str] = []
+        for schematic in applicable:
+            completions = schematic_to_completions[schematic.title]
+            if snippet.text in snippet_text_to_decomposition:
+                decomposed = snippet_text_to_decomposition[snippet.text]
+                afters.append(stitch_class(decomposed, completions))
+            else:
+                afters.append(completions.get(snippet.text, snippet.text))
+        composition = compose(snippet.text, afters)
+        if composition.conflicting:
+            node_to_text[node] = composition.text
+            node_to_pending[node] = [applicable[i] for i in composition.conflicting]
+        else:
+            save(node, composition.text)
+
+    def resolve(task: Task, completion: str) -> None:
+        schematic_to_completions[task.schematic][task.text] = completion
+        if journal is not None:
+            journal.record_completion(task.schematic, task.text, completion)
+        for node in waiting.pop(task, []):
+            remaining[node].discard(task)
+            if not remaining[node]:
+                settle(node)
+
+    def record(task: Task, completion: str) -> None:
+        if journal is not None:
+            journal.record_completion(task.schematic, task.text, completion)
+
+    # Generate a completion for each task that wasn't completed by an interrupted run.
+    # Every schematic's prompts share a single pool, and each snippet's patch is saved
+    # as soon as its completions are in.
+    console.print("[bold]2. Generating completions...")
+    with _stage("complete"):
+        for node in [node for node, tasks in remaining.items() if not tasks]:
+            settle(node)
+        if journal is not None:
+            for task in list(waiting):
+                if (completion := journal.get_completion(*task)) is not None:
+                    metrics.increment("autobot_journal_completions_resumed_total")
+                    resolve(task, completion)
+
+        batches: list[Batch] = []
+        for schematic in schematics:
+            batches.extend(
+                make_batches(
+                    [
+                        task.text
+                        for task in waiting
+                        if task.schematic == schematic.title
+                    ],
+                    schematic=schematic,
+                    model=model,
+                    pack_size=pack_size,
+                    compress=compress,
+                )
+            )
+        _complete(
+            batches,
+            nthreads=nthreads,
+            model=model,
+            console=console,
+            max_retries=max_retries,
+            escalation=escalation,
+            seed=seed,
+            text_to_rank=text_to_rank,
+            on_fix=resolve,
+        )
+
+    # Where two schematics changed the same lines, chain the latter onto the output of
+    # the former, one round per conflicting schematic.
+    while any(node_to_pending.values()):
+        with _stage("chain"):
+            task_to_nodes: dict[Task, list[tuple[str, Snippet]]] = {}
+            batches = []
+            for node, pending in node_to_pending.items():
+                if not pending:
+                    continue
+                schematic = pending.pop(0)
+                text = node_to_text[node]
+                if len(text) > max_snippet_len:
+                    target, snippet = node
+                    logging.warning(
+                        f"Unable to apply {schematic.title} to snippet at "
+                        f"{target}:{snippet.lineno} after other fixes (too long); "
+                        "skipping..."
+                    )
+                    metrics.increment(
+                        "autobot_rewrites_dropped_total", reason="too_long"
+                    )
+                    continue
+                task = Task(schematic.title, text)
+                if journal is not None and (
+                    (completion := journal.get_completion(*task)) is not None
+                ):
+                    node_to_text[node] = completion
+                    continue
+                if task not in task_to_nodes:
+                    batches.extend(
+                        make_batches([text], schematic=schematic, model=model)
+                    )
+                task_to_nodes.setdefault(task, []).append(node)
+            logging.info(f"Chaining {len(batches)} overlapping fixes...")
+            metrics.increment("autobot_rewrites_chained_total", len(batches))
+            for task, completion in _complete(
+                batches,
+                nthreads=nthreads,
+                model=model,
+                console=console,
+                max_retries=max_retries,
+                escalation=escalation,
+                seed=seed,
+                on_fix=record,
+            ).items():
+                for node in task_to_nodes[task]:
+                    node_to_text[node] = completion
+
+    # Format each chained suggestion as a patch.
+    console.print("[bold]3. Constructing patches...")
+    with _stage("patch", cpu_bound=True):
+        for node, after_text in node_to_text.items():
+            save(node, after_text)
+    if journal is not None:
+        journal.finish()
 
     console.print()
     if count == 0:
@@ -142,3 +1086,25 @@ def run_refactor(
         console.print(f"[bold white]✨ Done! Generated {count} patch.")
     else:
         console.print(f"[bold white]✨ Done! Generated {count} patches.")
+    if resumed:
+        console.print(
+            f"[dim]Resumed {resumed} {'snippet' if resumed == 1 else 'snippets'} "
+            "from an interrupted run."
+        )
+
+    retried = int(metrics.value("autobot_completion_retries_total", reason="invalid"))
+    discarded = int(metrics.value("autobot_fixes_discarded_total"))
+    if escalation:
+        for tier_model in (model, *escalation):
+            resolved = int(
+                metrics.value("autobot_snippets_resolved_total", model=tier_model)
+            )
+            console.print(
+                f"[dim]{tier_model}: resolved {resolved} "
+                f"{'snippet' if resolved == 1 else 'snippets'}."
+            )
+    if retried or discarded:
+        console.print(
+            f"[dim]Retried {retried} invalid "
+            f"{'fix' if retried == 1 else 'fixes'}; discarded {discarded}."
+        )
@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import difflib
+import json
+import logging
+import os.path
+import sys
+from typing import TYPE_CHECKING, NamedTuple
+
+from autobot.refactor.refactor import _fix_batch, _stage, make_batches
+from autobot.snippet import Snippet, find_enclosing_snippet
+from autobot.utils import metrics
+
+if TYPE_CHECKING:
+    from autobot.schematic import Schematic
+
+
+class TargetError(Exception):
+    pass
+
+
+class TargetedFix(NamedTuple):
+    """The fix suggested by a single schematic for the node under a given line."""
+
+    # The title of the schematic that suggested the fix.
+    schematic: str
+    # The line number of the node in the original text.
+    lineno: int
+    before: str
+    after: str
+
+
+class TargetedResult(NamedTuple):
+    target: str
+    lineno: int
+    # A unified diff against the target file, or an empty string if nothing changed.
+    diff: str
+    fixes: list[TargetedFix]
+
+
+def _splice(source: str, snippet: Snippet, after_text: str) -> str:
+    """Replace a snippet within its originating source code."""
+    lines = source.splitlines()
+    start = snippet.lineno - 1
+    end = start + len(snippet.text.splitlines())
+    replacement = [
+        snippet.padding + line if line.strip() else ""
+        for line in after_text.splitlines()
+    ]
+    return "\n".join(lines[:start] + replacement + lines[end:]) + "\n"
+
+
+def _map_line(lineno: int, start: int, before: list[str], after: list[str]) -> int:
+    """Map a (1-indexed) line through the replacement of the lines `before` (starting
+    at `start`) with the lines `after`.
+
+    Lines within a changed region map to the corresponding line of its replacement
+    (or, if the replacement is shorter, to its last line).
+    """
+    if lineno < start:
+        return lineno
+    offset = lineno - start
+    if offset >= len(before):
+        return lineno + len(after) - len(before)
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(
+        None, before, after, autojunk=False
+    ).get_opcodes():
+        if i1 <= offset < i2:
+            if tag == "equal":
+                return start + j1 + offset - i1
+            return start + j1 + max(min(offset - i1, j2 - j1 - 1), 0)
+    return lineno
+
+
+def refactor_at(
+    *,
+    schematics: list[Schematic],
+    target: str,
+    lineno: int,
+    model: str,
+    max_snippet_len: int,
+    max_retries: int = 1,
+    escalation: tuple[str, ...] = (),
+) -> TargetedResult:
+    """Apply each schematic to the node that encloses a single line of a target file.
+
+    Each schematic issues (at most) one prompt for the innermost node of its type under
+    the line, on the calling thread, without packing or compression; where several
+    schematics apply, each is applied to the output of the last (with the line mapped
+    through any earlier fixes).
+
+    Raises a TargetError if the file can't be parsed, or if no schematic applies to
+    any node under the line.
+    """
+    try:
+        with open(target, "r") as fp:
+            original = fp.read()
+    except OSError as error:
+        raise TargetError(str(error)) from None
+
+    source = original
+    # The (start, before, after) lines of each fix that has been spliced into the
+    # source, in order.
+    splices: list[tuple[int, list[str], list[str]]] = []
+    fixes: list[TargetedFix] = []
+    with _stage("complete"):
+        for schematic in schematics:
+            cursor = lineno
+            for start, before, after in splices:
+                cursor = _map_line(cursor, start, before, after)
+            try:
+                snippet = find_enclosing_snippet(
+                    source, schematic.transform_type.ast_node_type(), cursor
+                )
+            except SyntaxError as error:
+                raise TargetError(f"Unable to parse {target}: {error}") from None
+            if snippet is None:
+                continue
+            metrics.increment("autobot_snippets_total")
+            if len(snippet.text) > max_snippet_len:
+                logging.warning(
+                    f"Snippet at {target}:{snippet.lineno} is too long "
+                    f"({len(snippet.text)} > {max_snippet_len}); skipping..."
+                )
+                metrics.increment("autobot_snippets_skipped_total", reason="too_long")
+                continue
+
+            (batch,) = make_batches([snippet.text], schematic=schematic, model=model)
+            metrics.increment("autobot_prompts_total")
+            ((_, after_text),) = _fix_batch(
+                batch, model=model, max_retries=max_retries, escalation=escalation
+            )
+            snippet_lineno = snippet.lineno
+            for start, before, after in reversed(splices):
+                snippet_lineno = _map_line(snippet_lineno, start, after, before)
+            fixes.append(
+                TargetedFix(schematic.title, snippet_lineno, snippet.text, after_text)
+            )
+            if after_text != snippet.text:
+                source = _splice(source, snippet, after_text)
+                splices.append((
+                    snippet.lineno,
+                    snippet.text.splitlines(),
+                    after_text.splitlines(),
+                ))
+
+    if not fixes:
+        kinds = sorted({
+            schematic.transform_type.plaintext_name() for schematic in schematics
+        })
+        raise TargetError(f"No {' or '.join(kinds)} encloses {target}:{lineno}")
+
+    diff = "".join(
+        line + "\n"
+        for line in difflib.unified_diff(
+            original.splitlines(),
+            source.splitlines(),
+            fromfile=os.path.join("a", target),
+            tofile=os.path.join("b", target),
+            lineterm="",
+        )
+    )
+    if diff:
+        metrics.increment("autobot_patches_total")
+    return TargetedResult(target, lineno, diff, fixes)
+
+
+def run_targeted(
+    *,
+    schematics: list[Schematic],
+    target: str,
+    lineno: int,
+    model: str,
+    max_snippet_len: int,
+    max_retries: int = 1,
+    escalation: tuple[str, ...] = (),
+    output_format: str = "diff",
+) -> TargetedResult:
+    """Refactor the node under a single line, and write the result to stdout (as a
+    unified diff, or as JSON), rather than saving patches."""
+    result = refactor_at(
+        schematics=schematics,
+        target=target,
+        lineno=lineno,
+        model=model,
+        max_snippet_len=max_snippet_len,
+        max_retries=max_retries,
+        escalation=escalation,
+    )
+    if output_format == "json":
+        sys.stdout.write(
+            json.dumps(
+                {
+                    "target": result.target,
+                    "lineno": result.lineno,
+                    "changed": bool(result.diff),
+                    "diff": result.diff,
+                    "fixes": [fix._asdict() for fix in result.fixes],
+                },
+                indent=2,
+            )
+            + "\n"
+        )
+    else:
+        sys.stdout.write(result.diff)
+    return result
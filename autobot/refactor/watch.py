@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import ast
+import logging
+import os.path
+from typing import TYPE_CHECKING
+
+from rich.console import Console
+
+from autobot.refactor import patches
+from autobot.refactor.refactor import run_refactor
+from autobot.utils import filesystem, metrics
+from autobot.utils.watcher import make_watcher
+
+if TYPE_CHECKING:
+    from autobot.schematic import Schematic
+
+
+def _is_parseable(filename: str) -> bool:
+    try:
+        with open(filename, "r") as fp:
+            ast.parse(fp.read())
+    except SyntaxError as error:
+        logging.warning(f"Unable to parse {filename}; skipping... ({error})")
+        return False
+    return True
+
+
+def run_watch(
+    *,
+    schematics: list[Schematic],
+    targets: list[str],
+    nthreads: int,
+    model: str,
+    max_snippet_len: int,
+    pack_size: int = 1,
+    compress: bool = False,
+    max_retries: int = 1,
+    escalation: tuple[str, ...] = (),
+    polling: bool = False,
+    seed: int = 0,
+) -> None:
+    """Apply each schematic to the target files, and then re-apply them to each file
+    that changes, until interrupted.
+
+    Only the changed files are re-extracted and re-diffed. Their pending patches are
+    replaced (or removed, if the file was deleted), while those of every other file are
+    left in place. Snippets that are unchanged still resolve from the cache, so only new
+    or changed snippets are sent to the API.
+    """
+    console = Console()
+
+    def refactor(filenames: list[str], *, print_schematics: bool) -> None:
+        run_refactor(
+            schematics=schematics,
+            targets=filenames,
+            nthreads=nthreads,
+            model=model,
+            max_snippet_len=max_snippet_len,
+            pack_size=pack_size,
+            compress=compress,
+            max_retries=max_retries,
+            escalation=escalation,
+            print_schematics=print_schematics,
+            seed=seed,
+        )
+
+    filenames = [
+        filename
+        for filename in filesystem.collect_python_files(targets)
+        if _is_parseable(filename)
+    ]
+    refactor(filenames, print_schematics=True)
+
+    watcher = make_watcher(targets, polling=polling)
+    try:
+        while True:
+            console.print()
+            console.print("[bold]Watching for changes... (Press Ctrl-C to stop.)")
+            changed = sorted(watcher.wait())
+            metrics.increment("autobot_watch_changes_total", len(changed))
+            console.print(
+                f"[bold]Detected changes to {len(changed)} "
+                f"{'file' if len(changed) == 1 else 'files'}: "
+                f"[cyan]{', '.join(changed)}"
+            )
+
+            # Invalidate the pending patches for every changed file, since their line
+            # numbers (and contents) may no longer match.
+            refreshed: list[str] = []
+            for filename in changed:
+                invalidated = patches.clear(filename)
+                metrics.increment("autobot_patches_invalidated_total", invalidated)
+                if invalidated:
+                    logging.info(
+                        f"Invalidated {invalidated} pending patches for {filename}"
+                    )
+                if os.path.isfile(filename) and _is_parseable(filename):
+                    refreshed.append(filename)
+
+            if refreshed:
+                refactor(refreshed, print_schematics=False)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
@@ -7,6 +7,7 @@ from colorama import Fore
 from rich.console import Console
 
 from autobot.refactor import patches
+from autobot.utils import profiling
 from autobot.utils.getch import getch
 
 
@@ -25,10 +26,11 @@ class Resolution(enum.Enum):
 
 def run_review() -> None:
     patch_files: list[str] = []
-    for root, _, filenames in os.walk(patches.PATCH_DIR):
-        for filename in filenames:
-            if filename.endswith(".patch"):
-                patch_files.append(os.path.join(root, filename))
+    with profiling.span("collect"):
+        for root, _, filenames in os.walk(patches.PATCH_DIR):
+            for filename in filenames:
+                if filename.endswith(".patch"):
+                    patch_files.append(os.path.join(root, filename))
 
     console = Console()
 
@@ -39,7 +41,9 @@ def run_review() -> None:
     }
     num_patches = len(patch_files)
     for i, patch_file in enumerate(patch_files):
-        if patches.can_apply(patch_file):
+        with profiling.span("check", "patch", patch_file=patch_file):
+            can_apply = patches.can_apply(patch_file)
+        if can_apply:
             with console.screen(hide_cursor=False):
                 with open(patch_file, "r") as fp:
                     contents = fp.read()
@@ -75,7 +79,8 @@ def run_review() -> None:
                 patches_by_resolution[resolution].append(patch_file)
                 if resolution == Resolution.ACCEPT:
                     # Apply the patch.
-                    patches.apply(patch_file)
+                    with profiling.span("apply", "patch", patch_file=patch_file):
+                        patches.apply(patch_file)
                     os.remove(patch_file)
                 elif resolution == Resolution.REJECT:
                     # Reject the patch.
@@ -2,13 +2,22 @@ from __future__ import annotations
 
 import ast
 import difflib
+import functools
+import importlib.util
+import json
 import os
-from typing import NamedTuple
+from typing import Any, Callable, NamedTuple, Optional
 
-from autobot.transforms import TransformType
+from autobot.transforms import CompletionProtocol, NodeSelection, TransformType
 
 BEFORE_FILENAME: str = "before.py"
 AFTER_FILENAME: str = "after.py"
+CONFIG_FILENAME: str = "schematic.json"
+CHECK_FILENAME: str = "check.py"
+
+# A schematic-supplied check, which takes the original snippet and a suggested fix, and
+# returns an error message if the fix should be rejected.
+Check = Callable[[str, str], Optional[str]]
 
 
 class SchematicDefinitionException(Exception):
@@ -41,6 +50,66 @@ def extract_description(source_code: str) -> str | None:
         return None
 
 
+def load_config(filename: str) -> dict[str, Any]:
+    """Load the (optional) configuration for a schematic."""
+    if not os.path.isfile(filename):
+        return {}
+
+    with open(filename, "r") as fp:
+        try:
+            raw = json.load(fp)
+        except json.JSONDecodeError as error:
+            raise SchematicDefinitionException(
+                f"Invalid JSON in: {filename} ({error})"
+            ) from None
+    if not isinstance(raw, dict):
+        raise SchematicDefinitionException(f"Expected an object in: {filename}")
+
+    config: dict[str, Any] = {}
+    for key, value in raw.items():
+        if key == "protocol":
+            try:
+                config["protocol"] = CompletionProtocol(value)
+            except ValueError:
+                raise SchematicDefinitionException(
+                    f"Invalid protocol in: {filename} (expected one of: "
+                    f"{', '.join(protocol.value for protocol in CompletionProtocol)})"
+                ) from None
+        elif key == "selection":
+            try:
+                config["selection"] = NodeSelection(value)
+            except ValueError:
+                raise SchematicDefinitionException(
+                    f"Invalid selection in: {filename} (expected one of: "
+                    f"{', '.join(selection.value for selection in NodeSelection)})"
+                ) from None
+        else:
+            raise SchematicDefinitionException(f"Unknown option in: {filename} ({key})")
+    return config
+
+
+def load_check(filename: str) -> Check | None:
+    """Load the (optional) `check` function for a schematic."""
+    if not os.path.isfile(filename):
+        return None
+
+    spec = importlib.util.spec_from_file_location(
+        f"autobot_check_{abs(hash(filename))}", filename
+    )
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(module)
+    except Exception as error:  # noqa: BLE001
+        raise SchematicDefinitionException(
+            f"Unable to load: {filename} ({error})"
+        ) from None
+    check = getattr(module, "check", None)
+    if not callable(check):
+        raise SchematicDefinitionException(f"No `check` function found in: {filename}")
+    return check  # type: ignore[no-any-return]
+
+
 class Schematic(NamedTuple):
     title: str
     before_text: str
@@ -48,6 +117,12 @@ class Schematic(NamedTuple):
     before_description: str
     after_description: str
     transform_type: TransformType
+    # The format in which to request completions.
+    protocol: CompletionProtocol = CompletionProtocol.REWRITE
+    # How to select among nested nodes of the transform type.
+    selection: NodeSelection = NodeSelection.ALL
+    # An additional check to apply to each suggested fix.
+    check: Check | None = None
 
     @classmethod
     def from_directory(cls, dirname: str) -> Schematic:
@@ -105,6 +180,8 @@ class Schematic(NamedTuple):
                 )
             after_description = after_description.lstrip(".").rstrip(".")
 
+        config = load_config(os.path.join(dirname, CONFIG_FILENAME))
+
         return cls(
             title=title,
             before_text=before_text,
@@ -112,6 +189,8 @@ class Schematic(NamedTuple):
             before_description=before_description,
             after_description=after_description,
             transform_type=transform_type,
+            check=load_check(os.path.join(dirname, CHECK_FILENAME)),
+            **config,
         )
 
     def print_diff(self) -> None:
@@ -135,3 +214,57 @@ class Schematic(NamedTuple):
                 print(f"{Fore.GREEN}{line}{Fore.RESET}")
             else:
                 print(line)
+
+
+@functools.lru_cache(maxsize=256)
+def _load_schematic(dirname: str, signature: tuple[tuple[str, int], ...]) -> Schematic:
+    return Schematic.from_directory(dirname)
+
+
+def _load(dirname: str) -> Schematic:
+    """Load a Schematic, memoized on the modification time of each of its files (such
+    that a long-lived process only reloads schematics that have changed)."""
+    if not os.path.isdir(dirname):
+        return _load_schematic(dirname, ())
+    dirname = os.path.abspath(dirname)
+    signature = tuple(
+        (entry.name, entry.stat().st_mtime_ns)
+        for entry in sorted(os.scandir(dirname), key=lambda entry: entry.name)
+        if entry.is_file()
+    )
+    return _load_schematic(dirname, signature)
+
+
+def load_schematics(specifier: str) -> list[Schematic]:
+    """Load one or more Schematics.
+
+    The specifier is a comma-separated list, each entry of which is either a schematic
+    (as accepted by `Schematic.from_directory`) or a directory of schematics.
+    """
+    schematics: list[Schematic] = []
+    for dirname in specifier.split(","):
+        dirname = dirname.strip().rstrip("/")
+        if not dirname:
+            continue
+        if os.path.isdir(dirname) and not os.path.isfile(
+            os.path.join(dirname, BEFORE_FILENAME)
+        ):
+            children = sorted(
+                os.path.join(dirname, child)
+                for child in os.listdir(dirname)
+                if os.path.isfile(os.path.join(dirname, child, BEFORE_FILENAME))
+            )
+            if not children:
+                raise SchematicDefinitionException(f"No schematics found in: {dirname}")
+            schematics.extend(_load(child) for child in children)
+        else:
+            schematics.append(_load(dirname))
+
+    titles = [schematic.title for schematic in schematics]
+    if duplicates := sorted({title for title in titles if titles.count(title) > 1}):
+        raise SchematicDefinitionException(
+            f"Duplicate schematics: {', '.join(duplicates)}"
+        )
+    if not schematics:
+        raise SchematicDefinitionException("No schematics provided")
+    return schematics
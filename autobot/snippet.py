@@ -1,8 +1,13 @@
 from __future__ import annotations
 
 import ast
+import io
+import logging
 import re
-from typing import Generator, NamedTuple, Type
+import tokenize
+from typing import Generator, Iterator, Mapping, NamedTuple, Type, cast
+
+from autobot.transforms import NodeSelection
 
 
 class Snippet(NamedTuple):
@@ -64,15 +69,378 @@ def recontextualize(snippet: Snippet, source_code: str) -> list[str]:
     return lines
 
 
+def _iter_nested(
+    node: ast.AST, node_type: Type[ast.AST] | tuple[Type[ast.AST], ...]
+) -> Iterator[ast.AST]:
+    """Generate the matching nodes nested within a node, excluding any nested within
+    those."""
+    for child in ast.iter_child_nodes(node):
+        if isinstance(child, node_type):
+            yield child
+        else:
+            yield from _iter_nested(child, node_type)
+
+
+def _count_dropped_lines(
+    source_lines: list[str], node: ast.AST, nested: list[ast.AST]
+) -> int:
+    """Count the non-blank lines of a node that fall outside all of its nested nodes."""
+
+    def span(node: ast.AST) -> range:
+        return range(node.lineno, node.end_lineno + 1)  # type: ignore[attr-defined]
+
+    covered = {lineno for child in nested for lineno in span(child)}
+    return len([
+        lineno
+        for lineno in span(node)
+        if lineno not in covered and source_lines[lineno - 1].strip()
+    ])
+
+
 def iter_snippets(
     source_code: str,
     node_type: Type[ast.AST] | tuple[Type[ast.AST], ...],
+    *,
+    selection: NodeSelection = NodeSelection.ALL,
+    max_snippet_len: int | None = None,
 ) -> Generator[Snippet, None, None]:
     """Generate all snippets from the provided source code.
 
+    Unless `selection` is `NodeSelection.ALL`, nested nodes are resolved to a
+    non-overlapping cover, such that no line of source code is sent more than once.
+    The `SMART` selection prefers the outermost node, unless it's longer than
+    `max_snippet_len`. An oversized class is still selected if it can be decomposed
+    into pieces that fit (see `decompose_class`); otherwise, its nested nodes are
+    selected instead, and any lines outside of them are logged as dropped.
+
     Returns: a tuple of (text to fix, any indentation that was removed from the
         snippet, line number in the source file).
     """
-    for node in ast.walk(ast.parse(source_code)):
-        if isinstance(node, node_type):
+    module = ast.parse(source_code)
+    if selection == NodeSelection.ALL:
+        for node in ast.walk(module):
+            if isinstance(node, node_type):
+                yield Snippet.from_node(source_code, node)
+        return
+
+    source_lines = source_code.splitlines()
+    stack = list(reversed(list(_iter_nested(module, node_type))))
+    while stack:
+        node = stack.pop()
+        nested = list(_iter_nested(node, node_type))
+        if not nested:
+            yield Snippet.from_node(source_code, node)
+            continue
+        if selection == NodeSelection.OUTERMOST:
             yield Snippet.from_node(source_code, node)
+            continue
+        if selection == NodeSelection.SMART:
+            snippet = Snippet.from_node(source_code, node)
+            if max_snippet_len is None or len(snippet.text) <= max_snippet_len:
+                yield snippet
+                continue
+            # N.B. Descending would drop the class's own lines (its attributes, and any
+            # methods outside the nested nodes), so prefer to decompose it.
+            decomposed = decompose_class(snippet.text)
+            if decomposed is not None and len(decomposed.header) <= max_snippet_len:
+                yield snippet
+                continue
+
+        dropped = _count_dropped_lines(source_lines, node, nested)
+        if dropped:
+            log = logging.warning if selection == NodeSelection.SMART else logging.debug
+            lineno: int = node.lineno  # type: ignore[attr-defined]
+            log(
+                f"Selecting the nested nodes of snippet at line {lineno} drops "
+                f"{dropped} of its lines"
+            )
+        stack.extend(reversed(nested))
+
+
+def find_enclosing_snippet(
+    source_code: str,
+    node_type: Type[ast.AST] | tuple[Type[ast.AST], ...],
+    lineno: int,
+) -> Snippet | None:
+    """Return the innermost snippet that encloses the given (1-indexed) line, including
+    any decorators, or None if the line falls outside every matching node."""
+    enclosing: ast.AST | None = None
+    for node in ast.walk(ast.parse(source_code)):
+        if not isinstance(node, node_type):
+            continue
+        start = min(
+            [node.lineno]  # type: ignore[attr-defined]
+            + [decorator.lineno for decorator in getattr(node, "decorator_list", [])]
+        )
+        end: int = node.end_lineno  # type: ignore[attr-defined]
+        # N.B. Matching nodes that enclose the line are nested within one another, so
+        # the innermost is the one that starts last.
+        if start <= lineno <= end and (
+            enclosing is None or node.lineno > enclosing.lineno  # type: ignore[attr-defined]
+        ):
+            enclosing = node
+    return Snippet.from_node(source_code, enclosing) if enclosing is not None else None
+
+
+class ClassPart(NamedTuple):
+    """A method extracted from an oversized class."""
+
+    # The name of the method.
+    name: str
+    # The method's source (including any decorators), indented as in the class.
+    source: str
+    # The method, wrapped in the header of its enclosing class.
+    text: str
+
+
+class DecomposedClass(NamedTuple):
+    """An oversized class, broken into pieces that can be refactored separately."""
+
+    # The class, with the body of each method replaced by a stub.
+    header: str
+    # The methods of the class, in order of appearance.
+    parts: list[ClassPart]
+
+    def texts(self) -> list[str]:
+        return [self.header, *(part.text for part in self.parts)]
+
+
+def _first_lineno(node: ast.stmt) -> int:
+    """Return the first line of a statement, including any decorators."""
+    decorators: list[ast.expr] = getattr(node, "decorator_list", [])
+    return min([node.lineno, *(decorator.lineno for decorator in decorators)])
+
+
+def _indentation(line: str) -> str:
+    return line[: len(line) - len(line.lstrip())]
+
+
+def _reindent(lines: list[str], old: str, new: str) -> list[str]:
+    return [new + line.removeprefix(old) if line.strip() else "" for line in lines]
+
+
+def decompose_class(text: str) -> DecomposedClass | None:
+    """Decompose a class snippet into a header and a sequence of methods.
+
+    The header retains the class signature, docstring, attributes, and any other
+    non-method statements, with each method reduced to a stub (its signature, followed
+    by `...`). Each method is wrapped in the signature of its enclosing class, such that
+    it can be refactored as a standalone class.
+
+    Returns: None if the snippet doesn't consist of a single class with at least one
+        method.
+    """
+    try:
+        module = ast.parse(text)
+    except SyntaxError:
+        return None
+    if len(module.body) != 1 or not isinstance(module.body[0], ast.ClassDef):
+        return None
+    class_def = module.body[0]
+
+    lines = text.splitlines()
+    body_lineno = _first_lineno(class_def.body[0])
+    if body_lineno == class_def.lineno:
+        return None
+    class_signature = lines[_first_lineno(class_def) - 1 : body_lineno - 1]
+
+    header: list[str] = []
+    parts: list[ClassPart] = []
+    cursor = 1
+    for node in class_def.body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        method_body_lineno = _first_lineno(node.body[0])
+        if method_body_lineno == node.lineno:
+            # Single-line methods are left in the header as-is.
+            continue
+
+        assert node.end_lineno is not None
+        start = _first_lineno(node)
+        method = lines[start - 1 : node.end_lineno]
+        header.extend(lines[cursor - 1 : start - 1])
+        header.extend(lines[start - 1 : method_body_lineno - 1])
+        header.append(_indentation(lines[method_body_lineno - 1]) + "...")
+        parts.append(
+            ClassPart(
+                name=node.name,
+                source="\n".join(method),
+                text="\n".join([*class_signature, *method]),
+            )
+        )
+        cursor = node.end_lineno + 1
+    header.extend(lines[cursor - 1 :])
+
+    if not parts:
+        return None
+    return DecomposedClass("\n".join(header), parts)
+
+
+def _is_stub(node: ast.stmt) -> bool:
+    return (
+        isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+        and len(node.body) == 1
+        and node.body[0].lineno > node.lineno
+        and isinstance(node.body[0], ast.Expr)
+        and isinstance(node.body[0].value, ast.Constant)
+        and node.body[0].value.value is Ellipsis
+    )
+
+
+def _find_class(text: str) -> ast.ClassDef | None:
+    try:
+        module = ast.parse(text)
+    except SyntaxError:
+        return None
+    for node in module.body:
+        if isinstance(node, ast.ClassDef):
+            return node
+    return None
+
+
+def _extract_method(text: str, name: str) -> list[str] | None:
+    """Extract the named method from a class snippet, with its indentation removed."""
+    if (class_def := _find_class(text)) is None:
+        return None
+    lines = text.splitlines()
+    for node in class_def.body:
+        if (
+            isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+            and node.name == name
+        ):
+            assert node.end_lineno is not None
+            method = lines[_first_lineno(node) - 1 : node.end_lineno]
+            return _reindent(method, _indentation(method[0]), "")
+    return None
+
+
+def stitch_class(decomposed: DecomposedClass, completions: Mapping[str, str]) -> str:
+    """Reassemble a decomposed class from the completions for each of its pieces.
+
+    Any piece without a usable completion is restored from the original source. If the
+    completion for the header drops a stub, the corresponding method is removed.
+    """
+    header = completions.get(decomposed.header, decomposed.header)
+    if (class_def := _find_class(header)) is None:
+        header = decomposed.header
+        class_def = _find_class(header)
+        assert class_def is not None
+
+    # Map from method name to the location of each stub with that name.
+    stubs: dict[str, list[ast.stmt]] = {}
+    for node in class_def.body:
+        if _is_stub(node):
+            stubs.setdefault(cast(ast.FunctionDef, node).name, []).append(node)
+
+    lines = header.splitlines()
+    replacements: list[tuple[int, int, list[str]]] = []
+    for part in decomposed.parts:
+        if not stubs.get(part.name):
+            continue
+        stub = stubs[part.name].pop(0)
+        assert stub.end_lineno is not None
+        start = _first_lineno(stub)
+
+        method: list[str] | None = None
+        if part.text in completions:
+            method = _extract_method(completions[part.text], part.name)
+        if method is None:
+            source = part.source.splitlines()
+            method = _reindent(source, _indentation(source[0]), "")
+
+        indentation = _indentation(lines[start - 1])
+        replacements.append((
+            start,
+            stub.end_lineno,
+            _reindent(method, "", indentation),
+        ))
+
+    # Replace from the bottom up, such that line numbers remain valid.
+    for start, end, method in sorted(replacements, reverse=True):
+        lines[start - 1 : end] = method
+
+    return "\n".join(lines)
+
+
+class CompressedSnippet(NamedTuple):
+    """A snippet with its docstrings and comments replaced by short placeholders."""
+
+    text: str
+    # Pairs of (placeholder, original source), in order of appearance.
+    placeholders: tuple[tuple[str, str], ...]
+
+
+def _docstring_lines(text: str) -> set[tuple[int, int]]:
+    """Return the (start, end) line numbers of every docstring in a snippet."""
+    lines: set[tuple[int, int]] = set()
+    for node in ast.walk(ast.parse(text)):
+        if isinstance(
+            node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)
+        ):
+            if (
+                node.body
+                and isinstance(node.body[0], ast.Expr)
+                and isinstance(node.body[0].value, ast.Constant)
+                and isinstance(node.body[0].value.value, str)
+            ):
+                assert node.body[0].end_lineno is not None
+                lines.add((node.body[0].lineno, node.body[0].end_lineno))
+    return lines
+
+
+def compress_snippet(text: str) -> CompressedSnippet | None:
+    """Replace the docstrings and comments in a snippet with placeholders.
+
+    Returns None if the snippet can't be compressed (e.g., it has no docstrings or
+    comments, or can't be parsed).
+    """
+    try:
+        docstring_lines = _docstring_lines(text)
+        tokens = list(tokenize.generate_tokens(io.StringIO(text).readline))
+    except (SyntaxError, tokenize.TokenError):
+        return None
+
+    # Collect the (start, end, replacement) of every docstring and comment, skipping any
+    # that are already shorter than their placeholder.
+    lines = text.splitlines(keepends=True)
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+
+    replacements: list[tuple[int, int, str]] = []
+    placeholders: list[tuple[str, str]] = []
+    for token in tokens:
+        if token.type == tokenize.COMMENT:
+            placeholder = f"# <comment {len(placeholders) + 1}>"
+        elif (
+            token.type == tokenize.STRING
+            and (token.start[0], token.end[0]) in docstring_lines
+        ):
+            placeholder = f'"""<docstring {len(placeholders) + 1}>"""'
+        else:
+            continue
+        if len(token.string) <= len(placeholder):
+            continue
+        start = offsets[token.start[0] - 1] + token.start[1]
+        end = offsets[token.end[0] - 1] + token.end[1]
+        replacements.append((start, end, placeholder))
+        placeholders.append((placeholder, token.string))
+
+    if not replacements:
+        return None
+    for start, end, placeholder in reversed(replacements):
+        text = text[:start] + placeholder + text[end:]
+    return CompressedSnippet(text, tuple(placeholders))
+
+
+def restore_snippet(text: str, compressed: CompressedSnippet) -> str | None:
+    """Restore the docstrings and comments in a fix for a compressed snippet.
+
+    Returns None if the fix doesn't contain each placeholder exactly once.
+    """
+    for placeholder, _ in compressed.placeholders:
+        if text.count(placeholder) != 1:
+            return None
+    for placeholder, original in compressed.placeholders:
+        text = text.replace(placeholder, original)
+    return text
@@ -0,0 +1,139 @@
+"""Incremental checks over streamed completions, to cancel generation early."""
+
+from __future__ import annotations
+
+import ast
+from typing import NamedTuple
+
+
+class Cancellation(NamedTuple):
+    # The completion to use in lieu of the remainder of the stream.
+    text: str
+    # Why the stream was cancelled (one of "unchanged", "stop_mismatch", or
+    # "collapse").
+    reason: str
+
+
+class _Scanner:
+    """Tracks whether a stream of lines is inside a bracket, string, or continuation.
+
+    Lines are scanned once each, as they arrive, such that a statement that's still
+    open at the start of a line can be detected without re-parsing the prefix.
+    """
+
+    def __init__(self) -> None:
+        # The number of unclosed brackets.
+        self.depth = 0
+        # The delimiter of the unclosed string, if any.
+        self.quote: str | None = None
+        # Whether the last line ended in a backslash continuation.
+        self.continued = False
+
+    def is_open(self) -> bool:
+        return self.depth > 0 or self.quote is not None or self.continued
+
+    def scan(self, line: str) -> None:
+        i = 0
+        while i < len(line):
+            char = line[i]
+            if self.quote is not None:
+                if char == "\\":
+                    i += 2
+                    continue
+                if line.startswith(self.quote, i):
+                    i += len(self.quote)
+                    self.quote = None
+                    continue
+            elif char == "#":
+                break
+            elif char in "([{":
+                self.depth += 1
+            elif char in ")]}":
+                self.depth = max(self.depth - 1, 0)
+            elif char in "'\"":
+                self.quote = char * 3 if line.startswith(char * 3, i) else char
+                i += len(self.quote)
+                continue
+            i += 1
+        self.continued = line.endswith("\\") and not line.lstrip().startswith("#")
+        # N.B. Single-quoted strings can only span lines by way of a continuation.
+        if self.quote in ("'", '"') and not self.continued:
+            self.quote = None
+
+
+class RewriteMonitor:
+    """Watches a streamed rewrite of a snippet, line by line.
+
+    Each line is compared against the original snippet as it arrives. Once the rewrite
+    has produced a complete statement, any further top-level line means that
+    generation has run past the end of the snippet, so the stream can be cancelled:
+
+    - If the rewrite reproduced the original snippet, it's returned unchanged.
+    - If the line is a section header (i.e., the model has missed the stop sequence),
+      the rewrite is returned as if the stop sequence had been generated.
+    - Otherwise, the rewrite can't be valid, and is returned with the offending line
+      (such that it fails validation).
+
+    Every line is scanned once, and the rewrite is only parsed at the start of a
+    top-level line that isn't within an open bracket, string, or continuation.
+    """
+
+    def __init__(self, original: str) -> None:
+        self.original = original.rstrip()
+        self.original_lines = self.original.lstrip("\n").split("\n")
+        # The offset into the stream of the first line that hasn't been checked.
+        self.offset = 0
+        # Whether the first non-blank line (which opens the snippet) has been seen.
+        self.started = False
+        # The number of lines of the original that the rewrite has reproduced, or None
+        # once the rewrite has diverged from it.
+        self.matched: int | None = 0
+        self.scanner = _Scanner()
+
+    def _match(self, line: str) -> None:
+        if self.matched is None:
+            return
+        if self.matched < len(self.original_lines):
+            if line == self.original_lines[self.matched]:
+                self.matched += 1
+            else:
+                self.matched = None
+        elif line.strip():
+            self.matched = None
+
+    def __call__(self, text: str) -> Cancellation | None:
+        # N.B. The last line may be incomplete.
+        while (end := text.find("\n", self.offset)) != -1:
+            start, self.offset = self.offset, end + 1
+            line = text[start:end]
+            if not self.started:
+                # N.B. Skip any leading blank lines.
+                if line.strip():
+                    self.started = True
+                    self._match(line)
+                    self.scanner.scan(line)
+                continue
+
+            is_open = self.scanner.is_open()
+            reproduced = self.matched == len(self.original_lines)
+            self._match(line)
+            self.scanner.scan(line)
+            if is_open or not line or line[0].isspace():
+                continue
+            if line.startswith("#") and not line.startswith("###"):
+                continue
+
+            prefix = text[:start].rstrip()
+            if reproduced:
+                return Cancellation(prefix + "\n", "unchanged")
+            if not line.startswith("###"):
+                try:
+                    ast.parse(prefix)
+                except SyntaxError:
+                    # The line continues the snippet (e.g., a decorated definition).
+                    continue
+
+            if line.startswith("###"):
+                return Cancellation(prefix + "\n", "stop_mismatch")
+            return Cancellation(f"{prefix}\n{line}\n", "collapse")
+        return None
@@ -0,0 +1,61 @@
+"""Offline token-count estimates for OpenAI's GPT-3 tokenizers.
+
+Rather than bundling the BPE vocabularies, this module pre-tokenizes text using the
+same splitting rules as the GPT-2 tokenizer, then estimates the number of BPE tokens in
+each piece using heuristics calibrated against the `r50k_base` and `p50k_base`
+encodings. The estimates err on the side of over-counting.
+"""
+
+from __future__ import annotations
+
+import math
+import re
+
+R50K_BASE: str = "r50k_base"
+P50K_BASE: str = "p50k_base"
+
+# The GPT-2 pre-tokenization pattern, with `\p{L}` and `\p{N}` approximated by the
+# classes available to the `re` module.
+PRE_TOKENIZE_PATTERN = re.compile(
+    r"""'(?:[sdmt]|ll|ve|re)| ?[^\W\d_]+| ?\d+| ?(?:[^\s\w]|_)+|\s+(?!\S)|\s+"""
+)
+
+# Splits identifiers on case boundaries (e.g., `getAttribute` -> `get`, `Attribute`).
+CASE_BOUNDARY_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\S")
+
+# The longest run of spaces that the encoding represents as a single token. The
+# `p50k_base` encoding (used by the Codex models and `text-davinci-002`) adds dedicated
+# tokens for runs of whitespace, which makes indentation far cheaper.
+MAX_SPACE_RUN: dict[str, int] = {
+    R50K_BASE: 4,
+    P50K_BASE: 24,
+}
+
+
+def _count_piece(piece: str, *, encoding: str) -> int:
+    if piece.isspace():
+        newlines = piece.count("\n")
+        spaces = len(piece) - newlines
+        return math.ceil(newlines / 2) + math.ceil(spaces / MAX_SPACE_RUN[encoding])
+
+    word = piece.lstrip(" ")
+    if word.isdigit():
+        return math.ceil(len(word) / 3)
+    if word.isalpha():
+        return sum(
+            1 if len(hump) <= 9 else math.ceil(len(hump) / 5)
+            for hump in CASE_BOUNDARY_PATTERN.findall(word)
+        )
+    if word.startswith("'"):
+        return 1
+    return math.ceil(len(word) / 2)
+
+
+def count_tokens(text: str, *, encoding: str = P50K_BASE) -> int:
+    """Estimate the number of tokens in a piece of text."""
+    if encoding not in MAX_SPACE_RUN:
+        raise ValueError(f"Unknown encoding: {encoding}")
+    return sum(
+        _count_piece(piece, encoding=encoding)
+        for piece in PRE_TOKENIZE_PATTERN.findall(text)
+    )
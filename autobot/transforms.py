@@ -22,3 +22,22 @@ class TransformType(enum.Enum):
         if self == TransformType.FUNCTION:
             return ast.FunctionDef, ast.AsyncFunctionDef
         raise NotImplementedError(f"Unhandled transform type: {self}")
+
+
+class CompletionProtocol(enum.Enum):
+    # Ask the model to rewrite the snippet in full.
+    REWRITE = "rewrite"
+    # Ask the model for an edit script, with the changed lines only.
+    EDITS = "edits"
+
+
+class NodeSelection(enum.Enum):
+    # Select every matching node, including those nested within other matching nodes.
+    ALL = "all"
+    # Select only those nodes that aren't nested within another matching node.
+    OUTERMOST = "outermost"
+    # Select only those nodes that don't contain another matching node.
+    INNERMOST = "innermost"
+    # Select the outermost nodes that fit within the snippet budget, descending into
+    # any that don't.
+    SMART = "smart"
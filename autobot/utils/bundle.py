@@ -0,0 +1,216 @@
+"""Export cached completions to portable bundles, and import them into other caches.
+
+A bundle is a gzip-compressed JSON Lines file: a header, followed by one entry per
+cached completion, sorted by key. Bundles are deterministic (the same entries always
+produce the same bytes), and are named after the SHA-256 digest of their contents by
+default, such that identical bundles can be deduplicated by name alone.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import io
+import json
+import os
+from typing import TYPE_CHECKING, Any, Iterable, NamedTuple
+
+from autobot import api
+from autobot.utils import cache
+
+if TYPE_CHECKING:
+    from autobot.schematic import Schematic
+
+BUNDLE_FORMAT: str = "autobot-cache-bundle"
+BUNDLE_VERSION: int = 1
+
+
+class BundleError(Exception):
+    pass
+
+
+class BundleEntry(NamedTuple):
+    # The key under which the completion is cached (see `api.request_hash`).
+    key: str
+    # The request that produced the completion, if known.
+    request: dict[str, Any] | None
+    response: dict[str, Any]
+
+
+def _prompt_prefixes(schematic: Schematic) -> list[str]:
+    """Return the portions of a prompt that are shared by every snippet in a schematic,
+    for each kind of prompt (i.e., a rewrite, an edit script, or a packed rewrite)."""
+    from autobot.prompt import make_edit_prompt, make_packed_prompt, make_prompt
+
+    sentinel = "\0"
+    kwargs: dict[str, Any] = {
+        "transform_type": schematic.transform_type,
+        "before_text": schematic.before_text,
+        "after_text": schematic.after_text,
+        "before_description": schematic.before_description,
+        "after_description": schematic.after_description,
+    }
+    prefixes: list[str] = []
+    for text in (
+        make_prompt(sentinel, **kwargs).text,
+        make_edit_prompt(sentinel, **kwargs).text,
+    ):
+        prefixes.append(text[: text.index(sentinel)])
+
+    # N.B. The header that precedes each snippet in a packed prompt includes the number
+    # of snippets, so stop short of it.
+    text = make_packed_prompt([sentinel], **kwargs).text
+    text = text[: text.index(sentinel)]
+    prefixes.append(text[: text.rindex("###")])
+    return prefixes
+
+
+def collect_entries(
+    *,
+    models: Iterable[str] | None = None,
+    schematics: Iterable[Schematic] | None = None,
+) -> list[BundleEntry]:
+    """Collect the entries in the cache, optionally filtered by model or schematic.
+
+    Entries written before requests were stored alongside completions can be filtered
+    by model, but never match a schematic.
+    """
+    allowed_models = set(models) if models is not None else None
+    prefixes = (
+        [prefix for schematic in schematics for prefix in _prompt_prefixes(schematic)]
+        if schematics is not None
+        else None
+    )
+
+    entries: list[BundleEntry] = []
+    for key in cache.iter_keys():
+        response: dict[str, Any] | None = cache.get_from_cache(key)
+        if response is None:
+            continue
+        metadata = cache.get_metadata(key) or {}
+        request: dict[str, Any] | None = metadata.get("request")
+
+        if allowed_models is not None:
+            model = request["model"] if request else response.get("model")
+            if model not in allowed_models:
+                continue
+        if prefixes is not None and (
+            request is None
+            or not any(request["prompt"].startswith(prefix) for prefix in prefixes)
+        ):
+            continue
+
+        entries.append(BundleEntry(key, request, response))
+    return entries
+
+
+def write_bundle(entries: Iterable[BundleEntry], *, path: str | None = None) -> str:
+    """Write entries to a bundle, returning its path.
+
+    If no path is provided, the bundle is named after the digest of its contents.
+    """
+    unique: dict[str, BundleEntry] = {}
+    for entry in entries:
+        unique.setdefault(entry.key, entry)
+
+    buffer = io.BytesIO()
+    # N.B. Omit the modification time from the gzip header, to keep bundles
+    # deterministic.
+    with gzip.GzipFile(fileobj=buffer, mode="wb", mtime=0) as fp:
+        header = {
+            "format": BUNDLE_FORMAT,
+            "version": BUNDLE_VERSION,
+            "entries": len(unique),
+        }
+        fp.write((json.dumps(header, sort_keys=True) + "\n").encode("utf-8"))
+        for key in sorted(unique):
+            line = json.dumps(unique[key]._asdict(), sort_keys=True) + "\n"
+            fp.write(line.encode("utf-8"))
+    contents = buffer.getvalue()
+
+    if path is None:
+        digest = hashlib.sha256(contents).hexdigest()
+        path = f"autobot-cache-{digest[:16]}.jsonl.gz"
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as raw:
+        raw.write(contents)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_bundle(path: str) -> list[BundleEntry]:
+    """Read the entries from a bundle, verifying that each matches its key."""
+    with gzip.open(path, "rt", encoding="utf-8") as fp:
+        try:
+            header = json.loads(fp.readline())
+        except (json.JSONDecodeError, OSError):
+            raise BundleError(f"Not a cache bundle: {path}") from None
+        if header.get("format") != BUNDLE_FORMAT:
+            raise BundleError(f"Not a cache bundle: {path}")
+        if header.get("version") != BUNDLE_VERSION:
+            raise BundleError(
+                f"Unsupported bundle version: {header.get('version')} "
+                f"(expected: {BUNDLE_VERSION})"
+            )
+
+        entries: list[BundleEntry] = []
+        for line in fp:
+            entry = BundleEntry(**json.loads(line))
+            if entry.request is not None and entry.key != api.request_hash(
+                entry.request["prompt"],
+                entry.request["max_tokens"],
+                temperature=entry.request["temperature"],
+                model=entry.request["model"],
+                stop=entry.request["stop"],
+            ):
+                raise BundleError(f"Entry does not match its key: {entry.key}")
+            entries.append(entry)
+
+    if len(entries) != header.get("entries"):
+        raise BundleError(
+            f"Bundle is incomplete: {path} "
+            f"(expected {header.get('entries')} entries, found {len(entries)})"
+        )
+    return entries
+
+
+def read_cache_directory(directory: str) -> list[BundleEntry]:
+    """Read the entries from a cache directory (e.g., one copied from another worker)."""
+    entries: list[BundleEntry] = []
+    try:
+        filenames = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        return entries
+    for key in filenames:
+        if not cache.KEY_PATTERN.match(key):
+            continue
+        with open(os.path.join(directory, key), "r") as fp:
+            response = json.load(fp)
+        try:
+            with open(os.path.join(directory, "metadata", key), "r") as fp:
+                request = json.load(fp).get("request")
+        except FileNotFoundError:
+            request = None
+        entries.append(BundleEntry(key, request, response))
+    return entries
+
+
+def import_entries(entries: Iterable[BundleEntry]) -> tuple[int, int]:
+    """Add entries to the cache, skipping any that are already present.
+
+    Returns: a tuple of (number imported, number skipped).
+    """
+    imported = 0
+    skipped = 0
+    for entry in entries:
+        if cache.has_in_cache(entry.key):
+            skipped += 1
+            continue
+        cache.set_in_cache(
+            entry.key,
+            entry.response,
+            metadata={"request": entry.request} if entry.request is not None else None,
+        )
+        imported += 1
+    return imported, skipped
@@ -2,43 +2,251 @@
 
 from __future__ import annotations
 
+import collections
 import json
 import os
-from typing import TypeVar, cast
+import re
+import socket
+import threading
+import time
+from typing import Any, Iterator, TypeVar, cast
 
-CACHE_DIR = os.path.join(os.getcwd(), ".autobot_cache")
+from autobot.utils import metrics, profiling
+
+# The name of the default cache directory.
+CACHE_DIRNAME = ".autobot_cache"
+
+
+def default_cache_dir() -> str:
+    """Return the cache directory for the current working directory: `.autobot_cache`,
+    unless shared (e.g., across checkouts) via `AUTOBOT_CACHE_DIR`."""
+    return os.environ.get("AUTOBOT_CACHE_DIR") or os.path.join(
+        os.getcwd(), CACHE_DIRNAME
+    )
+
+
+# The directory in which to store cached values. Resolved at import time, and again (via
+# `set_cache_dir`) by a long-lived process that changes its working directory.
+CACHE_DIR = default_cache_dir()
+
+# The subdirectory in which to store the metadata (e.g., the request) for each value.
+METADATA_DIR = os.path.join(CACHE_DIR, "metadata")
+
+# The subdirectory in which to store leases on values that are being computed.
+LEASE_DIR = os.path.join(CACHE_DIR, "leases")
+
+# The age (in seconds) after which a lease is considered abandoned.
+LEASE_TIMEOUT: float = 300.0
+
+# The age (in seconds) after which an unreadable (i.e., empty or partially-written) lease
+# is considered abandoned. A lease is written as soon as it's created, so one that's
+# still unreadable after this long was left behind by a holder that died mid-write.
+LEASE_WRITE_TIMEOUT: float = 1.0
+
+# The interval (in seconds) at which to check whether a lease has been released.
+LEASE_POLL_INTERVAL: float = 0.1
+
+# The maximum number of values to hold in memory, in front of the filesystem (e.g., to
+# keep the cache warm in a long-lived process).
+MEMORY_CACHE_SIZE: int = 4096
+
+KEY_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+# Map from cache filename to value, for the most recently used values.
+_memory: collections.OrderedDict[str, Any] = collections.OrderedDict()
+_memory_lock = threading.Lock()
 
 T = TypeVar("T")
 
 
+def set_cache_dir(directory: str) -> None:
+    """Point the cache at a different directory.
+
+    N.B. The in-memory cache is keyed by filename, so values are never shared across
+    directories.
+    """
+    global CACHE_DIR, METADATA_DIR, LEASE_DIR
+    CACHE_DIR = directory
+    METADATA_DIR = os.path.join(directory, "metadata")
+    LEASE_DIR = os.path.join(directory, "leases")
+
+
 def cache_filename(key: str) -> str:
     return os.path.join(CACHE_DIR, key)
 
 
+def metadata_filename(key: str) -> str:
+    return os.path.join(METADATA_DIR, key)
+
+
+def iter_keys() -> Iterator[str]:
+    """Enumerate the keys of all values in the cache."""
+    try:
+        filenames = os.listdir(CACHE_DIR)
+    except FileNotFoundError:
+        return
+    for filename in sorted(filenames):
+        if KEY_PATTERN.match(filename):
+            yield filename
+
+
+def get_metadata(key: str) -> dict[str, Any] | None:
+    """Return the metadata stored alongside a value, if any."""
+    try:
+        with open(metadata_filename(key), "r") as fp:
+            return cast(dict[str, Any], json.load(fp))
+    except FileNotFoundError:
+        return None
+
+
+def _remember(filename: str, value: Any) -> None:
+    with _memory_lock:
+        _memory[filename] = value
+        _memory.move_to_end(filename)
+        while len(_memory) > MEMORY_CACHE_SIZE:
+            _memory.popitem(last=False)
+
+
+def _recall(filename: str) -> Any | None:
+    with _memory_lock:
+        value = _memory.get(filename)
+        if value is not None:
+            _memory.move_to_end(filename)
+        return value
+
+
+def _forget(filename: str) -> None:
+    with _memory_lock:
+        _memory.pop(filename, None)
+
+
 def has_in_cache(key: str) -> bool:
+    if _recall(cache_filename(key)) is not None:
+        return True
     os.makedirs(os.path.dirname(cache_filename(key)), exist_ok=True)
     return os.path.exists(cache_filename(key))
 
 
 def get_from_cache(key: str) -> T | None:
+    if (value := _recall(cache_filename(key))) is not None:
+        metrics.increment("autobot_cache_reads_total", result="hit")
+        return cast(T, value)
+
     os.makedirs(os.path.dirname(cache_filename(key)), exist_ok=True)
-    try:
-        with open(cache_filename(key), "r") as fp:
-            return cast(T, json.load(fp))
-    except FileNotFoundError:
-        return None
+    with metrics.timer("autobot_cache_read_seconds"), profiling.span("read", "cache"):
+        try:
+            with open(cache_filename(key), "r") as fp:
+                value = cast(T, json.load(fp))
+        except FileNotFoundError:
+            metrics.increment("autobot_cache_reads_total", result="miss")
+            return None
+    metrics.increment("autobot_cache_reads_total", result="hit")
+    _remember(cache_filename(key), value)
+    return value
 
 
-def set_in_cache(key: str, value: T) -> None:
+def set_in_cache(key: str, value: T, *, metadata: dict[str, Any] | None = None) -> None:
     os.makedirs(os.path.dirname(cache_filename(key)), exist_ok=True)
-    with open(cache_filename(key), "w") as fp:
-        json.dump(value, fp)
+    with metrics.timer("autobot_cache_write_seconds"), profiling.span("write", "cache"):
+        # Write the metadata first, such that it's available to any reader of the value.
+        if metadata is not None:
+            os.makedirs(METADATA_DIR, exist_ok=True)
+            with open(metadata_filename(key), "w") as fp:
+                json.dump(metadata, fp)
+        # Write atomically, such that concurrent readers never observe a partial value.
+        tmp_filename = f"{cache_filename(key)}.{os.getpid()}.tmp"
+        with open(tmp_filename, "w") as fp:
+            json.dump(value, fp)
+        os.replace(tmp_filename, cache_filename(key))
+    _remember(cache_filename(key), value)
+    metrics.increment("autobot_cache_writes_total")
 
 
 def delete_from_cache(key: str) -> bool:
+    _forget(cache_filename(key))
     os.makedirs(os.path.dirname(cache_filename(key)), exist_ok=True)
+    try:
+        os.remove(metadata_filename(key))
+    except FileNotFoundError:
+        pass
     try:
         os.remove(cache_filename(key))
         return True
     except FileNotFoundError:
         return False
+
+
+def lease_filename(key: str) -> str:
+    return os.path.join(LEASE_DIR, key)
+
+
+def _is_stale(filename: str) -> bool:
+    """Return True if a lease has expired, or its holder has exited."""
+    try:
+        age = time.time() - os.path.getmtime(filename)
+        if age > LEASE_TIMEOUT:
+            return True
+        with open(filename, "r") as fp:
+            holder = json.load(fp)
+    except FileNotFoundError:
+        return True
+    except json.JSONDecodeError:
+        # The holder may still be writing the lease (unless it's been a while).
+        return age > LEASE_WRITE_TIMEOUT
+
+    if holder.get("host") != socket.gethostname():
+        return False
+    try:
+        os.kill(holder["pid"], 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def acquire_lease(key: str) -> bool:
+    """Attempt to claim the (cross-process) right to compute the value for a key.
+
+    Returns True if the lease was acquired, and False if it's held by another process.
+    Expired or abandoned leases are broken.
+    """
+    os.makedirs(LEASE_DIR, exist_ok=True)
+    filename = lease_filename(key)
+    try:
+        fd = os.open(filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        if not _is_stale(filename):
+            return False
+        # N.B. Two processes may race to break the same lease, in which case both
+        # can end up computing the value. This is wasteful, but harmless.
+        try:
+            os.remove(filename)
+        except FileNotFoundError:
+            pass
+        try:
+            fd = os.open(filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+
+    with os.fdopen(fd, "w") as fp:
+        json.dump(
+            {"host": socket.gethostname(), "pid": os.getpid(), "time": time.time()}, fp
+        )
+    return True
+
+
+def release_lease(key: str) -> None:
+    try:
+        os.remove(lease_filename(key))
+    except FileNotFoundError:
+        pass
+
+
+def wait_for_lease(key: str) -> None:
+    """Block until the lease on a key is released (or expires), or its value is set."""
+    filename = lease_filename(key)
+    while os.path.exists(filename) and not os.path.exists(cache_filename(key)):
+        if _is_stale(filename):
+            return
+        time.sleep(LEASE_POLL_INTERVAL)
@@ -0,0 +1,189 @@
+"""A pooled HTTP client for the OpenAI Completions endpoint.
+
+The client holds a single keep-alive session for the lifetime of a run, with a
+connection pool sized to the number of threads issuing requests, such that connections
+(and TLS sessions) are reused across requests rather than re-established per thread.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+from typing import Any, Generator, NamedTuple
+
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from autobot.version import __version__
+
+DEFAULT_API_BASE: str = "https://api.openai.com/v1"
+
+# The timeouts (in seconds) to establish a connection, and to wait for a response.
+CONNECT_TIMEOUT: float = 10.0
+READ_TIMEOUT: float = 600.0
+
+# The time taken to establish a connection on the current thread, if the current
+# request required a new one.
+_connect_seconds = threading.local()
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self) -> None:
+        start = time.perf_counter()
+        super().connect()
+        _connect_seconds.value = time.perf_counter() - start
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self) -> None:
+        start = time.perf_counter()
+        super().connect()
+        _connect_seconds.value = time.perf_counter() - start
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+def connect_seconds() -> float | None:
+    """Return the time taken to connect for the current thread's last request, or None
+    if it reused an existing connection."""
+    return getattr(_connect_seconds, "value", None)
+
+
+class Timings(NamedTuple):
+    # The time (in seconds) taken to establish a new connection, or None if an
+    # existing connection was reused.
+    connect: float | None
+    # The time (in seconds) until the response headers were received.
+    ttfb: float
+    # The time (in seconds) until the response body was received in full.
+    total: float
+
+
+def _error(response: requests.Response) -> openai.error.OpenAIError:
+    """Convert an error response into the equivalent OpenAI exception."""
+    try:
+        body = response.json()
+        message = body["error"]["message"]
+    except (ValueError, KeyError, TypeError):
+        body = None
+        message = response.text
+    kwargs: dict[str, Any] = {
+        "http_body": response.text,
+        "http_status": response.status_code,
+        "json_body": body,
+        "headers": dict(response.headers),
+    }
+    if response.status_code == 429:
+        return openai.error.RateLimitError(message, **kwargs)
+    if response.status_code == 401:
+        return openai.error.AuthenticationError(message, **kwargs)
+    if response.status_code == 403:
+        return openai.error.PermissionError(message, **kwargs)
+    if response.status_code in (400, 404, 409, 422):
+        return openai.error.InvalidRequestError(message, None, **kwargs)
+    if response.status_code == 503:
+        return openai.error.ServiceUnavailableError(message, **kwargs)
+    return openai.error.APIError(message, **kwargs)
+
+
+class CompletionClient:
+    """Sends completion requests over a shared, pooled session."""
+
+    def __init__(
+        self,
+        *,
+        api_base: str = DEFAULT_API_BASE,
+        api_key: str | None = None,
+        organization: str | None = None,
+        pool_size: int = 8,
+    ) -> None:
+        self.api_base = api_base
+        self.api_key = api_key
+        self.url = f"{api_base.rstrip('/')}/completions"
+        self.session = requests.Session()
+        adapter = _TimedHTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = f"autobot/{__version__}"
+        if api_key is not None:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+        if organization is not None:
+            self.session.headers["OpenAI-Organization"] = organization
+
+    def _post(self, request: dict[str, Any]) -> requests.Response:
+        _connect_seconds.value = None
+        try:
+            # N.B. Defer reading the body, such that `post` returns once the headers
+            # have been received.
+            response = self.session.post(
+                self.url,
+                json=request,
+                stream=True,
+                timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+            )
+        except requests.exceptions.Timeout as error:
+            raise openai.error.Timeout("Request timed out") from error
+        except requests.exceptions.RequestException as error:
+            raise openai.error.APIConnectionError(
+                f"Error communicating with the API: {error}"
+            ) from error
+        if not response.ok:
+            try:
+                raise _error(response)
+            finally:
+                response.close()
+        return response
+
+    def create(self, request: dict[str, Any]) -> tuple[dict[str, Any], Timings]:
+        """Request a completion."""
+        start = time.perf_counter()
+        response = self._post(request)
+        ttfb = time.perf_counter() - start
+        try:
+            body: dict[str, Any] = response.json()
+        except ValueError as error:
+            raise openai.error.APIError(
+                f"Invalid response body: {response.text!r}"
+            ) from error
+        finally:
+            response.close()
+        return body, Timings(connect_seconds(), ttfb, time.perf_counter() - start)
+
+    def stream(self, request: dict[str, Any]) -> Generator[dict[str, Any], None, None]:
+        """Request a completion as a stream of chunks.
+
+        The connection is returned to the pool once the stream is exhausted, or dropped if
+        the iterator is closed early.
+        """
+        response = self._post({**request, "stream": True})
+        try:
+            for line in response.iter_lines():
+                # N.B. Read through to the end of the body (past the `[DONE]` event),
+                # such that the connection can be reused.
+                if not line.startswith(b"data: ") or line == b"data: [DONE]":
+                    continue
+                yield json.loads(line[len(b"data: ") :])
+        finally:
+            response.close()
+
+    def close(self) -> None:
+        self.session.close()
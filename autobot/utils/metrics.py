@@ -0,0 +1,226 @@
+"""In-process counters and latency histograms, exportable as a run report."""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import math
+import os
+import threading
+import time
+from typing import Any, Iterator
+
+# The upper bounds (in seconds) of the buckets used for latency histograms.
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    math.inf,
+)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Histogram:
+    """A distribution of observed values, bucketed by upper bound."""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value: float) -> None:
+        for i, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                self.bucket_counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def cumulative_counts(self) -> list[int]:
+        counts: list[int] = []
+        total = 0
+        for count in self.bucket_counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+class Registry:
+    """A thread-safe collection of counters and histograms."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.counters: dict[str, dict[Labels, float]] = {}
+        self.histograms: dict[str, dict[Labels, Histogram]] = {}
+
+    def increment(self, name: str, amount: float = 1.0, **labels: Any) -> None:
+        key = _labels(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + amount
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = _labels(labels)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        """Observe the duration of a block (in seconds) in a histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def value(self, name: str, **labels: Any) -> float:
+        """Return the sum of a counter across all series matching the given labels."""
+        expected = set(_labels(labels))
+        with self.lock:
+            return sum(
+                value
+                for key, value in self.counters.get(name, {}).items()
+                if expected <= set(key)
+            )
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def to_json(self) -> dict[str, Any]:
+        with self.lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(key), "value": value}
+                    for name, series in sorted(self.counters.items())
+                    for key, value in sorted(series.items())
+                ],
+                "histograms": [
+                    {
+                        "name": name,
+                        "labels": dict(key),
+                        "count": histogram.count,
+                        "sum": histogram.sum,
+                        "min": histogram.min if histogram.count else None,
+                        "max": histogram.max if histogram.count else None,
+                        "buckets": {
+                            _format_bound(upper_bound): count
+                            for upper_bound, count in zip(
+                                histogram.buckets, histogram.cumulative_counts()
+                            )
+                        },
+                    }
+                    for name, series in sorted(self.histograms.items())
+                    for key, histogram in sorted(series.items())
+                ],
+            }
+
+    def to_prometheus(self) -> str:
+        lines: list[str] = []
+        with self.lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+            for name, histograms in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(histograms.items()):
+                    for upper_bound, count in zip(
+                        histogram.buckets, histogram.cumulative_counts()
+                    ):
+                        bucket_key = (*key, ("le", _format_bound(upper_bound)))
+                        lines.append(
+                            f"{name}_bucket{_format_labels(bucket_key)} {count}"
+                        )
+                    lines.append(
+                        f"{name}_sum{_format_labels(key)} {_format_value(histogram.sum)}"
+                    )
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_bound(upper_bound: float) -> str:
+    return "+Inf" if math.isinf(upper_bound) else f"{upper_bound:g}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: Labels) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{label}="{_escape(value)}"' for label, value in key) + "}"
+
+
+def _format_metadata(metadata: dict[str, Any]) -> str:
+    labels: dict[str, Any] = {}
+    lines: list[str] = []
+    for key, value in metadata.items():
+        if value is None:
+            continue
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            lines.append(f"# TYPE autobot_run_{key} gauge")
+            lines.append(f"autobot_run_{key} {_format_value(value)}")
+        else:
+            labels[key] = value
+    lines.append("# TYPE autobot_run_info gauge")
+    lines.append(f"autobot_run_info{_format_labels(_labels(labels))} 1")
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+increment = REGISTRY.increment
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+value = REGISTRY.value
+
+
+def write_report(path: str, **metadata: Any) -> None:
+    """Write the collected metrics to disk.
+
+    Files with a `.prom` extension are written in the Prometheus text exposition format
+    (suitable for the node exporter's textfile collector), with numeric metadata
+    exposed as `autobot_run_*` gauges and all other metadata as labels on an
+    `autobot_run_info` metric. All other files are written as JSON.
+    """
+    if path.endswith(".prom"):
+        contents = _format_metadata(metadata) + REGISTRY.to_prometheus()
+    else:
+        contents = json.dumps({**metadata, **REGISTRY.to_json()}, indent=2)
+
+    # Write atomically, such that collectors never observe a partial file.
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as fp:
+        fp.write(contents)
+    os.replace(tmp_path, path)
@@ -0,0 +1,128 @@
+"""Timing spans and CPU profiles, for diagnosing slow runs.
+
+Profiling is disabled by default, in which case spans are no-ops. Once enabled, spans
+are recorded from every thread and can be written out in the Chrome trace event format
+(loadable in `chrome://tracing`, Perfetto, or Speedscope).
+"""
+
+from __future__ import annotations
+
+import contextlib
+import cProfile
+import json
+import os
+import threading
+import time
+from typing import Any, ContextManager, Iterator, NamedTuple
+
+
+class Span(NamedTuple):
+    name: str
+    # The kind of span (e.g., "stage", "file", or "snippet").
+    category: str
+    # The start time of the span (in seconds), relative to the start of profiling.
+    start: float
+    # The duration of the span (in seconds).
+    duration: float
+    thread_id: int
+    args: dict[str, Any]
+
+
+class Profiler:
+    def __init__(self, *, cpu: bool = False) -> None:
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+        self.spans: list[Span] = []
+        self.cpu_profile = cProfile.Profile() if cpu else None
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str, **args: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self.lock:
+                self.spans.append(
+                    Span(
+                        name=name,
+                        category=category,
+                        start=start - self.origin,
+                        duration=end - start,
+                        thread_id=threading.get_ident(),
+                        args=args,
+                    )
+                )
+
+    @contextlib.contextmanager
+    def profile_cpu(self) -> Iterator[None]:
+        if self.cpu_profile is None:
+            yield
+            return
+        self.cpu_profile.enable()
+        try:
+            yield
+        finally:
+            self.cpu_profile.disable()
+
+    def slowest(self, category: str, n: int = 5) -> list[Span]:
+        with self.lock:
+            spans = [span for span in self.spans if span.category == category]
+        return sorted(spans, key=lambda span: span.duration, reverse=True)[:n]
+
+    def write_trace(self, path: str) -> None:
+        """Write the recorded spans as a Chrome trace."""
+        pid = os.getpid()
+        with self.lock:
+            events = [
+                {
+                    "name": span.name,
+                    "cat": span.category,
+                    "ph": "X",
+                    "ts": span.start * 1e6,
+                    "dur": span.duration * 1e6,
+                    "pid": pid,
+                    "tid": span.thread_id,
+                    "args": span.args,
+                }
+                for span in self.spans
+            ]
+        with open(path, "w") as fp:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fp)
+
+    def write_cpu_profile(self, path: str) -> None:
+        """Write the CPU profile in `pstats` format."""
+        assert self.cpu_profile is not None, "CPU profiling is disabled."
+        self.cpu_profile.dump_stats(path)
+
+
+_profiler: Profiler | None = None
+
+
+def enable(*, cpu: bool = False) -> Profiler:
+    """Start recording spans (and, optionally, a CPU profile of CPU-bound stages)."""
+    global _profiler
+
+    _profiler = Profiler(cpu=cpu)
+    return _profiler
+
+
+def get_profiler() -> Profiler | None:
+    return _profiler
+
+
+def span(name: str, category: str = "stage", **args: Any) -> ContextManager[None]:
+    """Record the duration of a block, if profiling is enabled."""
+    if _profiler is None:
+        return contextlib.nullcontext()
+    return _profiler.span(name, category, **args)
+
+
+def profile_cpu() -> ContextManager[None]:
+    """Include a (CPU-bound) block in the CPU profile, if CPU profiling is enabled.
+
+    N.B. The CPU profile only captures the calling thread.
+    """
+    if _profiler is None:
+        return contextlib.nullcontext()
+    return _profiler.profile_cpu()
@@ -0,0 +1,100 @@
+"""Record completion requests and responses to an archive, and replay them offline.
+
+An archive is a gzip-compressed JSON Lines file: a header, followed by one entry per
+request (in the order in which the responses were received). Entries are flushed as
+they're written, such that an archive can be streamed (e.g., via `zcat`) while a run
+is in progress.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import threading
+import time
+from typing import IO, Any, NamedTuple
+
+# The version of the archive format.
+ARCHIVE_VERSION: int = 1
+
+
+class ReplayError(Exception):
+    pass
+
+
+class Exchange(NamedTuple):
+    # The key under which the request is cached (see `api.request_hash`).
+    key: str
+    request: dict[str, Any]
+    response: dict[str, Any]
+    # The time (in seconds) taken to receive the response.
+    latency: float
+    # Whether the response was read from the cache, rather than the API.
+    cached: bool
+
+
+class Recorder:
+    """Appends request/response pairs to an archive."""
+
+    def __init__(self, path: str) -> None:
+        self.lock = threading.Lock()
+        self.fp: IO[str] = gzip.open(path, "wt", encoding="utf-8")
+        self._write({"version": ARCHIVE_VERSION, "created_at": time.time()})
+
+    def _write(self, entry: dict[str, Any]) -> None:
+        self.fp.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self.fp.flush()
+
+    def record(self, exchange: Exchange) -> None:
+        with self.lock:
+            self._write(exchange._asdict())
+
+    def close(self) -> None:
+        with self.lock:
+            self.fp.close()
+
+
+class Replayer:
+    """Serves the responses from an archive, keyed by request."""
+
+    def __init__(self, path: str, *, latency: bool = False) -> None:
+        # Whether to reproduce the original latency of each response.
+        self.latency = latency
+        self.exchanges: dict[str, Exchange] = {}
+        for exchange in read_archive(path):
+            # If a request appears more than once, serve the first response.
+            self.exchanges.setdefault(exchange.key, exchange)
+
+    def replay(self, key: str) -> dict[str, Any]:
+        try:
+            exchange = self.exchanges[key]
+        except KeyError:
+            raise ReplayError(f"No recorded response for request: {key}") from None
+        if self.latency and not exchange.cached:
+            time.sleep(exchange.latency)
+        return exchange.response
+
+
+def read_archive(path: str) -> list[Exchange]:
+    """Read the exchanges from an archive, ignoring any partially-written entry."""
+    exchanges: list[Exchange] = []
+    with gzip.open(path, "rt", encoding="utf-8") as fp:
+        try:
+            header = json.loads(fp.readline())
+        except json.JSONDecodeError:
+            raise ReplayError(f"Not a recording: {path}") from None
+        if header.get("version") != ARCHIVE_VERSION:
+            raise ReplayError(
+                f"Unsupported recording version: {header.get('version')} "
+                f"(expected: {ARCHIVE_VERSION})"
+            )
+        try:
+            for line in fp:
+                try:
+                    exchanges.append(Exchange(**json.loads(line)))
+                except json.JSONDecodeError:
+                    break
+        except EOFError:
+            # The archive was truncated (e.g., by an interrupted run).
+            pass
+    return exchanges
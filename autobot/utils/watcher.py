@@ -0,0 +1,192 @@
+"""Detect changes to the Python files in a set of targets.
+
+On Linux, changes are detected via inotify (accessed through `ctypes`, to avoid a
+dependency), such that only the files that were written are reported. Elsewhere, or if
+inotify is unavailable (e.g., the watch limit has been reached), the targets are polled.
+"""
+
+from __future__ import annotations
+
+import abc
+import ctypes
+import ctypes.util
+import glob
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+from autobot.utils.filesystem import collect_python_files, is_python_file
+
+# The interval (in seconds) at which to poll for changes, if inotify is unavailable.
+POLL_INTERVAL: float = 0.5
+
+# The time (in seconds) to wait for further changes after the first, such that a burst
+# of writes (e.g., an editor's save, or a `git checkout`) is reported as one change.
+DEBOUNCE_SECONDS: float = 0.1
+
+# See: inotify(7).
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# The header of each event: the watch descriptor, mask, cookie, and name length.
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class Watcher(abc.ABC):
+    """Waits for changes to the Python files in a set of targets."""
+
+    @abc.abstractmethod
+    def wait(self) -> set[str]:
+        """Block until one or more files have changed.
+
+        Returns: the paths of the files that were written, created, or removed.
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class PollingWatcher(Watcher):
+    def __init__(self, targets: list[str], *, interval: float = POLL_INTERVAL) -> None:
+        self.targets = targets
+        self.interval = interval
+        self.snapshot = self._snapshot()
+
+    def _snapshot(self) -> dict[str, tuple[int, int]]:
+        snapshot: dict[str, tuple[int, int]] = {}
+        for filename in collect_python_files(self.targets):
+            try:
+                stat = os.stat(filename)
+            except FileNotFoundError:
+                continue
+            snapshot[filename] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def wait(self) -> set[str]:
+        while True:
+            time.sleep(self.interval)
+            snapshot = self._snapshot()
+            changed = {
+                filename
+                for filename in snapshot.keys() | self.snapshot.keys()
+                if snapshot.get(filename) != self.snapshot.get(filename)
+            }
+            self.snapshot = snapshot
+            if changed:
+                return changed
+
+
+class InotifyWatcher(Watcher):
+    def __init__(self, targets: list[str]) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+        self.targets = targets
+        # Map from watch descriptor to the prefix of the paths within that directory
+        # (matching the paths returned by `collect_python_files`).
+        self.directories: dict[int, str] = {}
+        # The directories to watch recursively, and the individual files to watch.
+        self.roots: list[str] = []
+        self.files: set[str] = set()
+        try:
+            for target in targets:
+                for path in glob.iglob(target):
+                    if os.path.isdir(path):
+                        self.roots.append(path)
+                        self._watch_tree(path)
+                    elif is_python_file(path):
+                        self.files.add(path)
+                        self._watch(os.path.dirname(path))
+        except OSError:
+            self.close()
+            raise
+
+    def _watch(self, directory: str) -> None:
+        wd = self._add_watch(self.fd, os.fsencode(directory or "."), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"Unable to watch {directory}: {os.strerror(errno)}")
+        self.directories[wd] = directory
+
+    def _watch_tree(self, root: str) -> set[str]:
+        """Watch a directory and its subdirectories, returning any Python files within."""
+        filenames: set[str] = set()
+        for directory, _, names in os.walk(root):
+            self._watch(directory)
+            filenames.update(
+                os.path.join(directory, name) for name in names if is_python_file(name)
+            )
+        return filenames
+
+    def _in_scope(self, path: str) -> bool:
+        return path in self.files or any(
+            path.startswith(os.path.join(root, "")) for root in self.roots
+        )
+
+    def _read(self, changed: set[str]) -> None:
+        buffer = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(buffer[offset : offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped, so any file may have changed.
+                logging.warning("Missed some file changes; rescanning...")
+                changed.update(collect_python_files(self.targets))
+                continue
+            if wd not in self.directories:
+                continue
+            path = os.path.join(self.directories[wd], name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and self._in_scope(path):
+                    changed.update(self._watch_tree(path))
+            elif mask & IN_CREATE:
+                # N.B. Wait for the file to be written (`IN_CLOSE_WRITE`).
+                continue
+            elif is_python_file(name) and self._in_scope(path):
+                changed.add(path)
+
+    def wait(self) -> set[str]:
+        changed: set[str] = set()
+        while not changed:
+            select.select([self.fd], [], [])
+            self._read(changed)
+            while select.select([self.fd], [], [], DEBOUNCE_SECONDS)[0]:
+                self._read(changed)
+        return changed
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def make_watcher(targets: list[str], *, polling: bool = False) -> Watcher:
+    """Watch a set of targets, via inotify if it's available (and otherwise, by
+    polling)."""
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(targets)
+        except (OSError, AttributeError) as error:
+            logging.warning(f"Unable to use inotify; polling instead... ({error})")
+    return PollingWatcher(targets)
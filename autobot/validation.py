@@ -0,0 +1,74 @@
+"""Validation of suggested fixes, prior to constructing patches."""
+
+from __future__ import annotations
+
+import ast
+from typing import TYPE_CHECKING, NamedTuple
+
+if TYPE_CHECKING:
+    from autobot.schematic import Check
+
+
+class ValidationFailure(NamedTuple):
+    # The kind of failure (one of "syntax", "structure", or "check").
+    reason: str
+    message: str
+
+
+def _top_level_node(text: str) -> ast.stmt:
+    module = ast.parse(text)
+    if len(module.body) != 1:
+        raise SyntaxError(
+            f"expected a single top-level statement, found {len(module.body)}"
+        )
+    return module.body[0]
+
+
+def _describe(node: ast.stmt) -> str:
+    name = getattr(node, "name", None)
+    return f"{type(node).__name__} {name}" if name else type(node).__name__
+
+
+def validate_fix(
+    before: str, after: str, *, check: Check | None = None
+) -> ValidationFailure | None:
+    """Validate a suggested fix for a snippet.
+
+    A fix is valid if it parses, and defines a single node of the same kind and name as
+    the original snippet (and passes the schematic's check, if any). Unchanged snippets
+    are always valid.
+
+    Returns: the reason for the failure, if the fix is invalid.
+    """
+    if after == before:
+        return None
+
+    try:
+        node = _top_level_node(after)
+    except SyntaxError as error:
+        return ValidationFailure("syntax", f"Invalid syntax ({error})")
+
+    try:
+        expected = _top_level_node(before)
+    except SyntaxError as error:
+        # N.B. The original may itself be the output of an earlier fix (e.g., when
+        # chaining), in which case it can't be trusted either.
+        return ValidationFailure("syntax", f"Invalid original ({error})")
+    # N.B. A function may be converted to or from a coroutine.
+    functions = (ast.FunctionDef, ast.AsyncFunctionDef)
+    if (
+        not (isinstance(node, functions) and isinstance(expected, functions))
+        and type(node) is not type(expected)
+    ) or getattr(node, "name", None) != getattr(expected, "name", None):
+        return ValidationFailure(
+            "structure", f"Expected {_describe(expected)}, found {_describe(node)}"
+        )
+
+    if check is not None:
+        try:
+            message = check(before, after)
+        except Exception as error:  # noqa: BLE001
+            message = f"{type(error).__name__}: {error}"
+        if message is not None:
+            return ValidationFailure("check", f"Check failed ({message})")
+    return None
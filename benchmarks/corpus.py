@@ -0,0 +1,93 @@
+"""Generate a synthetic corpus of Python files to benchmark against.
+
+Each file consists of a sequence of classes, each with a single method. The classes use
+`object` inheritance and `typing` generics, such that the bundled
+`useless_object_inheritance` and `standard_library_generics` schematics both apply.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+
+
+def _make_snippet(index: int, *, num_lines: int, rng: random.Random) -> str:
+    lines = [
+        f"class Widget{index}(object):",
+        f"    def compute_{index}(self, values: List[int]) -> List[int]:",
+        "        result: List[int] = []",
+    ]
+    for i in range(max(num_lines - 4, 0)):
+        lines.append(f"        result.append(values[{i}] * {rng.randint(1, 1000)})")
+    lines.append("        return result")
+    return "\n".join(lines)
+
+
+def generate_corpus(
+    directory: str,
+    *,
+    num_files: int = 100,
+    snippets_per_file: int = 10,
+    snippet_lines: int = 10,
+    duplicate_ratio: float = 0.1,
+    seed: int = 0,
+) -> list[str]:
+    """Write a synthetic corpus to a directory.
+
+    Args:
+        directory: The directory in which to write the corpus.
+        num_files: The number of files to generate.
+        snippets_per_file: The number of classes in each file.
+        snippet_lines: The number of lines in each class.
+        duplicate_ratio: The fraction of classes that duplicate an earlier class.
+        seed: The seed for the random number generator.
+
+    Returns: the paths to the generated files.
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    snippets: list[str] = []
+    filenames: list[str] = []
+    for file_index in range(num_files):
+        contents = ["from typing import List", ""]
+        for _ in range(snippets_per_file):
+            if snippets and rng.random() < duplicate_ratio:
+                snippet = rng.choice(snippets)
+            else:
+                snippet = _make_snippet(len(snippets), num_lines=snippet_lines, rng=rng)
+                snippets.append(snippet)
+            contents.extend(["", snippet, ""])
+
+        filename = os.path.join(directory, f"module_{file_index}.py")
+        with open(filename, "w") as fp:
+            fp.write("\n".join(contents))
+        filenames.append(filename)
+
+    return filenames
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("directory", type=str)
+    parser.add_argument("--files", type=int, default=100)
+    parser.add_argument("--snippets-per-file", type=int, default=10)
+    parser.add_argument("--snippet-lines", type=int, default=10)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    filenames = generate_corpus(
+        args.directory,
+        num_files=args.files,
+        snippets_per_file=args.snippets_per_file,
+        snippet_lines=args.snippet_lines,
+        duplicate_ratio=args.duplicate_ratio,
+        seed=args.seed,
+    )
+    print(f"Wrote {len(filenames)} files to: {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Benchmark `autobot run` and `autobot review` end-to-end, entirely offline.
+
+Generates a synthetic corpus, starts a local stand-in for the OpenAI API, then runs
+autobot against the corpus in a subprocess, reporting throughput, peak memory usage, and
+the time spent in each stage. For example:
+
+    python -m benchmarks.harness --files 200 --latency 0.2 --nthreads 16
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import pty
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, NamedTuple
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.server import ServerConfig, start_server
+
+# The interval (in seconds) at which to press keys in `autobot review`.
+KEYSTROKE_INTERVAL: float = 0.005
+
+
+class CommandResult(NamedTuple):
+    returncode: int
+    # The wall-clock time (in seconds) of the command.
+    wall_time: float
+    # The peak resident set size (in megabytes) of the command.
+    peak_rss_mb: float
+
+
+def _wait(process: subprocess.Popen[bytes]) -> tuple[int, float]:
+    """Wait for a process, returning its exit code and peak RSS (in megabytes)."""
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    # N.B. `ru_maxrss` is reported in kilobytes on Linux, and bytes on macOS.
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return process.returncode, rusage.ru_maxrss / scale
+
+
+def run_command(
+    args: list[str], *, cwd: str, env: dict[str, str], key: str | None = None
+) -> CommandResult:
+    """Run an autobot command, optionally pressing a key repeatedly until it exits."""
+    start = time.perf_counter()
+    if key is None:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "autobot", *args],
+            cwd=cwd,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        returncode, peak_rss_mb = _wait(process)
+    else:
+        # `autobot review` reads keystrokes from a terminal. Since it flushes any
+        # pending input before each read, keep pressing the key until it exits.
+        primary, secondary = pty.openpty()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "autobot", *args],
+            cwd=cwd,
+            env=env,
+            stdin=secondary,
+            stdout=secondary,
+            stderr=secondary,
+        )
+        os.close(secondary)
+
+        done = threading.Event()
+
+        def drain() -> None:
+            try:
+                while os.read(primary, 65536):
+                    pass
+            except OSError:
+                pass
+
+        def press() -> None:
+            while not done.wait(KEYSTROKE_INTERVAL):
+                os.write(primary, key.encode("utf-8"))
+
+        threading.Thread(target=drain, daemon=True).start()
+        threading.Thread(target=press, daemon=True).start()
+        returncode, peak_rss_mb = _wait(process)
+        done.set()
+        os.close(primary)
+
+    return CommandResult(returncode, time.perf_counter() - start, peak_rss_mb)
+
+
+def _stage_times(report: dict[str, Any]) -> dict[str, float]:
+    return {
+        histogram["labels"]["stage"]: histogram["sum"]
+        for histogram in report["histograms"]
+        if histogram["name"] == "autobot_stage_seconds"
+    }
+
+
+def _counter(report: dict[str, Any], name: str) -> float:
+    return sum(
+        counter["value"] for counter in report["counters"] if counter["name"] == name
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    corpus = parser.add_argument_group("corpus")
+    corpus.add_argument("--files", type=int, default=100)
+    corpus.add_argument("--snippets-per-file", type=int, default=10)
+    corpus.add_argument("--snippet-lines", type=int, default=10)
+    corpus.add_argument("--duplicate-ratio", type=float, default=0.1)
+    server = parser.add_argument_group("server")
+    server.add_argument("--latency", type=float, default=0.05)
+    server.add_argument("--latency-per-token", type=float, default=0.0)
+    server.add_argument("--error-rate", type=float, default=0.0)
+    server.add_argument("--overrun-rate", type=float, default=0.0)
+    server.add_argument("--requests-per-minute", type=int, default=None)
+    autobot = parser.add_argument_group("autobot")
+    autobot.add_argument("--schematic", type=str, default="useless_object_inheritance")
+    autobot.add_argument("--nthreads", type=int, default=8)
+    autobot.add_argument("--extra-args", type=str, nargs=argparse.REMAINDER, default=[])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, help="Write the results as JSON.")
+    args = parser.parse_args()
+
+    completion_server = start_server(
+        ServerConfig(
+            latency=args.latency,
+            latency_per_token=args.latency_per_token,
+            error_rate=args.error_rate,
+            overrun_rate=args.overrun_rate,
+            requests_per_minute=args.requests_per_minute,
+            seed=args.seed,
+        )
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        generate_corpus(
+            os.path.join(directory, "corpus"),
+            num_files=args.files,
+            snippets_per_file=args.snippets_per_file,
+            snippet_lines=args.snippet_lines,
+            duplicate_ratio=args.duplicate_ratio,
+            seed=args.seed,
+        )
+
+        env = {
+            **os.environ,
+            "OPENAI_API_BASE": completion_server.base_url,
+            "OPENAI_API_KEY": "sk-benchmark",
+            "OPENAI_ORGANIZATION": "org-benchmark",
+            "PYTHONPATH": os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        }
+
+        report_path = os.path.join(directory, "report.json")
+        run = run_command(
+            [
+                "run",
+                args.schematic,
+                "corpus",
+                "--nthreads",
+                str(args.nthreads),
+                "--metrics-out",
+                report_path,
+                *args.extra_args,
+            ],
+            cwd=directory,
+            env=env,
+        )
+        report: dict[str, Any] = {"counters": [], "histograms": []}
+        if os.path.exists(report_path):
+            with open(report_path, "r") as fp:
+                report = json.load(fp)
+
+        num_patches = sum(
+            len(filenames)
+            for _, _, filenames in os.walk(os.path.join(directory, ".autobot_patches"))
+        )
+        review = run_command(["review"], cwd=directory, env=env, key="a")
+
+    num_snippets = _counter(report, "autobot_snippets_total")
+    results = {
+        "run": {
+            "returncode": run.returncode,
+            "wall_time": run.wall_time,
+            "peak_rss_mb": run.peak_rss_mb,
+            "snippets": num_snippets,
+            "snippets_per_second": num_snippets / run.wall_time,
+            "requests": completion_server.num_requests,
+            "patches": num_patches,
+            "stages": _stage_times(report),
+        },
+        "review": {
+            "returncode": review.returncode,
+            "wall_time": review.wall_time,
+            "peak_rss_mb": review.peak_rss_mb,
+        },
+    }
+    completion_server.shutdown()
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""A local stand-in for the OpenAI Completions endpoint.
+
+The server "completes" each prompt by extracting the snippet that autobot asked it to
+rewrite and applying a fixed set of textual substitutions (removing `object`
+inheritance and replacing `typing` generics), after a configurable delay. It can also
+inject server errors and enforce a requests-per-minute limit, responding with 429s.
+
+Point autobot at the server by setting `OPENAI_API_BASE=http://{host}:{port}/v1`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import collections
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, NamedTuple
+
+SUBSTITUTIONS: list[tuple[str, str]] = [
+    ("(object)", ""),
+    ("List[", "list["),
+    ("Dict[", "dict["),
+]
+
+
+class ServerConfig(NamedTuple):
+    # The fixed latency (in seconds) of each response.
+    latency: float = 0.0
+    # The additional latency (in seconds) per generated token.
+    latency_per_token: float = 0.0
+    # The fraction of requests that fail with a 500.
+    error_rate: float = 0.0
+    # The number of requests per minute after which requests fail with a 429.
+    requests_per_minute: int | None = None
+    # The fraction of completions that run past their stop sequence (i.e., continue
+    # with another section, as a model might).
+    overrun_rate: float = 0.0
+    # The seed for the random number generator used to inject errors.
+    seed: int = 0
+
+
+def _count_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+# The header of each snippet in a packed prompt.
+PACKED_HEADER = re.compile(r"^### Python (\w+) (\d+) of (\d+)\b.*\n", re.MULTILINE)
+
+
+def _rewrite(snippet: str) -> str:
+    for before, after in SUBSTITUTIONS:
+        snippet = snippet.replace(before, after)
+    return snippet
+
+
+# A numbered line of a snippet in an edit-script prompt.
+NUMBERED_LINE = re.compile(r"^(\d+)\| (.*)$")
+
+
+def complete(prompt: str) -> str:
+    """Generate a completion for an autobot prompt."""
+    # Edit-script prompts ask for the changed lines of the final (numbered) snippet.
+    if "\n### End of edits\n" in prompt:
+        end = prompt.rfind("\n### End of ")
+        start = prompt.rfind("### Python ", 0, end)
+        edits: list[str] = []
+        for line in prompt[start:end].splitlines()[1:]:
+            if match := NUMBERED_LINE.match(line):
+                rewritten = _rewrite(match.group(2))
+                if rewritten != match.group(2):
+                    edits.append(f"{match.group(1)}: {rewritten}\n")
+        return "".join(edits)
+
+    # The snippets to rewrite in a packed prompt are delimited by numbered headers, up
+    # to the `### End of snippets` marker. (The prompt includes the first header of the
+    # completion.)
+    end = prompt.rfind("\n### End of snippets")
+    if end != -1:
+        headers = list(PACKED_HEADER.finditer(prompt, 0, end + 1))
+        sections = [
+            prompt[header.end() : following.start() if following else end + 1]
+            for header, following in zip(headers, [*headers[1:], None])
+        ]
+        return "".join(
+            (f"### Python {header.group(1)} {i + 1} of {len(sections)}\n" if i else "")
+            + _rewrite(section)
+            for i, (header, section) in enumerate(zip(headers, sections))
+        )
+
+    # Otherwise, the snippet to rewrite is the final block before the `### End of`
+    # marker.
+    end = prompt.rfind("\n### End of ")
+    start = prompt.rfind("### Python ", 0, end)
+    if end == -1 or start == -1:
+        return ""
+    return _rewrite(prompt[start:end].split("\n", 1)[-1] + "\n")
+
+
+class CompletionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], config: ServerConfig) -> None:
+        super().__init__(address, CompletionHandler)
+        self.config = config
+        self.lock = threading.Lock()
+        self.rng = random.Random(config.seed)
+        self.request_times: collections.deque[float] = collections.deque()
+        self.num_requests = 0
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host!s}:{port}/v1"
+
+    def overrun(self) -> bool:
+        """Decide whether a completion should run past its stop sequence."""
+        with self.lock:
+            return self.rng.random() < self.config.overrun_rate
+
+    def admit(self) -> int:
+        """Decide how to respond to a request, returning an HTTP status code."""
+        with self.lock:
+            self.num_requests += 1
+            if self.rng.random() < self.config.error_rate:
+                return 500
+            if self.config.requests_per_minute is not None:
+                now = time.monotonic()
+                while self.request_times and self.request_times[0] < now - 60:
+                    self.request_times.popleft()
+                if len(self.request_times) >= self.config.requests_per_minute:
+                    return 429
+                self.request_times.append(now)
+            return 200
+
+
+class CompletionHandler(BaseHTTPRequestHandler):
+    server: CompletionServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send_json(self, status: int, body: dict[str, Any]) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, message: str, error_type: str) -> None:
+        self._send_json(
+            status, {"error": {"message": message, "type": error_type, "code": None}}
+        )
+
+    def _send_stream(
+        self, request: dict[str, Any], text: str, finish_reason: str
+    ) -> None:
+        """Stream a completion as server-sent events, one line at a time."""
+        config = self.server.config
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(data: str) -> None:
+            event = f"data: {data}\n\n".encode()
+            self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+            self.wfile.flush()
+
+        time.sleep(config.latency)
+        lines = text.splitlines(keepends=True)
+        try:
+            for i, line in enumerate(lines):
+                time.sleep(config.latency_per_token * _count_tokens(line))
+                chunk = {
+                    "object": "text_completion",
+                    "model": request.get("model"),
+                    "choices": [
+                        {
+                            "text": line,
+                            "index": 0,
+                            "logprobs": None,
+                            "finish_reason": finish_reason
+                            if i == len(lines) - 1
+                            else None,
+                        }
+                    ],
+                }
+                send(json.dumps(chunk))
+            send("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled the stream.
+            self.close_connection = True
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/completions"):
+            self._send_error(404, f"Unknown path: {self.path}", "invalid_request_error")
+            return
+
+        status = self.server.admit()
+        if status == 429:
+            self._send_error(429, "Rate limit reached.", "requests")
+            return
+        if status == 500:
+            self._send_error(500, "The server had an error.", "server_error")
+            return
+
+        prompt = request.get("prompt", "")
+        text = complete(prompt)
+        if text and self.server.overrun():
+            text += f"\n### Python snippet, continued\n{text}"
+        finish_reason = "stop"
+        max_tokens = request.get("max_tokens") or 16
+        if _count_tokens(text) > max_tokens:
+            text = text[: max_tokens * 4]
+            finish_reason = "length"
+
+        completion_tokens = _count_tokens(text)
+        config = self.server.config
+        if request.get("stream"):
+            self._send_stream(request, text, finish_reason)
+            return
+        time.sleep(config.latency + config.latency_per_token * completion_tokens)
+
+        self._send_json(
+            200,
+            {
+                "id": f"cmpl-{uuid.uuid4().hex}",
+                "object": "text_completion",
+                "created": int(time.time()),
+                "model": request.get("model"),
+                "choices": [
+                    {
+                        "text": text,
+                        "index": 0,
+                        "logprobs": None,
+                        "finish_reason": finish_reason,
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": _count_tokens(prompt),
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": _count_tokens(prompt) + completion_tokens,
+                },
+            },
+        )
+
+
+def start_server(
+    config: ServerConfig, *, host: str = "127.0.0.1", port: int = 0
+) -> CompletionServer:
+    """Start the server on a background thread."""
+    server = CompletionServer((host, port), config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--latency-per-token", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--requests-per-minute", type=int, default=None)
+    parser.add_argument("--overrun-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = CompletionServer(
+        (args.host, args.port),
+        ServerConfig(
+            latency=args.latency,
+            latency_per_token=args.latency_per_token,
+            error_rate=args.error_rate,
+            requests_per_minute=args.requests_per_minute,
+            overrun_rate=args.overrun_rate,
+            seed=args.seed,
+        ),
+    )
+    print(f"Serving completions at: {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
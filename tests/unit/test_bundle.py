@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import os
+import tempfile
+import unittest
+from typing import Any
+from unittest import mock
+
+from autobot import api, prompt
+from autobot.schematic import Schematic, load_schematics
+from autobot.utils import cache
+from autobot.utils.bundle import (
+    BundleEntry,
+    BundleError,
+    collect_entries,
+    read_bundle,
+    write_bundle,
+)
+
+
+def _entry(prompt: str, text: str) -> BundleEntry:
+    request = {
+        "model": "text-davinci-002",
+        "prompt": prompt,
+        "temperature": 0,
+        "max_tokens": 16,
+        "stop": None,
+    }
+    return BundleEntry(
+        key=api.request_hash(prompt, 16),
+        request=request,
+        response={"choices": [{"text": text, "finish_reason": "stop"}]},
+    )
+
+
+class BundleTest(unittest.TestCase):
+    def test_round_trip(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            first = write_bundle(
+                [_entry("a", "first"), _entry("b", "second"), _entry("a", "third")],
+                path=os.path.join(directory, "first.jsonl.gz"),
+            )
+            second = write_bundle(
+                [_entry("b", "second"), _entry("a", "first")],
+                path=os.path.join(directory, "second.jsonl.gz"),
+            )
+
+            # Bundles are deduplicated by key, and independent of entry order.
+            with open(first, "rb") as fp, open(second, "rb") as fp2:
+                self.assertEqual(fp.read(), fp2.read())
+            self.assertEqual(
+                read_bundle(first), [_entry("a", "first"), _entry("b", "second")]
+            )
+
+    def test_mismatched_key(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            path = write_bundle(
+                [_entry("a", "first")._replace(key=api.request_hash("b", 16))],
+                path=os.path.join(directory, "bundle.jsonl.gz"),
+            )
+            with self.assertRaises(BundleError):
+                read_bundle(path)
+
+
+class CollectEntriesTest(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for name, path in (
+            ("CACHE_DIR", directory.name),
+            ("METADATA_DIR", os.path.join(directory.name, "metadata")),
+            ("LEASE_DIR", os.path.join(directory.name, "leases")),
+        ):
+            patcher = mock.patch.object(cache, name, path)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_schematic(self) -> None:
+        (schematic,) = load_schematics("useless_object_inheritance")
+        (other,) = load_schematics("numpy_builtin_aliases")
+        snippets = ["class Foo(object):\n    pass\n", "class Bar(object):\n    x = 1\n"]
+
+        def prompts(source: Schematic) -> list[str]:
+            kwargs: dict[str, Any] = {
+                "transform_type": source.transform_type,
+                "before_text": source.before_text,
+                "after_text": source.after_text,
+                "before_description": source.before_description,
+                "after_description": source.after_description,
+            }
+            return [
+                prompt.make_prompt(snippets[0], **kwargs).text,
+                prompt.make_edit_prompt(snippets[0], **kwargs).text,
+                prompt.make_packed_prompt(snippets, **kwargs).text,
+            ]
+
+        keys: dict[str, str] = {}
+        for text in prompts(schematic) + prompts(other):
+            entry = _entry(text, "...")
+            cache.set_in_cache(
+                entry.key, entry.response, metadata={"request": entry.request}
+            )
+            keys[entry.key] = text
+
+        # Every kind of prompt is attributed to its schematic.
+        self.assertEqual(
+            sorted(
+                keys[entry.key] for entry in collect_entries(schematics=[schematic])
+            ),
+            sorted(prompts(schematic)),
+        )
+        self.assertEqual(len(collect_entries()), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
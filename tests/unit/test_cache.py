@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from autobot import api
+from autobot.utils import cache
+from benchmarks.server import ServerConfig, start_server
+
+KEY = "0123456789abcdef0123456789abcdef"
+
+
+class LeaseTest(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.object(
+            cache, "LEASE_DIR", os.path.join(directory.name, "leases")
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_acquire_and_release(self) -> None:
+        self.assertTrue(cache.acquire_lease(KEY))
+        self.assertFalse(cache.acquire_lease(KEY))
+        cache.release_lease(KEY)
+        self.assertTrue(cache.acquire_lease(KEY))
+
+    def test_abandoned_lease(self) -> None:
+        # Simulate a lease held by a process that has since exited.
+        os.makedirs(cache.LEASE_DIR)
+        with open(cache.lease_filename(KEY), "w") as fp:
+            json.dump({"host": socket.gethostname(), "pid": 2**22 + 1, "time": 0}, fp)
+        self.assertTrue(cache.acquire_lease(KEY))
+
+    def test_expired_lease(self) -> None:
+        os.makedirs(cache.LEASE_DIR)
+        with open(cache.lease_filename(KEY), "w") as fp:
+            json.dump({"host": "elsewhere", "pid": 1, "time": 0}, fp)
+        self.assertFalse(cache.acquire_lease(KEY))
+        os.utime(cache.lease_filename(KEY), (0, 0))
+        self.assertTrue(cache.acquire_lease(KEY))
+
+    def test_unreadable_lease(self) -> None:
+        # Simulate a lease whose holder died before writing it.
+        os.makedirs(cache.LEASE_DIR)
+        open(cache.lease_filename(KEY), "w").close()
+        # The holder may still be writing it...
+        self.assertFalse(cache.acquire_lease(KEY))
+        # ...but not for this long.
+        mtime = time.time() - 2 * cache.LEASE_WRITE_TIMEOUT
+        os.utime(cache.lease_filename(KEY), (mtime, mtime))
+        self.assertTrue(cache.acquire_lease(KEY))
+
+
+class SingleFlightTest(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for name, path in (
+            ("CACHE_DIR", directory.name),
+            ("METADATA_DIR", os.path.join(directory.name, "metadata")),
+            ("LEASE_DIR", os.path.join(directory.name, "leases")),
+        ):
+            patcher = mock.patch.object(cache, name, path)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.server = start_server(ServerConfig(latency=0.2))
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        api.init(
+            api_base=self.server.base_url,
+            api_key="test",
+            organization="test",
+            pool_size=8,
+        )
+        self.addCleanup(api.close)
+
+    def test_concurrent_requests(self) -> None:
+        prompt = "### Python class\nclass Foo(object):\n    pass\n### End of class\n"
+        responses: list[object] = []
+
+        def request() -> None:
+            responses.append(api.create_completion(prompt, 16))
+
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Every thread gets the same completion, from a single upstream request.
+        self.assertEqual(len(responses), 8)
+        self.assertTrue(all(response == responses[0] for response in responses))
+        self.assertEqual(self.server.num_requests, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
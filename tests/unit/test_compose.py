@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import unittest
+
+from autobot.refactor.compose import compose
+
+BEFORE = """class Foo(object):
+    def bar(self) -> List[int]:
+        return [1]
+
+    def baz(self) -> Dict[str, int]:
+        return {}
+"""
+
+
+class ComposeTest(unittest.TestCase):
+    def test_disjoint(self) -> None:
+        composition = compose(
+            BEFORE,
+            [
+                BEFORE.replace("(object)", ""),
+                BEFORE.replace("List[", "list[").replace("Dict[", "dict["),
+            ],
+        )
+        self.assertEqual(
+            composition.text,
+            """class Foo:
+    def bar(self) -> list[int]:
+        return [1]
+
+    def baz(self) -> dict[str, int]:
+        return {}""",
+        )
+        self.assertEqual(composition.applied, [0, 1])
+        self.assertEqual(composition.conflicting, [])
+
+    def test_overlapping(self) -> None:
+        composition = compose(
+            BEFORE,
+            [
+                BEFORE,
+                BEFORE.replace("List[int]", "list[int]"),
+                BEFORE.replace("List[int]", "Sequence[int]"),
+                BEFORE.replace("        return {}", "        return {}\n\n    x = 1"),
+            ],
+        )
+        self.assertEqual(composition.applied, [1, 3])
+        self.assertEqual(composition.conflicting, [2])
+        self.assertIn("list[int]", composition.text)
+        self.assertTrue(composition.text.endswith("    x = 1"))
+
+    def test_invalid(self) -> None:
+        # Each rewrite is valid, but together they leave an empty function.
+        before = "def f(self):\n    x = compute()\n    return x\n"
+        composition = compose(
+            before,
+            ["def f(self):\n    return x\n", "def f(self):\n    x = compute()\n"],
+        )
+        self.assertEqual(composition.text, "def f(self):\n    return x")
+        self.assertEqual(composition.applied, [0])
+        self.assertEqual(composition.conflicting, [1])
+
+    def test_unchanged(self) -> None:
+        self.assertEqual(compose(BEFORE, [BEFORE + "\n"]).text, BEFORE)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from typing import Any
+from unittest import mock
+
+from autobot import daemon
+from autobot.utils import cache
+
+
+def _run(options: Any) -> None:
+    print("working...", file=sys.stderr)
+    print(f"{options.message} from {os.path.basename(os.getcwd())}")
+    if options.cache_dir:
+        print(os.path.relpath(cache.CACHE_DIR))
+    if options.fail:
+        sys.exit(3)
+
+
+@unittest.skipUnless(hasattr(daemon.socket, "AF_UNIX"), "Unix sockets only")
+class DaemonTest(unittest.TestCase):
+    def test_send(self) -> None:
+        parser = argparse.ArgumentParser()
+        subparsers = parser.add_subparsers()
+        parser_run = subparsers.add_parser("run")
+        parser_run.add_argument("message")
+        parser_run.add_argument("--fail", action="store_true")
+        parser_run.add_argument("--cache-dir", action="store_true")
+        parser_run.set_defaults(func=_run)
+
+        cache_dir = cache.CACHE_DIR
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "autobot.sock")
+            server = daemon.Daemon(path, parser)
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            try:
+                self.assertTrue(daemon.is_running(path))
+                cwd = os.getcwd()
+                os.chdir(directory)
+                try:
+                    self.assertEqual(
+                        daemon.send(path, ["run", "hello"]),
+                        (
+                            f"hello from {os.path.basename(directory)}\n",
+                            "working...\n",
+                            0,
+                        ),
+                    )
+                    self.assertEqual(daemon.send(path, ["run", "bye", "--fail"])[2], 3)
+                    self.assertEqual(daemon.send(path, ["review"])[2], 2)
+
+                    # The cache is resolved against the client's working directory.
+                    os.mkdir("client")
+                    os.chdir("client")
+                    with mock.patch.dict(os.environ, {"AUTOBOT_CACHE_DIR": ""}):
+                        stdout, _, _ = daemon.send(path, ["run", "hi", "--cache-dir"])
+                    self.assertEqual(stdout, "hi from client\n.autobot_cache\n")
+                finally:
+                    os.chdir(cwd)
+            finally:
+                server.shutdown()
+                server.server_close()
+            self.assertFalse(os.path.exists(path))
+            # The daemon's own cache directory is restored after each request.
+            self.assertEqual(cache.CACHE_DIR, cache_dir)
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import unittest
+
+from autobot.edits import EditScriptError, apply_edit_script, make_edit_script
+
+BEFORE = """class Foo(Bar, object):
+    def __init__(self, x: int) -> None:
+        self.x = x
+
+    def bar(self) -> int:
+        return 1
+"""
+
+AFTER = """@dataclass
+class Foo(Bar):
+    def __init__(self, x: int) -> None:
+        self.x = x
+        self.y = x
+
+    def bar(self) -> int:
+        return 2
+"""
+
+
+class EditScriptTest(unittest.TestCase):
+    def test_round_trip(self) -> None:
+        script = make_edit_script(BEFORE, AFTER)
+        self.assertEqual(
+            script.splitlines(),
+            [
+                "1: @dataclass",
+                "1+: class Foo(Bar):",
+                "3+:         self.y = x",
+                "6:         return 2",
+            ],
+        )
+        self.assertEqual(apply_edit_script(BEFORE, script), AFTER)
+
+    def test_delete(self) -> None:
+        self.assertEqual(
+            apply_edit_script(BEFORE, "4-\n5-\n6-"),
+            "class Foo(Bar, object):\n"
+            "    def __init__(self, x: int) -> None:\n"
+            "        self.x = x\n",
+        )
+
+    def test_invalid(self) -> None:
+        for script in ("7: pass", "1: a\n1: b", "class Foo:"):
+            with self.subTest(script=script), self.assertRaises(EditScriptError):
+                apply_edit_script(BEFORE, script)
+
+
+if __name__ == "__main__":
+    unittest.main()
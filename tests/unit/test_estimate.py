@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from autobot import prompt
+from autobot.models import get_model
+from autobot.refactor.estimate import estimate_refactor
+from autobot.schematic import load_schematics
+from autobot.tokens import count_tokens
+from autobot.utils import cache
+
+SNIPPETS = [
+    "class Foo(object):\n    x = 1",
+    "class Bar(object):\n    def f(self):\n        return 2",
+]
+
+
+class EstimateTest(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for name, path in (
+            ("CACHE_DIR", os.path.join(directory.name, "cache")),
+            ("METADATA_DIR", os.path.join(directory.name, "cache", "metadata")),
+            ("LEASE_DIR", os.path.join(directory.name, "cache", "leases")),
+        ):
+            patcher = mock.patch.object(cache, name, path)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.target = os.path.join(directory.name, "example.py")
+        with open(self.target, "w") as fp:
+            fp.write("\n\n\n".join(SNIPPETS) + "\n")
+
+    def test_escalation(self) -> None:
+        (schematic,) = load_schematics("useless_object_inheritance")
+        estimate = estimate_refactor(
+            schematics=[schematic],
+            targets=[self.target],
+            nthreads=1,
+            model="text-davinci-002",
+            max_snippet_len=1000,
+            escalation=("text-curie-001",),
+        )
+
+        def tokens(model: str) -> int:
+            encoding = get_model(model).encoding
+            total = 0
+            for snippet in SNIPPETS:
+                p = prompt.make_prompt(
+                    snippet,
+                    transform_type=schematic.transform_type,
+                    before_text=schematic.before_text,
+                    after_text=schematic.after_text,
+                    before_description=schematic.before_description,
+                    after_description=schematic.after_description,
+                    model=model,
+                )
+                self.assertEqual(
+                    p.prompt_tokens, count_tokens(p.text, encoding=encoding)
+                )
+                total += p.prompt_tokens + count_tokens(snippet, encoding=encoding)
+            return total
+
+        self.assertEqual(estimate.num_snippets, 2)
+        self.assertEqual(estimate.num_uncached, 2)
+        self.assertEqual(
+            estimate.prompt_tokens + estimate.completion_tokens,
+            tokens("text-davinci-002"),
+        )
+        self.assertAlmostEqual(estimate.cost, tokens("text-davinci-002") / 1000 * 0.02)
+        # The escalation models are priced separately, as a worst case.
+        self.assertEqual(estimate.escalation, ("text-curie-001",))
+        self.assertAlmostEqual(
+            estimate.escalation_cost, tokens("text-curie-001") / 1000 * 0.002
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
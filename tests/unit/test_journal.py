@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import os
+import tempfile
+import unittest
+
+from autobot.refactor.journal import Journal, JournalError
+from autobot.snippet import Snippet
+from autobot.transforms import NodeSelection, TransformType
+
+
+class JournalTest(unittest.TestCase):
+    def test_resume(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "journal.jsonl")
+            target = os.path.join(directory, "example.py")
+            with open(target, "w") as fp:
+                fp.write("class Foo(object):\n    pass\n")
+            stat = os.stat(target)
+            snippet = Snippet("class Foo(object):\n    pass\n", "", 1)
+
+            journal = Journal.create(path, config={"model": "a"}, targets=[target])
+            journal.record_snippets(
+                target,
+                signature=(stat.st_mtime_ns, stat.st_size),
+                transform_type=TransformType.CLASS,
+                selection=NodeSelection.ALL,
+                max_snippet_len=100,
+                snippets=(snippet,),
+                omitted=frozenset(),
+            )
+            journal.record_completion("s", snippet.text, "class Foo:\n    pass\n")
+            journal.record_node(target, snippet, patched=True)
+            journal.close()
+
+            # Simulate a run that was killed mid-write.
+            with open(path, "a") as fp:
+                fp.write('{"event": "comple')
+
+            with self.assertRaises(JournalError):
+                Journal.resume(path, config={"model": "b"})
+
+            journal = Journal.resume(path, config={"model": "a"})
+            self.assertEqual(journal.targets, [target])
+            self.assertEqual(
+                journal.get_snippets(
+                    target,
+                    signature=(stat.st_mtime_ns, stat.st_size),
+                    transform_type=TransformType.CLASS,
+                    selection=NodeSelection.ALL,
+                    max_snippet_len=100,
+                ),
+                ((snippet,), frozenset()),
+            )
+            self.assertEqual(
+                journal.get_completion("s", snippet.text), "class Foo:\n    pass\n"
+            )
+            self.assertTrue(journal.is_done(target, snippet))
+            journal.close()
+
+            # Once the file changes, its snippets are no longer considered done.
+            with open(target, "w") as fp:
+                fp.write("class Foo(object):\n    x = 1\n")
+            journal = Journal.resume(path, config={"model": "a"})
+            self.assertFalse(journal.is_done(target, snippet))
+            self.assertEqual(
+                journal.get_completion("s", snippet.text), "class Foo:\n    pass\n"
+            )
+
+            # Once the run finishes, there's nothing left to resume.
+            journal.finish()
+            journal.close()
+            self.assertFalse(os.path.exists(path))
+            with self.assertRaises(JournalError):
+                Journal.resume(path, config={"model": "a"})
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from autobot import api
+from autobot.library import Result, aiter_refactor, iter_refactor, refactor
+from autobot.utils import cache
+from benchmarks.server import ServerConfig, start_server
+
+SCHEMATIC = "useless_object_inheritance"
+
+SOURCE = "".join(
+    f"class Foo{i}({'object' if i % 2 == 0 else 'Base'}):\n    x = {i}\n\n\n"
+    for i in range(8)
+)
+
+
+class LibraryTest(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.target = os.path.join(directory.name, "example.py")
+        with open(self.target, "w") as fp:
+            fp.write(SOURCE)
+
+        self.cache_dir = os.path.join(directory.name, ".autobot_cache")
+        for name, path in (
+            ("CACHE_DIR", self.cache_dir),
+            ("METADATA_DIR", os.path.join(self.cache_dir, "metadata")),
+            ("LEASE_DIR", os.path.join(self.cache_dir, "leases")),
+        ):
+            patcher = mock.patch.object(cache, name, path)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.server = start_server(ServerConfig(latency=0.05))
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        api.init(
+            api_base=self.server.base_url,
+            api_key="test",
+            organization="test",
+            pool_size=2,
+        )
+        self.addCleanup(api.close)
+
+    def _check(self, results: list[Result]) -> None:
+        self.assertEqual(len(results), 8)
+        for result in results:
+            self.assertEqual(result.filename, self.target)
+            self.assertEqual(result.changed, "(object)" in result.before)
+            self.assertNotIn("(object)", result.after)
+            self.assertEqual(result.end_lineno, result.lineno + 1)
+
+    def test_refactor(self) -> None:
+        results = refactor(SCHEMATIC, self.target, nthreads=2)
+        self._check(results)
+        self.assertEqual([result.lineno for result in results], list(range(1, 33, 4)))
+        self.assertEqual(self.server.num_requests, 8)
+        self.assertTrue(all(not result.cached for result in results))
+        # Nothing is written to disk by default.
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_cache(self) -> None:
+        self._check(refactor(SCHEMATIC, self.target, nthreads=2, cache=True))
+        self.assertTrue(os.path.isdir(self.cache_dir))
+        results = refactor(SCHEMATIC, self.target, nthreads=2, cache=True)
+        self._check(results)
+        self.assertTrue(all(result.cached for result in results))
+        self.assertEqual(self.server.num_requests, 8)
+
+    def test_close(self) -> None:
+        results = iter_refactor(SCHEMATIC, self.target, nthreads=1)
+        next(results)
+        results.close()
+        # No further prompts are issued (beyond any that were already in flight).
+        time.sleep(0.2)
+        self.assertLess(self.server.num_requests, 8)
+
+    def test_aiter_refactor(self) -> None:
+        async def collect() -> list[Result]:
+            return [
+                result
+                async for result in aiter_refactor(SCHEMATIC, self.target, nthreads=2)
+            ]
+
+        results = asyncio.run(collect())
+        self._check(results)
+        # The results match those of the synchronous API (other than their timings).
+        self.assertEqual(
+            [
+                result._replace(seconds=0)
+                for result in sorted(results, key=lambda result: result.lineno)
+            ],
+            [
+                result._replace(seconds=0)
+                for result in refactor(SCHEMATIC, self.target, nthreads=2)
+            ],
+        )
+
+    def test_aiter_refactor_abandoned(self) -> None:
+        async def first() -> Result:
+            async for result in aiter_refactor(SCHEMATIC, self.target, nthreads=1):
+                return result
+            raise AssertionError("No results")
+
+        asyncio.run(first())
+        time.sleep(0.3)
+        self.assertLess(self.server.num_requests, 8)
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import unittest
+
+from autobot.utils.metrics import Registry
+
+
+class RegistryTest(unittest.TestCase):
+    def test_counters(self) -> None:
+        registry = Registry()
+        registry.increment("reads_total", result="hit")
+        registry.increment("reads_total", result="hit")
+        registry.increment("reads_total", result="miss")
+
+        self.assertEqual(registry.value("reads_total"), 3)
+        self.assertEqual(registry.value("reads_total", result="hit"), 2)
+        self.assertEqual(registry.value("writes_total"), 0)
+
+    def test_to_prometheus(self) -> None:
+        registry = Registry()
+        registry.increment("requests_total", model="text-davinci-002")
+        registry.observe("latency_seconds", 0.3)
+        registry.observe("latency_seconds", 20)
+
+        self.assertEqual(
+            registry.to_prometheus().splitlines(),
+            [
+                "# TYPE requests_total counter",
+                'requests_total{model="text-davinci-002"} 1',
+                "# TYPE latency_seconds histogram",
+                'latency_seconds_bucket{le="0.001"} 0',
+                'latency_seconds_bucket{le="0.005"} 0',
+                'latency_seconds_bucket{le="0.01"} 0',
+                'latency_seconds_bucket{le="0.05"} 0',
+                'latency_seconds_bucket{le="0.1"} 0',
+                'latency_seconds_bucket{le="0.25"} 0',
+                'latency_seconds_bucket{le="0.5"} 1',
+                'latency_seconds_bucket{le="1"} 1',
+                'latency_seconds_bucket{le="2.5"} 1',
+                'latency_seconds_bucket{le="5"} 1',
+                'latency_seconds_bucket{le="10"} 1',
+                'latency_seconds_bucket{le="30"} 2',
+                'latency_seconds_bucket{le="60"} 2',
+                'latency_seconds_bucket{le="+Inf"} 2',
+                "latency_seconds_sum 20.3",
+                "latency_seconds_count 2",
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import unittest
+
+from autobot import prompt
+from autobot.transforms import TransformType
+
+
+class PackedPromptTest(unittest.TestCase):
+    def test_parse_packed(self) -> None:
+        completion = """class A:
+    pass
+### Python class 2 of 3 without object inheritance
+class B:
+    pass
+
+### Python class 3 of 3
+class C(Base):
+    pass
+"""
+        self.assertEqual(
+            prompt.parse_packed(
+                completion, transform_type=TransformType.CLASS, count=3
+            ),
+            [
+                "class A:\n    pass\n",
+                "class B:\n    pass\n\n",
+                "class C(Base):\n    pass\n",
+            ],
+        )
+
+    def test_parse_packed__missing(self) -> None:
+        completion = """class A:
+    pass
+### Python class 3 of 3
+class C(Base):
+    pass
+"""
+        self.assertIsNone(
+            prompt.parse_packed(completion, transform_type=TransformType.CLASS, count=3)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
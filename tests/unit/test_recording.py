@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import gzip
+import os
+import tempfile
+import unittest
+
+from autobot.utils.recording import (
+    Exchange,
+    Recorder,
+    Replayer,
+    ReplayError,
+    read_archive,
+)
+
+
+def _exchange(key: str, text: str) -> Exchange:
+    return Exchange(
+        key=key,
+        request={"prompt": key, "max_tokens": 16},
+        response={"choices": [{"text": text, "finish_reason": "stop"}]},
+        latency=0.5,
+        cached=False,
+    )
+
+
+class RecordingTest(unittest.TestCase):
+    def test_round_trip(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "run.jsonl.gz")
+            recorder = Recorder(path)
+            recorder.record(_exchange("a", "first"))
+            recorder.record(_exchange("b", "second"))
+            recorder.record(_exchange("a", "third"))
+            recorder.close()
+
+            self.assertEqual(len(read_archive(path)), 3)
+            replayer = Replayer(path)
+            self.assertEqual(replayer.replay("a")["choices"][0]["text"], "first")
+            self.assertEqual(replayer.replay("b")["choices"][0]["text"], "second")
+            with self.assertRaises(ReplayError):
+                replayer.replay("c")
+
+    def test_truncated_archive(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "run.jsonl.gz")
+            recorder = Recorder(path)
+            recorder.record(_exchange("a", "first"))
+            recorder.close()
+
+            # Simulate an interrupted run, which left a partial entry.
+            with gzip.open(path, "at", encoding="utf-8") as fp:
+                fp.write('{"key": "b", "requ')
+
+            self.assertEqual([exchange.key for exchange in read_archive(path)], ["a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import random
+import threading
+import unittest
+from multiprocessing.pool import ThreadPool
+from unittest import mock
+
+from autobot import prompt
+from autobot.refactor.refactor import (
+    Batch,
+    Task,
+    in_shard,
+    resolve_batches,
+    schedule,
+)
+from autobot.schematic import Schematic
+from autobot.transforms import TransformType
+
+SCHEMATIC = Schematic(
+    "useless_object_inheritance",
+    "class Foo(object):\n    pass\n",
+    "class Foo:\n    pass\n",
+    "",
+    "",
+    TransformType.CLASS,
+)
+
+
+def _batch(text: str, completion_tokens: int = 16) -> Batch:
+    batch_prompt = prompt.Prompt(
+        text=f"### Fix\n{text}",
+        max_tokens=2 * completion_tokens,
+        stop=None,
+        prompt_tokens=64,
+        completion_tokens=completion_tokens,
+    )
+    return Batch(
+        SCHEMATIC, (Task(SCHEMATIC.title, text),), batch_prompt, (batch_prompt,)
+    )
+
+
+def _texts(batches: list[Batch]) -> list[str]:
+    return [batch.tasks[0].text for batch in batches]
+
+
+class InShardTest(unittest.TestCase):
+    def test_partition(self) -> None:
+        texts = [f"def f{i}():\n    return {i}\n" for i in range(100)]
+        for count in (1, 2, 3, 7):
+            shards = [
+                {text for text in texts if in_shard(text, (index, count))}
+                for index in range(1, count + 1)
+            ]
+            # Every snippet belongs to exactly one shard.
+            self.assertEqual(sum(len(shard) for shard in shards), len(texts))
+            self.assertEqual(set().union(*shards), set(texts))
+            if count > 1:
+                self.assertTrue(all(shards))
+
+
+@mock.patch.object(prompt, "is_cached", return_value=False)
+class ScheduleTest(unittest.TestCase):
+    def test_longest_first(self, _: mock.Mock) -> None:
+        batches = [_batch("a", 8), _batch("b", 64), _batch("c", 32)]
+        cached, uncached = schedule(batches, model="m")
+        self.assertEqual(cached, [])
+        self.assertEqual(_texts(uncached), ["b", "c", "a"])
+
+    def test_rank(self, _: mock.Mock) -> None:
+        # Ties are broken by review order, and unranked snippets go last.
+        batches = [_batch("a"), _batch("b"), _batch("c"), _batch("d", 64)]
+        uncached = schedule(batches, model="m", text_to_rank={"c": 0, "a": 1})[1]
+        self.assertEqual(_texts(uncached), ["d", "c", "a", "b"])
+
+    def test_seed(self, _: mock.Mock) -> None:
+        batches = [_batch(str(i)) for i in range(20)]
+        first = schedule(batches, model="m", seed=1)[1]
+        shuffled = list(batches)
+        random.Random(0).shuffle(shuffled)
+        # The order is independent of the input order, for a given seed...
+        self.assertEqual(schedule(shuffled, model="m", seed=1)[1], first)
+        # ...but varies with the seed.
+        self.assertNotEqual(schedule(batches, model="m", seed=2)[1], first)
+
+    def test_cached(self, is_cached: mock.Mock) -> None:
+        is_cached.side_effect = lambda batch_prompt, **_: batch_prompt.text.startswith(
+            "### Fix\ncached"
+        )
+        batches = [
+            _batch("uncached-1", 8),
+            _batch("cached-1", 64),
+            _batch("uncached-2", 64),
+            _batch("cached-2", 8),
+        ]
+        cached, uncached = schedule(
+            batches, model="m", text_to_rank={"cached-2": 0, "cached-1": 1}
+        )
+        # Cached batches are ordered by rank alone, since they don't occupy a worker.
+        self.assertEqual(_texts(cached), ["cached-2", "cached-1"])
+        self.assertEqual(_texts(uncached), ["uncached-2", "uncached-1"])
+
+        # Cached batches are resolved inline, and uncached batches on the pool.
+        main = threading.get_ident()
+        with ThreadPool(processes=2) as pool:
+            resolved = list(
+                resolve_batches(
+                    pool,
+                    lambda batch: (batch.tasks[0].text, threading.get_ident()),
+                    batches,
+                    model="m",
+                )
+            )
+        self.assertEqual(
+            {text for text, ident in resolved if ident == main},
+            {"cached-1", "cached-2"},
+        )
+        self.assertEqual(
+            {text for text, ident in resolved if ident != main},
+            {"uncached-1", "uncached-2"},
+        )
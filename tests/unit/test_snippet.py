@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import ast
+import unittest
+
+from autobot.snippet import (
+    compress_snippet,
+    decompose_class,
+    find_enclosing_snippet,
+    iter_snippets,
+    restore_snippet,
+    stitch_class,
+)
+from autobot.transforms import NodeSelection
+
+SOURCE = '''@dataclass
+class Circle:
+    """A circle in an image."""
+
+    radius: int
+    center: Tuple[int, int]
+
+    @property
+    def area(self) -> float:
+        return math.pi * self.radius**2
+
+    def describe(self) -> str:
+        """Describe the circle."""
+        return f"Circle at {self.center}"
+
+    def __hash__(self) -> int: return hash(self.center)'''
+
+
+class DecomposeClassTest(unittest.TestCase):
+    def test_decompose(self) -> None:
+        decomposed = decompose_class(SOURCE)
+        assert decomposed is not None
+
+        self.assertEqual(
+            decomposed.header,
+            '''@dataclass
+class Circle:
+    """A circle in an image."""
+
+    radius: int
+    center: Tuple[int, int]
+
+    @property
+    def area(self) -> float:
+        ...
+
+    def describe(self) -> str:
+        ...
+
+    def __hash__(self) -> int: return hash(self.center)''',
+        )
+        self.assertEqual([part.name for part in decomposed.parts], ["area", "describe"])
+        self.assertEqual(
+            decomposed.parts[1].text,
+            '''@dataclass
+class Circle:
+    def describe(self) -> str:
+        """Describe the circle."""
+        return f"Circle at {self.center}"''',
+        )
+
+    def test_decompose__not_a_class(self) -> None:
+        self.assertIsNone(decompose_class("def f() -> None:\n    pass"))
+
+    def test_stitch__no_completions(self) -> None:
+        decomposed = decompose_class(SOURCE)
+        assert decomposed is not None
+
+        self.assertEqual(stitch_class(decomposed, {}), SOURCE)
+
+    def test_stitch(self) -> None:
+        decomposed = decompose_class(SOURCE)
+        assert decomposed is not None
+
+        completions = {
+            # Sort the attributes and methods.
+            decomposed.header: '''@dataclass
+class Circle:
+    """A circle in an image."""
+
+    center: Tuple[int, int]
+    radius: int
+
+    def __hash__(self) -> int: return hash(self.center)
+
+    @property
+    def area(self) -> float:
+        ...
+
+    def describe(self) -> str:
+        ...''',
+            # Rewrite a method.
+            decomposed.parts[1].text: '''@dataclass
+class Circle:
+  def describe(self) -> str:
+    """Describe the circle."""
+    return "Circle at " + str(self.center)''',
+        }
+
+        self.assertEqual(
+            stitch_class(decomposed, completions),
+            '''@dataclass
+class Circle:
+    """A circle in an image."""
+
+    center: Tuple[int, int]
+    radius: int
+
+    def __hash__(self) -> int: return hash(self.center)
+
+    @property
+    def area(self) -> float:
+        return math.pi * self.radius**2
+
+    def describe(self) -> str:
+      """Describe the circle."""
+      return "Circle at " + str(self.center)''',
+        )
+
+
+class CompressSnippetTest(unittest.TestCase):
+    def test_round_trip(self) -> None:
+        text = '''def area(self) -> float:
+    """Return the area of the circle, in square pixels.
+
+    The radius is measured from the center.
+    """
+    # Use the exact value of pi, rather than an approximation.
+    return math.pi * self.radius**2  # pi r^2'''
+        compressed = compress_snippet(text)
+        assert compressed is not None
+        self.assertEqual(
+            compressed.text,
+            '''def area(self) -> float:
+    """<docstring 1>"""
+    # <comment 2>
+    return math.pi * self.radius**2  # pi r^2''',
+        )
+
+        fix = compressed.text.replace("float", "int")
+        self.assertEqual(restore_snippet(fix, compressed), text.replace("float", "int"))
+
+        # Fixes that drop (or duplicate) a placeholder are rejected.
+        self.assertIsNone(
+            restore_snippet(
+                compressed.text.replace("    # <comment 2>\n", ""), compressed
+            )
+        )
+
+    def test_uncompressible(self) -> None:
+        self.assertIsNone(compress_snippet("def f(x):\n    return x  # short"))
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+NESTED = """def outer():
+    def inner():
+        return 1
+
+    return inner
+
+
+def other():
+    return 2
+"""
+
+
+class IterSnippetsTest(unittest.TestCase):
+    def _names(
+        self, selection: NodeSelection, max_snippet_len: int = 1000
+    ) -> list[str]:
+        return [
+            snippet.text.splitlines()[0]
+            for snippet in iter_snippets(
+                NESTED,
+                ast.FunctionDef,
+                selection=selection,
+                max_snippet_len=max_snippet_len,
+            )
+        ]
+
+    def test_selection(self) -> None:
+        self.assertEqual(
+            self._names(NodeSelection.ALL),
+            ["def outer():", "def other():", "def inner():"],
+        )
+        self.assertEqual(
+            self._names(NodeSelection.OUTERMOST), ["def outer():", "def other():"]
+        )
+        self.assertEqual(
+            self._names(NodeSelection.INNERMOST), ["def inner():", "def other():"]
+        )
+        self.assertEqual(
+            self._names(NodeSelection.SMART), ["def outer():", "def other():"]
+        )
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(
+                self._names(NodeSelection.SMART, max_snippet_len=40),
+                ["def inner():", "def other():"],
+            )
+
+    def test_dropped_lines(self) -> None:
+        with self.assertLogs(level="WARNING") as logs:
+            self._names(NodeSelection.SMART, max_snippet_len=40)
+        self.assertEqual(
+            logs.output,
+            [
+                "WARNING:root:Selecting the nested nodes of snippet at line 1 drops "
+                "2 of its lines"
+            ],
+        )
+
+    def test_smart_decomposes_class(self) -> None:
+        source = (
+            "class Outer:\n"
+            "    x = 1\n"
+            "\n"
+            "    class Inner:\n"
+            "        y = 2\n"
+            "\n"
+            "    def method(self):\n"
+            "        return [self.x for _ in range(10)] + [self.x for _ in range(10)]\n"
+        )
+
+        def first_lines(max_snippet_len: int) -> list[str]:
+            return [
+                snippet.text.splitlines()[0]
+                for snippet in iter_snippets(
+                    source,
+                    ast.ClassDef,
+                    selection=NodeSelection.SMART,
+                    max_snippet_len=max_snippet_len,
+                )
+            ]
+
+        # An oversized class is kept whole if its header fits, such that its own
+        # lines are still covered (by way of decomposition).
+        self.assertEqual(first_lines(100), ["class Outer:"])
+        # Otherwise, its nested classes are selected instead.
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(first_lines(30), ["class Inner:"])
+
+
+class FindEnclosingSnippetTest(unittest.TestCase):
+    def _name(self, lineno: int) -> str | None:
+        snippet = find_enclosing_snippet(NESTED, ast.FunctionDef, lineno)
+        return snippet.text.splitlines()[0] if snippet is not None else None
+
+    def test_find(self) -> None:
+        self.assertEqual(self._name(1), "def outer():")
+        self.assertEqual(self._name(3), "def inner():")
+        self.assertEqual(self._name(5), "def outer():")
+        self.assertEqual(self._name(7), None)
+        self.assertEqual(self._name(9), "def other():")
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import ast
+import unittest
+from unittest import mock
+
+from autobot.streaming import Cancellation, RewriteMonitor
+
+ORIGINAL = """def foo(
+    x: int,
+) -> int:
+    # A comment.
+    return x
+"""
+
+
+class RewriteMonitorTest(unittest.TestCase):
+    def _stream(self, text: str) -> Cancellation | None:
+        monitor = RewriteMonitor(ORIGINAL)
+        for i in range(len(text)):
+            if (cancellation := monitor(text[: i + 1])) is not None:
+                return cancellation
+        return None
+
+    def test_completed(self) -> None:
+        self.assertIsNone(self._stream(ORIGINAL))
+        self.assertIsNone(self._stream(ORIGINAL.replace("int", "float")))
+
+    def test_unchanged(self) -> None:
+        self.assertEqual(
+            self._stream(ORIGINAL + "\n### Python function\n" + ORIGINAL),
+            Cancellation(ORIGINAL, "unchanged"),
+        )
+
+    def test_stop_mismatch(self) -> None:
+        rewrite = ORIGINAL.replace("int", "float")
+        self.assertEqual(
+            self._stream(rewrite + "### Python function\n"),
+            Cancellation(rewrite, "stop_mismatch"),
+        )
+
+    def test_collapse(self) -> None:
+        rewrite = ORIGINAL.replace("int", "float")
+        self.assertEqual(
+            self._stream(rewrite + "foo(1)\n"),
+            Cancellation(rewrite + "foo(1)\n", "collapse"),
+        )
+
+    def test_leading_blank_line(self) -> None:
+        self.assertIsNone(self._stream("\n" + ORIGINAL.replace("int", "float")))
+        self.assertIsNone(self._stream("\ndef f():\n    return 2\n"))
+        self.assertEqual(
+            self._stream("\n" + ORIGINAL + "\n### Python function\n" + ORIGINAL),
+            Cancellation("\n" + ORIGINAL, "unchanged"),
+        )
+
+    def test_multiline_string(self) -> None:
+        rewrite = (
+            'def f():\n    x = """\nfoo(1)\n### Python function\n"""\n    return x\n'
+        )
+        self.assertIsNone(self._stream(rewrite))
+        self.assertEqual(
+            self._stream(rewrite + "foo(1)\n"),
+            Cancellation(rewrite + "foo(1)\n", "collapse"),
+        )
+
+    def test_parses_once(self) -> None:
+        rewrite = (
+            "@decorator\n"
+            "def f(\n"
+            "    x: int,\n"
+            ") -> int:\n"
+            '    x = """\n' + "line\n" * 100 + '"""\n'
+            "    return x\n"
+        )
+        with mock.patch.object(ast, "parse", wraps=ast.parse) as parse:
+            self.assertEqual(
+                self._stream(rewrite + "foo(1)\n"),
+                Cancellation(rewrite + "foo(1)\n", "collapse"),
+            )
+        # N.B. Once for the decorated signature, and once for the complete rewrite.
+        self.assertEqual(parse.call_count, 2)
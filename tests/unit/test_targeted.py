@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import os
+import tempfile
+import unittest
+from typing import Any
+from unittest import mock
+
+from autobot.refactor import targeted
+from autobot.refactor.targeted import TargetedFix, refactor_at
+from autobot.schematic import Schematic
+from autobot.transforms import TransformType
+
+SOURCE = """class Foo(object):
+    def bar(self):
+        return 1
+
+    def baz(self):
+        return 2
+"""
+
+
+def _schematic(title: str, transform_type: TransformType) -> Schematic:
+    return Schematic(title, "", "", "", "", transform_type)
+
+
+def _fix(text: str) -> str:
+    if text.startswith("class"):
+        # Add a docstring, shifting the methods down by a line.
+        header, rest = text.split("\n", 1)
+        return f'{header.replace("(object)", "")}\n    """A class."""\n{rest}'
+    return text.replace("return", "return -")
+
+
+class RefactorAtTest(unittest.TestCase):
+    def test_line_shift(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            target = os.path.join(directory, "example.py")
+            with open(target, "w") as fp:
+                fp.write(SOURCE)
+
+            def fix_batch(batch: str, **kwargs: Any) -> list[tuple[None, str]]:
+                return [(None, _fix(batch))]
+
+            with (
+                mock.patch.object(
+                    targeted, "make_batches", lambda texts, **kwargs: texts
+                ),
+                mock.patch.object(targeted, "_fix_batch", fix_batch),
+            ):
+                result = refactor_at(
+                    schematics=[
+                        _schematic("class", TransformType.CLASS),
+                        _schematic("function", TransformType.FUNCTION),
+                    ],
+                    target=target,
+                    lineno=5,
+                    model="text-davinci-002",
+                    max_snippet_len=1000,
+                )
+
+        # The second schematic is applied to the method under the original line, and
+        # every fix refers to a line of the original text.
+        self.assertEqual(
+            result.fixes[1],
+            TargetedFix(
+                "function",
+                5,
+                "def baz(self):\n    return 2",
+                "def baz(self):\n    return - 2",
+            ),
+        )
+        self.assertEqual(result.fixes[0].lineno, 1)
+        self.assertIn("+        return - 2\n", result.diff)
+        self.assertNotIn("return - 1", result.diff)
+
+    def test_map_line(self) -> None:
+        before = ["a", "b", "c", "d"]
+        after = ["a", "x", "y", "b", "d"]
+        self.assertEqual(
+            [targeted._map_line(lineno, 2, before, after) for lineno in range(1, 8)],
+            # N.B. A deleted line maps to the line that follows it.
+            [1, 2, 5, 6, 6, 7, 8],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import unittest
+
+from autobot.tokens import P50K_BASE, R50K_BASE, count_tokens
+
+
+class CountTokensTest(unittest.TestCase):
+    def test_count_tokens(self) -> None:
+        self.assertEqual(count_tokens(""), 0)
+        self.assertEqual(count_tokens("def"), 1)
+        self.assertEqual(count_tokens("x = 1"), 3)
+        self.assertEqual(count_tokens("getAttribute"), 2)
+
+    def test_count_tokens__indentation(self) -> None:
+        text = "if x:\n            return 1"
+        self.assertLess(
+            count_tokens(text, encoding=P50K_BASE),
+            count_tokens(text, encoding=R50K_BASE),
+        )
+
+    def test_count_tokens__unknown_encoding(self) -> None:
+        with self.assertRaises(ValueError):
+            count_tokens("x", encoding="cl100k_base")
+
+
+if __name__ == "__main__":
+    unittest.main()
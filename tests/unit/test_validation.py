@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import unittest
+
+from autobot.validation import validate_fix
+
+BEFORE = """class Foo(Bar, object):
+    def bar(self) -> int:
+        return 1
+"""
+
+
+class ValidateFixTest(unittest.TestCase):
+    def test_valid(self) -> None:
+        self.assertIsNone(validate_fix(BEFORE, BEFORE))
+        self.assertIsNone(
+            validate_fix(BEFORE, BEFORE.replace("(Bar, object)", "(Bar)"))
+        )
+
+    def test_invalid(self) -> None:
+        truncated = validate_fix(BEFORE, BEFORE[:-10])
+        assert truncated is not None
+        self.assertEqual(truncated.reason, "syntax")
+
+        renamed = validate_fix(BEFORE, BEFORE.replace("Foo", "Baz"))
+        assert renamed is not None
+        self.assertEqual(renamed.reason, "structure")
+
+        split = validate_fix(BEFORE, BEFORE + "\nx = 1\n")
+        assert split is not None
+        self.assertEqual(split.reason, "syntax")
+
+        # An invalid original (e.g., an earlier fix, when chaining) fails, too.
+        original = validate_fix("def f(self):", "def f(self):\n    pass\n")
+        assert original is not None
+        self.assertEqual(original.reason, "syntax")
+
+    def test_check(self) -> None:
+        def check(before: str, after: str) -> str | None:
+            return "Still inherits from object" if "object" in after else None
+
+        after = BEFORE.replace("return 1", "return 2")
+        failure = validate_fix(BEFORE, after, check=check)
+        assert failure is not None
+        self.assertEqual(failure.reason, "check")
+        self.assertIsNone(
+            validate_fix(BEFORE, after.replace(", object", ""), check=check)
+        )
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import unittest
+
+from autobot.utils.watcher import InotifyWatcher, PollingWatcher
+
+
+class PollingWatcherTest(unittest.TestCase):
+    def test_wait(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            unchanged = os.path.join(directory, "unchanged.py")
+            changed = os.path.join(directory, "changed.py")
+            for filename in (unchanged, changed):
+                with open(filename, "w") as fp:
+                    fp.write("x = 1\n")
+
+            watcher = PollingWatcher([directory], interval=0.01)
+            with open(changed, "w") as fp:
+                fp.write("x = 10\n")
+            added = os.path.join(directory, "added.py")
+            with open(added, "w") as fp:
+                fp.write("x = 1\n")
+            with open(os.path.join(directory, "notes.txt"), "w") as fp:
+                fp.write("...\n")
+            self.assertEqual(watcher.wait(), {changed, added})
+
+            os.remove(unchanged)
+            self.assertEqual(watcher.wait(), {unchanged})
+
+
+@unittest.skipUnless(sys.platform.startswith("linux"), "Linux only")
+class InotifyWatcherTest(unittest.TestCase):
+    def test_wait(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            unchanged = os.path.join(directory, "unchanged.py")
+            changed = os.path.join(directory, "changed.py")
+            for filename in (unchanged, changed):
+                with open(filename, "w") as fp:
+                    fp.write("x = 1\n")
+
+            watcher = InotifyWatcher([directory])
+            try:
+                with open(changed, "w") as fp:
+                    fp.write("x = 10\n")
+                with open(os.path.join(directory, "notes.txt"), "w") as fp:
+                    fp.write("...\n")
+                self.assertEqual(watcher.wait(), {changed})
+
+                # Files in new subdirectories are picked up, too.
+                subdirectory = os.path.join(directory, "package")
+                os.mkdir(subdirectory)
+                added = os.path.join(subdirectory, "added.py")
+                with open(added, "w") as fp:
+                    fp.write("x = 1\n")
+                self.assertEqual(watcher.wait(), {added})
+
+                os.remove(unchanged)
+                self.assertEqual(watcher.wait(), {unchanged})
+            finally:
+                watcher.close()